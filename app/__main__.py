@@ -0,0 +1,138 @@
+import argparse
+import json
+import sys
+from .server import add_serve_arguments
+
+
+def _openapi(args: argparse.Namespace) -> int:
+	from .main import app
+	schema = app.openapi()
+	with open(args.output, "w") as f:
+		json.dump(schema, f, separators=(",", ":"))
+	print(f"Wrote OpenAPI schema to {args.output}")
+	return 0
+
+
+def _serve(args: argparse.Namespace) -> int:
+	from .server import serve
+	return serve(args)
+
+
+def _policy(args: argparse.Namespace) -> int:
+	from .db import SessionLocal
+	from .permissions import grant_permission, revoke_permission, PolicyStore
+	with SessionLocal() as db:
+		if args.action == "grant":
+			version = grant_permission(db, args.role, args.permission)
+			print(f"Granted {args.permission} to {args.role} (policy version {version})")
+		elif args.action == "revoke":
+			version = revoke_permission(db, args.role, args.permission)
+			print(f"Revoked {args.permission} from {args.role} (policy version {version})")
+		else:
+			policy = PolicyStore().load(db)
+			print(f"Policy version {policy.version}")
+			for role, mask in sorted(policy.role_masks.items()):
+				names = [name for name, bit in sorted(policy.bits.items(), key=lambda item: item[1]) if mask >> bit & 1]
+				print(f"  {role}: {', '.join(names)}")
+	return 0
+
+
+def _build_breach_index(args: argparse.Namespace) -> int:
+	from .breached import build_index
+	source = sys.stdin if args.input == "-" else open(args.input, "r")
+	with source:
+		count = build_index(source, args.output, args.record_size, args.chunk_records, args.min_count)
+	print(f"Wrote {count} hashes to {args.output}")
+	return 0
+
+
+def _calibrate_hash(args: argparse.Namespace) -> int:
+	from .calibrate import calibrate_argon2, calibrate_bcrypt
+	from .config import PASSWORD_SCHEME, ARGON2_MEMORY_KIB, ARGON2_PARALLELISM
+	target = args.target_ms / 1000
+	scheme = args.scheme or PASSWORD_SCHEME
+	if scheme == "argon2":
+		memory_kib = args.memory_kib or ARGON2_MEMORY_KIB
+		parallelism = args.parallelism or ARGON2_PARALLELISM
+		cost, measurements = calibrate_argon2(target, memory_kib, parallelism, args.samples)
+		settings = {
+			"IAM_PASSWORD_SCHEME": "argon2",
+			"IAM_ARGON2_TIME_COST": cost,
+			"IAM_ARGON2_MEMORY_KIB": memory_kib,
+			"IAM_ARGON2_PARALLELISM": parallelism,
+		}
+	else:
+		cost, measurements = calibrate_bcrypt(target, args.samples)
+		settings = {"IAM_PASSWORD_SCHEME": "bcrypt", "IAM_BCRYPT_ROUNDS": cost}
+	# Measurements go to stderr so stdout can be used as an env file.
+	for measured_cost, seconds in measurements:
+		print(f"{scheme} cost={measured_cost}: {seconds * 1000:.1f}ms", file=sys.stderr)
+	if measurements[0][1] > target:
+		print(f"warning: the minimum cost takes {measurements[0][1] * 1000:.1f}ms, over the {args.target_ms}ms target", file=sys.stderr)
+	for name, value in settings.items():
+		print(f"{name}={value}")
+	return 0
+
+
+def _reshard(args: argparse.Namespace) -> int:
+	from .config import DB_SHARD_URL
+	from .db import create_db_engine, engine, shard_engines
+	from .reshard import reshard
+	shard_url = args.shard_url or DB_SHARD_URL
+	targets = [create_db_engine(shard_url.format(shard=shard)) for shard in range(args.shards)]
+	stats = reshard(engine, shard_engines, targets, args.batch_size)
+	print(f"Moved {stats['moved']} users; {stats['indexed']} directory entries")
+	print(f"IAM_DB_SHARDS={args.shards}")
+	return 0
+
+
+def main(argv=None) -> int:
+	parser = argparse.ArgumentParser(prog="python -m app", description="IAM Service")
+	subparsers = parser.add_subparsers(dest="command", required=True)
+
+	serve_parser = subparsers.add_parser("serve", help="Run the production server")
+	add_serve_arguments(serve_parser)
+	serve_parser.set_defaults(func=_serve)
+
+	policy_parser = subparsers.add_parser("policy", help="Show or change role permissions (workers pick up changes without a restart)")
+	policy_parser.add_argument("action", choices=["show", "grant", "revoke"])
+	policy_parser.add_argument("role", nargs="?")
+	policy_parser.add_argument("permission", nargs="?")
+	policy_parser.set_defaults(func=_policy)
+
+	openapi_parser = subparsers.add_parser("openapi", help="Pre-generate the OpenAPI schema (set IAM_OPENAPI_SCHEMA_FILE to serve it)")
+	openapi_parser.add_argument("output", help="Path of the JSON file to write")
+	openapi_parser.set_defaults(func=_openapi)
+
+	breach_parser = subparsers.add_parser("build-breach-index", help="Convert a SHA-1 password dump into the breached password index (IAM_BREACHED_PASSWORDS_FILE)")
+	breach_parser.add_argument("input", help="Dump with one SHA1HEX[:COUNT] per line, or - for stdin")
+	breach_parser.add_argument("output", help="Path of the index file to write")
+	breach_parser.add_argument("--record-size", type=int, default=8, help="Bytes of each hash to keep (default 8)")
+	breach_parser.add_argument("--chunk-records", type=int, default=5_000_000, help="Hashes sorted in memory at a time")
+	breach_parser.add_argument("--min-count", type=int, default=1, help="Skip hashes seen fewer times than this")
+	breach_parser.set_defaults(func=_build_breach_index)
+
+	calibrate_parser = subparsers.add_parser("calibrate-hash", help="Pick the password hashing cost that fits a latency budget on this machine")
+	calibrate_parser.add_argument("--target-ms", type=float, default=250, help="Latency budget of one hash (default 250)")
+	calibrate_parser.add_argument("--scheme", choices=["bcrypt", "argon2"], help="Hashing scheme (default: IAM_PASSWORD_SCHEME)")
+	calibrate_parser.add_argument("--memory-kib", type=int, help="argon2 memory cost in KiB (default: IAM_ARGON2_MEMORY_KIB)")
+	calibrate_parser.add_argument("--parallelism", type=int, help="argon2 lanes (default: IAM_ARGON2_PARALLELISM)")
+	calibrate_parser.add_argument("--samples", type=int, default=3, help="Hashes timed per cost")
+	calibrate_parser.set_defaults(func=_calibrate_hash)
+
+	reshard_parser = subparsers.add_parser("reshard", help="Move users to a new number of shards (stop the service first); IAM_DB_SHARDS is the current count")
+	reshard_parser.add_argument("--shards", type=int, required=True, help="New shard count (0 moves users back to the main DB)")
+	reshard_parser.add_argument("--shard-url", help="URL template of the new shards, with {shard} (default: IAM_DB_SHARD_URL)")
+	reshard_parser.add_argument("--batch-size", type=int, default=1000, help="Users read per query")
+	reshard_parser.set_defaults(func=_reshard)
+
+	args = parser.parse_args(argv)
+	if args.command == "reshard" and args.shards < 0:
+		parser.error("--shards must be 0 or more")
+	if args.command == "policy" and args.action != "show" and not (args.role and args.permission):
+		parser.error("grant and revoke require a role and a permission")
+	return args.func(args)
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -2,11 +2,12 @@ import time
 import logging
 import json
 import os
-from jose import jwt
-from typing import Callable
+from typing import Callable, Tuple
 from fastapi import Request
 from starlette.middleware.base import BaseHTTPMiddleware
 from .config import AUDIT_LOG_FILE
+from .tokens import decode_id, role_name
+from . import timing
 
 logging.basicConfig(
     filename=AUDIT_LOG_FILE,
@@ -15,24 +16,39 @@ logging.basicConfig(
 )
 logger = logging.getLogger("audit")
 
+def _id_text(value) -> str:
+	# Log ids as UUIDs whichever token profile carried them.
+	try:
+		return str(decode_id(value))
+	except (ValueError, TypeError, AttributeError):
+		return str(value)
+
+def peek_token_claims(auth: str) -> Tuple[str, str, str]:
+	"""Returns (user_id, jti, role) from an unverified bearer token, for logging only."""
+	user_id = jti = role = "<NA>"
+	if auth.lower().startswith("bearer "):
+		try:
+			from jose import jwt
+			token = auth.split(" ", 1)[1]
+			claims = jwt.get_unverified_claims(token)
+			user_id = _id_text(claims.get("sub", "<NA>"))
+			jti = _id_text(claims.get("jti", "<NA>"))
+			role = role_name(claims.get("role", "<NA>"))
+		except Exception:
+			pass
+	return user_id, jti, role
+
 class AuditMiddleware(BaseHTTPMiddleware):
 	async def dispatch(self, request: Request, call_next: Callable):
-		client_ip = client_port = req_id = user_id = jti = role = "<NA>"
+		client_ip = client_port = req_id = "<NA>"
 		if request.client:
 		    client_ip = request.client.host
 		    client_port = request.client.port
 
 		req_id = request.headers.get("X-Request-ID", "<NA>")
-		auth = request.headers.get("Authorization", "")
-		if auth.lower().startswith("bearer "):
-			try:
-				token = auth.split(" ", 1)[1]
-				claims = jwt.get_unverified_claims(token)
-				user_id = str(claims.get("sub", "<NA>"))
-				jti = str(claims.get("jti", "<NA>"))
-				role = str(claims.get("role", "<NA>"))
-			except Exception:
-				pass
+		user_id, jti, role = peek_token_claims(request.headers.get("Authorization", ""))
 		response = await call_next(request)
+		start = time.perf_counter()
 		logger.info(f"method={request.method} path={request.url.path} status={response.status_code} client_ip={client_ip} client_port={client_port} request_id={req_id} user_id={user_id} role={role} jti={jti}")
+		timing.record("audit", time.perf_counter() - start)
 		return response
\ No newline at end of file
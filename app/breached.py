@@ -0,0 +1,158 @@
+import hashlib
+import heapq
+import mmap
+import os
+import struct
+import tempfile
+from functools import lru_cache
+from typing import BinaryIO, Iterable, Iterator, List, Optional
+from .config import BREACHED_PASSWORDS_FILE
+
+# File layout (little-endian):
+#   header:  magic, record size, record count
+#   index:   65537 record offsets; records whose first two bytes are P live in [index[P], index[P + 1])
+#   records: sorted, de-duplicated SHA-1 digests truncated to `record size` bytes
+MAGIC = b"IAMBRCH1"
+HEADER = struct.Struct("<8sIQ")
+INDEX_ENTRIES = 65536 + 1
+INDEX_OFFSET = HEADER.size
+RECORDS_OFFSET = INDEX_OFFSET + INDEX_ENTRIES * 8
+DEFAULT_RECORD_SIZE = 8
+
+
+class BreachedPasswordIndex:
+	"""Membership test against a memory-mapped, sorted file of truncated SHA-1 hashes.
+
+	The two-byte prefix index narrows each lookup to ~1/65536th of the file before the
+	binary search, so a lookup touches a handful of pages regardless of file size, and
+	only those pages become resident.
+	"""
+
+	def __init__(self, path: str):
+		with open(path, "rb") as f:
+			self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		magic, self.record_size, self.count = HEADER.unpack_from(self._mm, 0)
+		if magic != MAGIC:
+			raise ValueError(f"{path} is not a breached password index")
+		if len(self._mm) != RECORDS_OFFSET + self.count * self.record_size:
+			raise ValueError(f"{path} is truncated or corrupt")
+
+	def contains_digest(self, digest: bytes) -> bool:
+		size = self.record_size
+		key = digest[:size]
+		lo, hi = struct.unpack_from("<QQ", self._mm, INDEX_OFFSET + (key[0] << 8 | key[1]) * 8)
+		mm = self._mm
+		while lo < hi:
+			mid = (lo + hi) >> 1
+			offset = RECORDS_OFFSET + mid * size
+			record = mm[offset:offset + size]
+			if record < key:
+				lo = mid + 1
+			elif record > key:
+				hi = mid
+			else:
+				return True
+		return False
+
+	def __contains__(self, password: str) -> bool:
+		return self.contains_digest(hashlib.sha1(password.encode("utf-8")).digest())
+
+	def close(self) -> None:
+		self._mm.close()
+
+
+@lru_cache(maxsize=None)
+def get_breached_index() -> Optional[BreachedPasswordIndex]:
+	"""The configured index, opened on first use. None when the check is disabled."""
+	if not BREACHED_PASSWORDS_FILE:
+		return None
+	return BreachedPasswordIndex(BREACHED_PASSWORDS_FILE)
+
+
+def is_breached(password: str) -> bool:
+	index = get_breached_index()
+	return index is not None and password in index
+
+
+def _parse_digests(lines: Iterable[str], record_size: int, min_count: int) -> Iterator[bytes]:
+	# Accepts the public dump format ("SHA1HEX:COUNT") as well as bare hex digests.
+	for line in lines:
+		line = line.strip()
+		if not line:
+			continue
+		digest, _, count = line.partition(":")
+		if count and min_count > 1 and int(count) < min_count:
+			continue
+		yield bytes.fromhex(digest[:40])[:record_size]
+
+
+def _read_run(f: BinaryIO, record_size: int) -> Iterator[bytes]:
+	while True:
+		chunk = f.read(record_size * 65536)
+		if not chunk:
+			return
+		for offset in range(0, len(chunk), record_size):
+			yield chunk[offset:offset + record_size]
+
+
+def build_index(source: Iterable[str], output_path: str, record_size: int = DEFAULT_RECORD_SIZE,
+		chunk_records: int = 5_000_000, min_count: int = 1) -> int:
+	"""Converts a SHA-1 dump into an index file. Returns the number of records written.
+
+	Input does not need to be sorted: chunks are sorted in memory and spilled to
+	temporary files, then merged, so memory use is bounded by `chunk_records`.
+	"""
+	if not 2 <= record_size <= 20:
+		raise ValueError("record size must be between 2 and 20 bytes")
+
+	with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output_path))) as tmp:
+		runs: List[str] = []
+		chunk: List[bytes] = []
+
+		def spill():
+			chunk.sort()
+			path = os.path.join(tmp, f"run-{len(runs)}")
+			with open(path, "wb") as f:
+				f.write(b"".join(chunk))
+			runs.append(path)
+			chunk.clear()
+
+		for digest in _parse_digests(source, record_size, min_count):
+			chunk.append(digest)
+			if len(chunk) >= chunk_records:
+				spill()
+		if chunk or not runs:
+			spill()
+
+		index = [0] * INDEX_ENTRIES
+		count = 0
+		tmp_output = output_path + ".tmp"
+		run_files = [open(path, "rb") for path in runs]
+		try:
+			with open(tmp_output, "wb") as out:
+				out.write(b"\0" * RECORDS_OFFSET)
+				previous = None
+				buffer = []
+				for record in heapq.merge(*(_read_run(f, record_size) for f in run_files)):
+					if record == previous:
+						continue
+					previous = record
+					index[(record[0] << 8 | record[1]) + 1] += 1
+					buffer.append(record)
+					count += 1
+					if len(buffer) >= 65536:
+						out.write(b"".join(buffer))
+						buffer.clear()
+				out.write(b"".join(buffer))
+
+				# Turn per-prefix counts into offsets.
+				for prefix in range(1, INDEX_ENTRIES):
+					index[prefix] += index[prefix - 1]
+				out.seek(0)
+				out.write(HEADER.pack(MAGIC, record_size, count))
+				out.write(struct.pack(f"<{INDEX_ENTRIES}Q", *index))
+		finally:
+			for f in run_files:
+				f.close()
+		os.replace(tmp_output, output_path)
+	return count
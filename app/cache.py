@@ -0,0 +1,89 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class _Call:
+	__slots__ = ("done", "result", "error")
+
+	def __init__(self):
+		self.done = threading.Event()
+		self.result = None
+		self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+	"""Concurrent calls with the same key share one execution.
+
+	The first caller (the leader) runs the function; callers arriving while it runs wait
+	for it and get its result or exception. Nothing is kept once the call returns, so
+	this only collapses bursts; pair it with a cache to absorb repeats.
+	"""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._calls: Dict[Hashable, _Call] = {}
+		self.shared = 0
+
+	def do(self, key: Hashable, func: Callable[..., Any], *args) -> Tuple[Any, bool]:
+		"""Returns (result, shared); shared is True when another caller's execution was reused."""
+		with self._lock:
+			call = self._calls.get(key)
+			leader = call is None
+			if leader:
+				call = self._calls[key] = _Call()
+			else:
+				self.shared += 1
+		if not leader:
+			call.done.wait()
+			if call.error is not None:
+				raise call.error
+			return call.result, True
+		try:
+			call.result = func(*args)
+		except BaseException as exc:
+			call.error = exc
+			raise
+		finally:
+			with self._lock:
+				del self._calls[key]
+			call.done.set()
+		return call.result, False
+
+
+class TTLCache:
+	"""Bounded map whose entries expire at a wall-clock time given on insert.
+
+	Lookups take no lock. When full, the oldest insert is evicted.
+	"""
+
+	def __init__(self, maxsize: int):
+		self.maxsize = maxsize
+		self._entries: Dict[Hashable, Tuple[Any, float]] = {}
+		self._lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+
+	def get(self, key: Hashable, now: Optional[float] = None) -> Any:
+		entry = self._entries.get(key)
+		if entry is not None and entry[1] > (time.time() if now is None else now):
+			self.hits += 1
+			return entry[0]
+		self.misses += 1
+		return None
+
+	def put(self, key: Hashable, value: Any, expires_at: float) -> None:
+		if self.maxsize <= 0:
+			return
+		with self._lock:
+			if key not in self._entries and len(self._entries) >= self.maxsize:
+				del self._entries[next(iter(self._entries))]
+			self._entries[key] = (value, expires_at)
+
+	def clear(self) -> None:
+		with self._lock:
+			self._entries.clear()
+		self.hits = self.misses = 0
+
+	def __len__(self) -> int:
+		return len(self._entries)
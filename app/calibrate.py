@@ -0,0 +1,60 @@
+import statistics
+import time
+from typing import List, Tuple
+
+# Costs below these are refused even when the latency budget asks for them.
+MIN_BCRYPT_ROUNDS = 10
+MAX_BCRYPT_ROUNDS = 20
+MIN_ARGON2_TIME_COST = 1
+MAX_ARGON2_TIME_COST = 32
+
+SAMPLE_PASSWORD = "xF0r456@~cwT"
+
+# (cost, median seconds per hash)
+Measurement = Tuple[int, float]
+
+
+def _median_hash_seconds(handler, samples: int) -> float:
+	durations = []
+	for _ in range(samples):
+		start = time.perf_counter()
+		handler.hash(SAMPLE_PASSWORD)
+		durations.append(time.perf_counter() - start)
+	return statistics.median(durations)
+
+
+def _largest_within(measure, costs: range, target_seconds: float) -> Tuple[int, List[Measurement]]:
+	# Costs are tried in increasing order and hash time grows with cost, so stop at the first one over budget.
+	measurements: List[Measurement] = []
+	chosen = costs.start
+	for cost in costs:
+		seconds = measure(cost)
+		measurements.append((cost, seconds))
+		if seconds > target_seconds:
+			break
+		chosen = cost
+	return chosen, measurements
+
+
+def calibrate_bcrypt(target_seconds: float, samples: int = 3) -> Tuple[int, List[Measurement]]:
+	"""Largest bcrypt rounds whose hash takes at most target_seconds (never below MIN_BCRYPT_ROUNDS)."""
+	from passlib.hash import bcrypt
+	bcrypt.get_backend()
+	return _largest_within(
+		lambda rounds: _median_hash_seconds(bcrypt.using(rounds=rounds), samples),
+		range(MIN_BCRYPT_ROUNDS, MAX_BCRYPT_ROUNDS + 1),
+		target_seconds,
+	)
+
+
+def calibrate_argon2(target_seconds: float, memory_kib: int, parallelism: int, samples: int = 3) -> Tuple[int, List[Measurement]]:
+	"""Largest argon2id time cost at the given memory and parallelism whose hash takes at most target_seconds."""
+	from passlib.hash import argon2
+	argon2.get_backend()
+	return _largest_within(
+		lambda time_cost: _median_hash_seconds(
+			argon2.using(type="ID", memory_cost=memory_kib, parallelism=parallelism, rounds=time_cost), samples,
+		),
+		range(MIN_ARGON2_TIME_COST, MAX_ARGON2_TIME_COST + 1),
+		target_seconds,
+	)
@@ -1,3 +1,5 @@
+import os
+from functools import lru_cache
 from typing import Dict
 
 def _get_file_contents(path: str) -> str:
@@ -7,6 +9,92 @@ def _get_file_contents(path: str) -> str:
 AUDIT_LOG_FILE = "audit.log"
 # Database configuration
 DB_FILENAME = "iam.db"
+# Schema handling at startup:
+# - "create": always run create_all (default).
+# - "auto": skip create_all when the stored schema version is already current.
+# - "skip": never touch the schema (it is managed out of band).
+# Read when init_db runs, not at import: `python -m app serve` initialises the DB once, then
+# sets it to "skip" for the workers, including one running in the `serve` process itself.
+def db_init_mode() -> str:
+	return os.getenv("IAM_DB_INIT_MODE", "create")
+
+# Sharded user store: with DB_SHARDS > 0, `users` rows are spread over DB_SHARDS SQLite files
+# (DB_SHARD_URL with {shard} replaced by 0..N-1) by a hash of the user id, so their writes do not
+# share one file lock. The main DB keeps everything else, including an email -> shard directory.
+# Change the count only with the service stopped, using `python -m app reshard --shards N`.
+DB_SHARDS = int(os.getenv("IAM_DB_SHARDS", "0"))
+DB_SHARD_URL = os.getenv("IAM_DB_SHARD_URL", "sqlite:///./iam-shard-{shard}.db")
+
+# Warm keys, the bcrypt backend and the DB pool before a worker accepts traffic.
+# Enabled by `python -m app serve` unless --no-warmup is given. Read when the worker starts,
+# not at import: with --workers 1 the app runs in the `serve` process, which may have imported
+# this module before setting IAM_WARMUP.
+def warmup_on_startup() -> bool:
+	return os.getenv("IAM_WARMUP", "0") == "1"
+
+# OpenAPI schema pre-generated at build time (`python -m app openapi <file>`).
+# When set, the schema is loaded from this file instead of being generated on first request.
+OPENAPI_SCHEMA_FILE = os.getenv("IAM_OPENAPI_SCHEMA_FILE")
+
+# Rate limiting of credential endpoints, applied before the request body is parsed.
+# Limits are (tokens per second, burst size) token buckets.
+# The "sqlite" store shares buckets across workers; put its file on tmpfs.
+RATE_LIMIT_ENABLED = os.getenv("IAM_RATE_LIMIT", "1") == "1"
+RATE_LIMIT_STORE = os.getenv("IAM_RATE_LIMIT_STORE", "memory")
+RATE_LIMIT_SQLITE_PATH = os.getenv("IAM_RATE_LIMIT_SQLITE_PATH", "/dev/shm/iam-ratelimit.db")
+RATE_LIMIT_ROUTES = {("POST", "/login"), ("POST", "/users")}
+RATE_LIMIT_PER_IP = (5.0, 20)
+RATE_LIMIT_PER_EMAIL = (0.5, 10)
+RATE_LIMIT_MAX_PEEK_BYTES = 8192
+
+# Account lockout after repeated failed logins within a sliding window.
+# A locked account is rejected before the password is verified.
+# Counters live in memory and are written to LOCKOUT_STATE_FILE (if set) every LOCKOUT_PERSIST_INTERVAL_SECONDS.
+LOCKOUT_ENABLED = os.getenv("IAM_LOCKOUT", "1") == "1"
+LOCKOUT_WINDOW_SECONDS = int(os.getenv("IAM_LOCKOUT_WINDOW_SECONDS", "900"))
+LOCKOUT_THRESHOLD = int(os.getenv("IAM_LOCKOUT_THRESHOLD", "5"))
+LOCKOUT_DURATION_SECONDS = int(os.getenv("IAM_LOCKOUT_DURATION_SECONDS", "900"))
+LOCKOUT_STATE_FILE = os.getenv("IAM_LOCKOUT_STATE_FILE") or None
+LOCKOUT_PERSIST_INTERVAL_SECONDS = int(os.getenv("IAM_LOCKOUT_PERSIST_INTERVAL_SECONDS", "30"))
+
+# Prometheus metrics at /metrics. Each worker aggregates its own values. With several
+# workers, set METRICS_MULTIPROC_DIR so every worker's /metrics reports the sum of all workers.
+# Off by default: the endpoint is unauthenticated and shares the API's port, so only enable it
+# where that port is not reachable publicly (or /metrics is blocked at the proxy).
+METRICS_ENABLED = os.getenv("IAM_METRICS", "0") == "1"
+METRICS_MULTIPROC_DIR = os.getenv("IAM_METRICS_MULTIPROC_DIR") or None
+METRICS_FLUSH_INTERVAL_SECONDS = 5
+
+# Server-Timing response headers with per-stage durations. Off by default: stage
+# timings reveal which code paths ran (e.g. whether a password was verified).
+SERVER_TIMING_ENABLED = os.getenv("IAM_SERVER_TIMING", "0") == "1"
+
+# On-demand sampling profiler (POST /admin/profile, admin only). Nothing runs until a capture is requested.
+PROFILER_ENABLED = os.getenv("IAM_PROFILER", "0") == "1"
+PROFILER_OUTPUT_DIR = os.getenv("IAM_PROFILER_OUTPUT_DIR", "profiles")
+PROFILER_MAX_SECONDS = 60
+PROFILER_SAMPLE_INTERVAL_SECONDS = 0.005
+
+# Password hashing. New hashes use PASSWORD_SCHEME ("bcrypt", or "argon2" for argon2id, which needs
+# argon2-cffi). Stored hashes of the other scheme or another cost are rehashed after the next login.
+# Pick costs for the hardware with `python -m app calibrate-hash --target-ms 250`.
+PASSWORD_SCHEME = os.getenv("IAM_PASSWORD_SCHEME", "bcrypt")
+BCRYPT_ROUNDS = int(os.getenv("IAM_BCRYPT_ROUNDS", "12"))
+ARGON2_TIME_COST = int(os.getenv("IAM_ARGON2_TIME_COST", "3"))
+ARGON2_MEMORY_KIB = int(os.getenv("IAM_ARGON2_MEMORY_KIB", "65536"))
+ARGON2_PARALLELISM = int(os.getenv("IAM_ARGON2_PARALLELISM", "4"))
+
+# Registration rejects passwords found in this index of breached password hashes.
+# Build it from the public SHA-1 dump with `python -m app build-breach-index`. Unset disables the check.
+BREACHED_PASSWORDS_FILE = os.getenv("IAM_BREACHED_PASSWORDS_FILE") or None
+
+# Token verification for co-located services over a Unix domain socket (see app/verify_socket.py).
+# "{pid}" in the path is replaced by the worker pid; without it the first worker to bind serves it.
+VERIFY_SOCKET_PATH = os.getenv("IAM_VERIFY_SOCKET") or None
+VERIFY_SOCKET_MODE = int(os.getenv("IAM_VERIFY_SOCKET_MODE", "660"), 8)
+
+# Seconds between checks of the stored permission policy version.
+POLICY_REFRESH_SECONDS = int(os.getenv("IAM_POLICY_REFRESH_SECONDS", "30"))
 
 # JWT configuration
 JWT_ALGORITHM = "RS256"
@@ -15,8 +103,36 @@ JWT_ISSUER = "iam-service"
 JWT_AUDIENCE = (
 	"iam-service"
 )
-JWT_SIGNING_KEY = _get_file_contents("keys/sample/private.pem")
-JWT_VERIFICATION_KEYS: Dict[str, str] = { # Supports multiple verification keys to facilitate key rotation.
-	"current": _get_file_contents("keys/sample/public.pem"),
-	#"previous": _get_file_contents("keys/sample/public_previous.pem"),
+# Verified token claims are cached per worker, keyed by the token, for up to TOKEN_CACHE_SECONDS
+# and never past the token's expiry. Set IAM_TOKEN_CACHE_SIZE=0 to disable the cache.
+TOKEN_CACHE_SIZE = int(os.getenv("IAM_TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_SECONDS = int(os.getenv("IAM_TOKEN_CACHE_SECONDS", "60"))
+# Issue compact tokens (base64url ids, role codes, no nbf). Both profiles are always accepted,
+# so verifiers can be upgraded before issuers switch. See app/tokens.py.
+JWT_COMPACT_TOKENS = os.getenv("IAM_JWT_COMPACT", "0") == "1"
+def _parse_key_files(value: str) -> Dict[str, str]:
+	# "current=path/to/public.pem,previous=path/to/public_previous.pem"
+	return dict(item.split("=", 1) for item in value.split(",") if item)
+
+JWT_SIGNING_KEY_FILE = os.getenv("IAM_JWT_SIGNING_KEY_FILE", "keys/sample/private.pem")
+JWT_VERIFICATION_KEY_FILES: Dict[str, str] = _parse_key_files(os.getenv("IAM_JWT_VERIFICATION_KEY_FILES", "")) or { # Supports multiple verification keys to facilitate key rotation.
+	"current": "keys/sample/public.pem",
+	#"previous": "keys/sample/public_previous.pem",
 }
+
+# Keys are read on first use rather than at import, to keep worker start cheap.
+@lru_cache(maxsize=None)
+def get_signing_key() -> str:
+	return _get_file_contents(JWT_SIGNING_KEY_FILE)
+
+@lru_cache(maxsize=None)
+def get_verification_keys() -> Dict[str, str]:
+	return {key_id: _get_file_contents(path) for key_id, path in JWT_VERIFICATION_KEY_FILES.items()}
+
+def __getattr__(name: str):
+	# Backwards compatibility for code importing the key material directly.
+	if name == "JWT_SIGNING_KEY":
+		return get_signing_key()
+	if name == "JWT_VERIFICATION_KEYS":
+		return get_verification_keys()
+	raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
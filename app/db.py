@@ -1,25 +1,289 @@
+import functools
+import hashlib
 import os
-from typing import Generator
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
-from .config import DB_FILENAME
+import time
+import uuid
+from typing import Callable, Generator, Iterable, List, Optional, Sequence
+from fastapi import Depends
+from sqlalchemy import create_engine, event, inspect, Column, Integer, Table, select, delete
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+from sqlalchemy.ext.horizontal_shard import ShardedSession
+from sqlalchemy.orm import Mapper, ORMExecuteState, Session, sessionmaker, declarative_base
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter, BooleanClauseList, ColumnElement, Grouping
+from .config import DB_FILENAME, DB_SHARDS, DB_SHARD_URL, db_init_mode
 
 DATABASE_URL = os.getenv("DATABASE_URL") or f"sqlite:///./{DB_FILENAME}"
 
-engine = create_engine(
-	DATABASE_URL,
-	connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {},
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Bump whenever a model change requires create_all to run again.
+SCHEMA_VERSION = 3
+
+# Shard id of the main DB; user shards are numbered 0..N-1.
+PRIMARY = "primary"
+SHARDED_TABLE = "users"
+DIRECTORY_TABLE = "user_directory"
+
+def create_db_engine(url: str) -> Engine:
+	return create_engine(url, connect_args={"check_same_thread": False} if url.startswith("sqlite") else {})
+
+def shard_for(user_id: uuid.UUID, shards: int) -> int:
+	digest = hashlib.blake2b(user_id.bytes, digest_size=8).digest()
+	return int.from_bytes(digest, "big") % shards
+
+def _is_sharded(mapper: Optional[Mapper]) -> bool:
+	return mapper is not None and mapper.local_table.name == SHARDED_TABLE
+
+def _conjuncts(clause):
+	"""The terms of a WHERE clause that must all hold: the operands of top-level ANDs."""
+	if isinstance(clause, Grouping):
+		yield from _conjuncts(clause.element)
+	elif isinstance(clause, BooleanClauseList) and clause.operator is operators.and_:
+		for term in clause.clauses:
+			yield from _conjuncts(term)
+	else:
+		yield clause
+
+def _compared_values(statement, column, params: Optional[dict] = None) -> Optional[list]:
+	"""Values the statement's WHERE clause requires `column` to equal (`==` or `IN`), or None.
+
+	Bound values come from the statement, or from `params` for statements compiled with
+	placeholders (e.g. Session.get).
+	"""
+	whereclause = getattr(statement, "whereclause", None)
+	if whereclause is None:
+		return None
+	for term in _conjuncts(whereclause):
+		if not isinstance(term, BinaryExpression):
+			continue
+		left, right = term.left, term.right
+		if isinstance(left, BindParameter):
+			left, right = right, left
+		if not isinstance(right, BindParameter) or not isinstance(left, ColumnElement) or not left.shares_lineage(column):
+			continue
+		value = params[right.key] if params and right.key in params else right.effective_value
+		if term.operator is operators.eq:
+			return [value]
+		if term.operator is operators.in_op:
+			return list(value)
+	return None
+
+# Session.info key of the directory writes pending until the shard transaction commits.
+_DIRECTORY_CHANGES = "user_directory_changes"
+DIRECTORY_WRITE_ATTEMPTS = 3
+
+def _write_with_retries(bind: Engine, statement) -> None:
+	"""Runs one statement in its own transaction, retrying while the DB is locked."""
+	for attempt in range(1, DIRECTORY_WRITE_ATTEMPTS + 1):
+		try:
+			with bind.begin() as conn:
+				conn.execute(statement)
+			return
+		except OperationalError:
+			if attempt == DIRECTORY_WRITE_ATTEMPTS:
+				raise
+			time.sleep(0.05 * attempt)
+
+def sharded_sessionmaker(primary: Engine, shards: Sequence[Engine]) -> sessionmaker:
+	"""Sessions that route `users` rows to their shard and everything else to the main DB.
+
+	Queries on users go to one shard when they filter on the id (hashed) or the email (looked
+	up in the directory), and to every shard otherwise.
+
+	Directory entries are written after the shard transaction commits, each in its own short
+	transaction on the main DB, so user writes do not hold the main DB's lock. The directory's
+	primary key keeps emails unique across shards: if the entry cannot be written, the new user
+	row is deleted again and commit() raises. A failed removal leaves an entry pointing at no
+	user, which blocks the email until `reshard` rebuilds the directory. Email changes are not
+	tracked.
+	"""
+	count = len(shards)
+
+	def shard_chooser(mapper, instance, clause=None, **kw):
+		if not _is_sharded(mapper):
+			return PRIMARY
+		if instance is None or instance.id is None:
+			raise ValueError("A user must have an id before its shard can be chosen")
+		return shard_for(instance.id, count)
+
+	def identity_chooser(mapper, primary_key, **kw):
+		return [shard_for(primary_key[0], count)] if _is_sharded(mapper) else [PRIMARY]
+
+	def shard_of_email(email) -> int:
+		from .models import UserDirectory
+		with primary.connect() as conn:
+			shard = conn.execute(select(UserDirectory.shard).where(UserDirectory.email == email)).scalar()
+		# Unknown emails have no user anywhere: any single shard answers "not found".
+		return 0 if shard is None else shard
+
+	def execute_chooser(context: ORMExecuteState) -> Iterable:
+		mapper = context.bind_mapper
+		if not _is_sharded(mapper):
+			return [PRIMARY]
+		table = mapper.local_table
+		params = context.parameters if isinstance(context.parameters, dict) else None
+		ids = _compared_values(context.statement, table.c.id, params)
+		if ids is not None:
+			return sorted({shard_for(user_id if isinstance(user_id, uuid.UUID) else uuid.UUID(str(user_id)), count) for user_id in ids})
+		emails = _compared_values(context.statement, table.c.email, params)
+		if emails is not None:
+			return sorted({shard_of_email(email) for email in emails})
+		return range(count)
+
+	def collect_directory_changes(session, flush_context, instances):
+		changes = session.info.setdefault(_DIRECTORY_CHANGES, [])
+		for obj in list(session.new):
+			if _is_sharded(inspect(obj).mapper):
+				if obj.id is None:
+					obj.id = uuid.uuid4()
+				changes.append((True, obj.email, obj.id))
+		for obj in list(session.deleted):
+			if _is_sharded(inspect(obj).mapper):
+				changes.append((False, obj.email, obj.id))
+
+	def discard_directory_changes(session):
+		session.info.pop(_DIRECTORY_CHANGES, None)
+
+	def apply_directory_changes(session):
+		from .models import User, UserDirectory
+		for added, email, user_id in session.info.pop(_DIRECTORY_CHANGES, ()):
+			shard = shard_for(user_id, count)
+			if not added:
+				_write_with_retries(primary, delete(UserDirectory).where(UserDirectory.email == email, UserDirectory.user_id == user_id))
+				continue
+			try:
+				_write_with_retries(primary, UserDirectory.__table__.insert().values(email=email, user_id=user_id, shard=shard))
+			except SQLAlchemyError:
+				# E.g. the email was registered concurrently on another shard. Undo the insert
+				# so no user is left that cannot be found by email.
+				with shards[shard].begin() as conn:
+					conn.execute(delete(User.__table__).where(User.__table__.c.id == user_id))
+				raise
+
+	factory = sessionmaker(
+		class_=ShardedSession,
+		autocommit=False,
+		autoflush=False,
+		shards={PRIMARY: primary, **dict(enumerate(shards))},
+		shard_chooser=shard_chooser,
+		identity_chooser=identity_chooser,
+		execute_chooser=execute_chooser,
+	)
+	event.listen(factory, "before_flush", collect_directory_changes)
+	event.listen(factory, "after_commit", apply_directory_changes)
+	event.listen(factory, "after_rollback", discard_directory_changes)
+	return factory
+
+engine = create_db_engine(DATABASE_URL)
+shard_engines: List[Engine] = [create_db_engine(DB_SHARD_URL.format(shard=shard)) for shard in range(DB_SHARDS)]
+if shard_engines:
+	SessionLocal = sharded_sessionmaker(engine, shard_engines)
+else:
+	SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
-def init_db() -> None:
+schema_version_table = Table(
+	"schema_version",
+	Base.metadata,
+	Column("version", Integer, nullable=False),
+)
+
+def get_schema_version(bind=engine) -> Optional[int]:
+	try:
+		with bind.connect() as conn:
+			return conn.execute(select(schema_version_table.c.version)).scalar()
+	except SQLAlchemyError:
+		# The table does not exist yet.
+		return None
+
+def _stamp_schema_version(bind) -> None:
+	with bind.begin() as conn:
+		conn.execute(delete(schema_version_table))
+		conn.execute(schema_version_table.insert().values(version=SCHEMA_VERSION))
+
+def _create_tables(bind, tables: List[Table]) -> None:
+	# create_all checks for a table before creating it, so a worker initialising the same DB
+	# at the same moment can create it in between; that table is then done.
+	for table in tables:
+		try:
+			Base.metadata.create_all(bind=bind, tables=[table])
+		except OperationalError as exc:
+			if "already exists" not in str(exc.orig):
+				raise
+
+def create_shard_schema(shard: Engine) -> None:
+	from . import models  # noqa: F401
+	_create_tables(shard, [Base.metadata.tables[SHARDED_TABLE], schema_version_table])
+	_stamp_schema_version(shard)
+
+def init_db(mode: Optional[str] = None, bind=engine, shards: Optional[Sequence[Engine]] = None) -> None:
+	mode = db_init_mode() if mode is None else mode
+	shards = shard_engines if shards is None else shards
+	if mode == "skip":
+		return
+	if mode == "auto" and all(get_schema_version(b) == SCHEMA_VERSION for b in (bind, *shards)):
+		return
 	from . import models  # noqa: F401
-	Base.metadata.create_all(bind=engine)
+	from .permissions import seed_default_policy
+	# Users live either in the main DB or in the shards; the directory only exists with shards.
+	skipped = SHARDED_TABLE if shards else DIRECTORY_TABLE
+	_create_tables(bind, [table for name, table in Base.metadata.tables.items() if name != skipped])
+	for shard in shards:
+		create_shard_schema(shard)
+	with Session(bind) as db:
+		seed_default_policy(db)
+	_stamp_schema_version(bind)
+
+class LazySession:
+	"""Stands in for a Session that is only created when first used.
+
+	Requests rejected before the handler touches the DB (bad token, missing permission)
+	cost neither a Session nor a pool checkout. close() returns the connection; the
+	proxy stays usable and checks out a new connection if it is used again.
+	"""
+	__slots__ = ("session_factory", "_session")
+
+	def __init__(self, session_factory: Callable[[], Session]):
+		self.session_factory = session_factory
+		self._session: Optional[Session] = None
+
+	def __getattr__(self, name: str):
+		if self._session is None:
+			self._session = self.session_factory()
+		return getattr(self._session, name)
+
+	@property
+	def started(self) -> bool:
+		return self._session is not None
+
+	def close(self) -> None:
+		if self._session is not None:
+			self._session.close()
 
 def get_db() -> Generator:
-	db = SessionLocal()
+	db = LazySession(SessionLocal)
 	try:
 		yield db
 	finally:
-		db.close()
\ No newline at end of file
+		db.close()
+
+def get_session_factory(db: Session = Depends(get_db)) -> Callable[[], Session]:
+	"""Opens sessions on the request's database, for work that runs after the request's session
+	is closed, such as background tasks. Follows any override of get_db."""
+	if isinstance(db, LazySession):
+		return db.session_factory
+	return sessionmaker(bind=db.get_bind())
+
+def close_session_on_return(handler):
+	"""Closes the handler's `db` session as soon as it returns, before response serialization.
+
+	FastAPI only runs dependency teardown after the response model is serialized. Use this
+	on handlers whose result is fully loaded: detached objects cannot lazy-load attributes.
+	"""
+	@functools.wraps(handler)
+	def wrapper(*args, **kwargs):
+		try:
+			return handler(*args, **kwargs)
+		finally:
+			kwargs["db"].close()
+	return wrapper
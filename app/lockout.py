@@ -0,0 +1,151 @@
+import hashlib
+import os
+import struct
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from .config import (
+	LOCKOUT_ENABLED, LOCKOUT_WINDOW_SECONDS, LOCKOUT_THRESHOLD, LOCKOUT_DURATION_SECONDS,
+	LOCKOUT_STATE_FILE, LOCKOUT_PERSIST_INTERVAL_SECONDS,
+)
+
+# key, window index, failures in previous window, failures in current window, locked until, cleared at
+_RECORD = struct.Struct("<8sqIIdd")
+
+# (window index, previous count, current count, locked until, cleared at)
+Entry = Tuple[int, int, int, float, float]
+
+
+def _key(email: str) -> bytes:
+	# Emails are kept as short digests so the state is compact and holds no PII.
+	return hashlib.blake2b(email.encode(), digest_size=8).digest()
+
+
+class LoginLockout:
+	"""Per-account failed login tracking using sliding-window counters.
+
+	Each account costs one small tuple. The failure count over the last window is
+	estimated from the current and previous fixed windows, weighted by overlap.
+	"""
+
+	def __init__(
+		self,
+		window: float = LOCKOUT_WINDOW_SECONDS,
+		threshold: int = LOCKOUT_THRESHOLD,
+		duration: float = LOCKOUT_DURATION_SECONDS,
+		state_file: Optional[str] = LOCKOUT_STATE_FILE,
+		persist_interval: float = LOCKOUT_PERSIST_INTERVAL_SECONDS,
+	):
+		self.window = window
+		self.threshold = threshold
+		self.duration = duration
+		self.state_file = state_file
+		self.persist_interval = persist_interval
+		self._entries: Dict[bytes, Entry] = {}
+		self._lock = threading.Lock()
+		self._last_persist = time.time()
+		self._last_prune = self._last_persist
+		if state_file:
+			self._entries = self._read_state()
+
+	def locked_for(self, email: str, now: Optional[float] = None) -> float:
+		"""Seconds the account remains locked, or 0. A single dict lookup."""
+		entry = self._entries.get(_key(email))
+		if entry is None:
+			return 0.0
+		remaining = entry[3] - (time.time() if now is None else now)
+		return remaining if remaining > 0 else 0.0
+
+	def record_failure(self, email: str, now: Optional[float] = None) -> None:
+		now = time.time() if now is None else now
+		key = _key(email)
+		index = int(now // self.window)
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is None:
+				previous, current, locked_until, cleared_at = 0, 1, 0.0, 0.0
+			elif entry[0] < index - 1:
+				previous, current, locked_until, cleared_at = 0, 1, entry[3], entry[4]
+			elif entry[0] == index - 1:
+				previous, current, locked_until, cleared_at = entry[2], 1, entry[3], entry[4]
+			else:
+				previous, current, locked_until, cleared_at = entry[1], entry[2] + 1, entry[3], entry[4]
+			overlap = 1 - (now % self.window) / self.window
+			if previous * overlap + current >= self.threshold:
+				locked_until = now + self.duration
+			self._entries[key] = (index, previous, current, locked_until, cleared_at)
+		if self.state_file and now - self._last_persist >= self.persist_interval:
+			self.persist(now)
+		elif now - self._last_prune >= self.persist_interval:
+			self.prune(now)
+
+	def record_success(self, email: str, now: Optional[float] = None) -> None:
+		key = _key(email)
+		with self._lock:
+			if not self.state_file:
+				self._entries.pop(key, None)
+				return
+			# A tombstone rather than a removal, so the next merge does not bring back the
+			# failures still stored in the state file.
+			now = time.time() if now is None else now
+			self._entries[key] = (int(now // self.window), 0, 0, 0.0, now)
+
+	def persist(self, now: Optional[float] = None) -> None:
+		"""Write the state to the state file, merging entries written by other workers."""
+		if not self.state_file:
+			return
+		now = time.time() if now is None else now
+		self._last_persist = now
+		with self._lock:
+			merged = self._read_state()
+			for key, entry in self._entries.items():
+				other = merged.get(key)
+				merged[key] = entry if other is None else self._merge(entry, other)
+			self._entries = self._live(merged, now)
+			self._last_prune = now
+			tmp_path = f"{self.state_file}.{os.getpid()}.tmp"
+			with open(tmp_path, "wb") as f:
+				f.write(b"".join(_RECORD.pack(key, *entry) for key, entry in self._entries.items()))
+			os.replace(tmp_path, self.state_file)
+
+	def prune(self, now: Optional[float] = None) -> None:
+		"""Drop accounts with no failures in the current or previous window that are not locked.
+
+		Runs on every persist, and on its own every persist interval when there is no state
+		file, so failures for arbitrary emails cannot accumulate.
+		"""
+		now = time.time() if now is None else now
+		with self._lock:
+			self._entries = self._live(self._entries, now)
+			self._last_prune = now
+
+	def _live(self, entries: Dict[bytes, Entry], now: float) -> Dict[bytes, Entry]:
+		current_index = int(now // self.window)
+		return {key: entry for key, entry in entries.items() if entry[0] >= current_index - 1 or entry[3] > now}
+
+	@staticmethod
+	def _merge(a: Entry, b: Entry) -> Entry:
+		# Counts recorded before a successful login are discarded: the later clear wins.
+		if a[4] != b[4]:
+			return a if a[4] > b[4] else b
+		locked_until = max(a[3], b[3])
+		if a[0] != b[0]:
+			newer = a if a[0] > b[0] else b
+			return newer[:3] + (locked_until, a[4])
+		return (a[0], max(a[1], b[1]), max(a[2], b[2]), locked_until, a[4])
+
+	def _read_state(self) -> Dict[bytes, Entry]:
+		try:
+			with open(self.state_file, "rb") as f:
+				data = f.read()
+		except FileNotFoundError:
+			return {}
+		usable = len(data) - len(data) % _RECORD.size
+		return {key: tuple(entry) for key, *entry in _RECORD.iter_unpack(data[:usable])}
+
+	def reset(self) -> None:
+		with self._lock:
+			self._entries.clear()
+
+
+lockout = LoginLockout() if LOCKOUT_ENABLED else None
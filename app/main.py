@@ -1,17 +1,56 @@
+import asyncio
+import json
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
-from .db import init_db
-from .routers import users, auth
+from sqlalchemy.exc import SQLAlchemyError
+from .config import (
+	OPENAPI_SCHEMA_FILE, warmup_on_startup, METRICS_ENABLED, SERVER_TIMING_ENABLED, POLICY_REFRESH_SECONDS,
+	VERIFY_SOCKET_PATH,
+)
+from .db import init_db, get_schema_version, SessionLocal, SCHEMA_VERSION
+from .permissions import policy_store, refresh_periodically
+from .routers import users, auth, admin
 from .security import add_security_headers
 from .audit import AuditMiddleware
+from .ratelimit import RateLimitMiddleware, limiter
+from .lockout import lockout
+from . import metrics
+from .timing import ServerTimingMiddleware
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
 	# Startup
 	init_db()
+	if warmup_on_startup():
+		from .warmup import warmup
+		warmup()
+	if METRICS_ENABLED:
+		metrics.start_snapshot_thread()
+	with SessionLocal() as db:
+		try:
+			policy_store.load(db)
+		except SQLAlchemyError as exc:
+			# Typically IAM_DB_INIT_MODE=skip against a DB that predates the policy tables.
+			raise RuntimeError(
+				f"Cannot load the permission policy: the database schema is at version {get_schema_version(db.get_bind())}, "
+				f"this release needs version {SCHEMA_VERSION}. Run once with IAM_DB_INIT_MODE=auto to upgrade it."
+			) from exc
+	policy_refresh = asyncio.create_task(refresh_periodically(policy_store, SessionLocal, POLICY_REFRESH_SECONDS))
+	verify_server = None
+	if VERIFY_SOCKET_PATH:
+		from .verify_socket import VerifySocketServer
+		verify_server = VerifySocketServer(VERIFY_SOCKET_PATH)
+		await verify_server.start()
 	yield
-	# Shutdown (if needed)
+	# Shutdown
+	policy_refresh.cancel()
+	if verify_server is not None:
+		await verify_server.stop()
+	if lockout is not None:
+		lockout.persist()
+	if METRICS_ENABLED:
+		metrics.stop_snapshot_thread()
 
 app = FastAPI(
 	title="IAM Service",
@@ -31,6 +70,10 @@ app = FastAPI(
 	lifespan=lifespan
 )
 
+# Innermost, so rejected requests still get CORS and security headers and are audited.
+if limiter is not None:
+	app.add_middleware(RateLimitMiddleware, limiter=limiter)
+
 app.add_middleware(
 	CORSMiddleware,
 	allow_origins=["*"], # Allows all domains for dev. Limit to specific domains for production.
@@ -42,6 +85,18 @@ app.add_middleware(
 app.middleware("http")(add_security_headers)
 app.add_middleware(AuditMiddleware)
 
+# Query timings feed both the metrics and the Server-Timing db_<statement> stages.
+if METRICS_ENABLED or SERVER_TIMING_ENABLED:
+	metrics.instrument_engines()
+
+# Outside the audit middleware, so the audit write is included in the header.
+if SERVER_TIMING_ENABLED:
+	app.add_middleware(ServerTimingMiddleware)
+
+# Outermost, so the recorded latency covers every other middleware.
+if METRICS_ENABLED:
+	app.add_middleware(metrics.MetricsMiddleware)
+
 @app.get(
     "/healthz",
     tags=["Health"],
@@ -54,5 +109,20 @@ async def healthz():
 		"status": "ok"
 	}
 
+if METRICS_ENABLED:
+	@app.get("/metrics", include_in_schema=False)
+	async def prometheus_metrics():
+		return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
 app.include_router(auth.router, prefix="")
-app.include_router(users.router, prefix="")
\ No newline at end of file
+app.include_router(users.router, prefix="")
+app.include_router(admin.router, prefix="")
+
+def openapi():
+	# Serve the schema pre-generated at build time, if configured.
+	if app.openapi_schema is None and OPENAPI_SCHEMA_FILE:
+		with open(OPENAPI_SCHEMA_FILE, "r") as f:
+			app.openapi_schema = json.load(f)
+	return FastAPI.openapi(app)
+
+app.openapi = openapi
@@ -0,0 +1,329 @@
+import abc
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from .config import METRICS_MULTIPROC_DIR, METRICS_FLUSH_INTERVAL_SECONDS
+from . import timing
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+REGISTRY: List["_Metric"] = []
+
+
+class _Metric(abc.ABC):
+	"""Base for metrics whose values are sharded per thread.
+
+	Every thread writes only to its own shard, so updates need no lock and are never
+	lost. Shards are summed when the metric is collected.
+	"""
+	type = ""
+
+	def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+		self.name = name
+		self.documentation = documentation
+		self.labelnames = labelnames
+		self._local = threading.local()
+		self._shards: List[dict] = []
+		self._shards_lock = threading.Lock()
+		REGISTRY.append(self)
+
+	def _shard(self) -> dict:
+		shard = getattr(self._local, "shard", None)
+		if shard is None:
+			shard = self._local.shard = {}
+			with self._shards_lock:
+				self._shards.append(shard)
+		return shard
+
+	@abc.abstractmethod
+	def _merge(self, a, b):
+		"""Combines the values of one label set from two shards."""
+
+	def collect(self) -> Dict[tuple, object]:
+		merged: Dict[tuple, object] = {}
+		for shard in list(self._shards):
+			for labels, value in list(shard.items()):
+				merged[labels] = self._merge(merged[labels], value) if labels in merged else self._copy(value)
+		return merged
+
+	@staticmethod
+	def _copy(value):
+		return value
+
+	def reset(self) -> None:
+		for shard in list(self._shards):
+			shard.clear()
+
+
+class Counter(_Metric):
+	type = "counter"
+
+	def inc(self, *labels: str, amount: float = 1.0) -> None:
+		shard = self._shard()
+		shard[labels] = shard.get(labels, 0.0) + amount
+
+	def _merge(self, a, b):
+		return a + b
+
+
+class CallbackCounter(_Metric):
+	"""Counter whose values are read from a callback at collection time."""
+	type = "counter"
+
+	def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...], callback: Callable[[], Dict[tuple, float]]):
+		super().__init__(name, documentation, labelnames)
+		self.callback = callback
+
+	def collect(self) -> Dict[tuple, object]:
+		return dict(self.callback())
+
+	def _merge(self, a, b):
+		return a + b
+
+
+class _Timer:
+	__slots__ = ("histogram", "labels", "start")
+
+	def __init__(self, histogram: "Histogram", labels: Tuple[str, ...]):
+		self.histogram = histogram
+		self.labels = labels
+
+	def __enter__(self):
+		self.start = time.perf_counter()
+		return self
+
+	def __exit__(self, *exc_info):
+		elapsed = time.perf_counter() - self.start
+		self.histogram.observe(elapsed, *self.labels)
+		timing.record("_".join(self.labels) or self.histogram.name, elapsed)
+
+
+class Histogram(_Metric):
+	type = "histogram"
+
+	def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+		super().__init__(name, documentation, labelnames)
+		self.buckets = tuple(buckets)
+
+	def observe(self, value: float, *labels: str) -> None:
+		# Per-bucket (non-cumulative) counts, the +Inf bucket, then the sum.
+		shard = self._shard()
+		values = shard.get(labels)
+		if values is None:
+			values = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+		values[bisect.bisect_left(self.buckets, value)] += 1
+		values[-1] += value
+
+	def time(self, *labels: str) -> _Timer:
+		return _Timer(self, labels)
+
+	@staticmethod
+	def _copy(value):
+		return list(value)
+
+	def _merge(self, a, b):
+		return [x + y for x, y in zip(a, b)]
+
+
+def _escape(value: str) -> str:
+	return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+	pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+	return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+	return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render(values_by_metric: Optional[Dict[str, Dict[tuple, object]]] = None) -> str:
+	"""Render the registry in the Prometheus text exposition format."""
+	if values_by_metric is None:
+		values_by_metric = collect_all()
+	lines = []
+	for metric in REGISTRY:
+		lines.append(f"# HELP {metric.name} {metric.documentation}")
+		lines.append(f"# TYPE {metric.name} {metric.type}")
+		for labels, value in sorted(values_by_metric.get(metric.name, {}).items()):
+			if metric.type == "histogram":
+				cumulative = 0
+				for bound, count in zip(metric.buckets + (float("inf"),), value[:-1]):
+					cumulative += count
+					le = "+Inf" if bound == float("inf") else repr(bound)
+					lines.append(f"{metric.name}_bucket{_format_labels(metric.labelnames + ('le',), labels + (le,))} {cumulative}")
+				lines.append(f"{metric.name}_sum{_format_labels(metric.labelnames, labels)} {_format_value(value[-1])}")
+				lines.append(f"{metric.name}_count{_format_labels(metric.labelnames, labels)} {cumulative}")
+			else:
+				lines.append(f"{metric.name}{_format_labels(metric.labelnames, labels)} {_format_value(value)}")
+	return "\n".join(lines) + "\n"
+
+
+def collect_all() -> Dict[str, Dict[tuple, object]]:
+	"""Values of this worker, merged with the snapshots of other workers when a multiprocess dir is set."""
+	local = {metric.name: metric.collect() for metric in REGISTRY}
+	if not METRICS_MULTIPROC_DIR:
+		return local
+	own_file = _snapshot_path()
+	merged = local
+	metrics = {metric.name: metric for metric in REGISTRY}
+	# Snapshots are rewritten every flush interval; an older one is from a worker that is gone,
+	# even if its pid now belongs to another process.
+	stale_before = time.time() - 3 * METRICS_FLUSH_INTERVAL_SECONDS
+	for path in glob.glob(os.path.join(METRICS_MULTIPROC_DIR, "*.json")):
+		if path == own_file:
+			continue
+		try:
+			if not _is_alive(int(os.path.basename(path).split("-", 1)[0])) or os.path.getmtime(path) < stale_before:
+				continue
+			with open(path, "r") as f:
+				snapshot = json.load(f)
+		except (OSError, ValueError):
+			continue
+		for name, entries in snapshot.items():
+			metric = metrics.get(name)
+			if metric is None:
+				continue
+			target = merged.setdefault(name, {})
+			for labels, value in entries:
+				labels = tuple(labels)
+				target[labels] = metric._merge(target[labels], value) if labels in target else value
+	return merged
+
+
+def _is_alive(pid: int) -> bool:
+	try:
+		os.kill(pid, 0)
+	except ProcessLookupError:
+		return False
+	except PermissionError:
+		pass
+	return True
+
+
+_snapshot_name: Optional[str] = None
+_snapshot_stop = threading.Event()
+_snapshot_thread: Optional[threading.Thread] = None
+
+
+def _snapshot_path() -> str:
+	# Unique per process, so a worker that gets a previous worker's pid does not take over its file.
+	global _snapshot_name
+	pid = os.getpid()
+	if _snapshot_name is None or not _snapshot_name.startswith(f"{pid}-"):
+		_snapshot_name = f"{pid}-{uuid.uuid4().hex}.json"
+	return os.path.join(METRICS_MULTIPROC_DIR, _snapshot_name)
+
+
+def write_snapshot() -> None:
+	"""Write this worker's values where the other workers' /metrics can read them."""
+	snapshot = {metric.name: [[list(labels), value] for labels, value in metric.collect().items()] for metric in REGISTRY}
+	path = _snapshot_path()
+	with open(path + ".tmp", "w") as f:
+		json.dump(snapshot, f)
+	os.replace(path + ".tmp", path)
+
+
+def start_snapshot_thread() -> None:
+	global _snapshot_thread
+	if not METRICS_MULTIPROC_DIR:
+		return
+	os.makedirs(METRICS_MULTIPROC_DIR, exist_ok=True)
+	_snapshot_stop.clear()
+
+	def run():
+		while True:
+			write_snapshot()
+			if _snapshot_stop.wait(METRICS_FLUSH_INTERVAL_SECONDS):
+				return
+
+	_snapshot_thread = threading.Thread(target=run, name="metrics-snapshot", daemon=True)
+	_snapshot_thread.start()
+
+
+def stop_snapshot_thread() -> None:
+	"""Stop writing snapshots and remove this worker's, so its values are no longer summed."""
+	global _snapshot_thread
+	if _snapshot_thread is None:
+		return
+	_snapshot_stop.set()
+	_snapshot_thread.join()
+	_snapshot_thread = None
+	try:
+		os.remove(_snapshot_path())
+	except FileNotFoundError:
+		pass
+
+
+REQUEST_SECONDS = Histogram("iam_http_request_duration_seconds", "HTTP request latency by route and status.", ("method", "route", "status"))
+STAGE_SECONDS = Histogram("iam_stage_duration_seconds", "Latency of security operations.", ("stage",))
+DB_QUERY_SECONDS = Histogram("iam_db_query_duration_seconds", "Latency of database queries by statement type.", ("operation",))
+LOGINS = Counter("iam_logins_total", "Login attempts by result.", ("result",))
+PASSWORD_REHASHES = Counter("iam_password_rehashes_total", "Stored password hashes upgraded to the configured scheme or cost after login.")
+INVALID_TOKENS = Counter("iam_invalid_tokens_total", "Requests rejected because of an invalid access token.")
+FORBIDDEN = Counter("iam_forbidden_total", "Requests rejected by authorization checks (HTTP 403).")
+
+
+class MetricsMiddleware:
+	"""Records request latency by route template, method and status."""
+
+	def __init__(self, app: ASGIApp):
+		self.app = app
+		self._static_paths: Optional[set] = None
+
+	async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+		if scope["type"] != "http":
+			await self.app(scope, receive, send)
+			return
+
+		start = time.perf_counter()
+		status = "500"
+
+		async def send_wrapper(message: Message) -> None:
+			nonlocal status
+			if message["type"] == "http.response.start":
+				status = str(message["status"])
+			await send(message)
+
+		try:
+			await self.app(scope, receive, send_wrapper)
+		finally:
+			REQUEST_SECONDS.observe(time.perf_counter() - start, scope["method"], self._route(scope), status)
+
+	def _route(self, scope: Scope) -> str:
+		# Label by route template to keep label cardinality bounded.
+		route = scope.get("route")
+		if route is not None:
+			return route.path
+		if self._static_paths is None:
+			self._static_paths = {r.path for r in scope["app"].routes if "{" not in r.path}
+		return scope["path"] if scope["path"] in self._static_paths else "<unmatched>"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+	context._iam_query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+	start = getattr(context, "_iam_query_start", None)
+	if start is not None:
+		elapsed = time.perf_counter() - start
+		operation = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else "other"
+		DB_QUERY_SECONDS.observe(elapsed, operation)
+		timing.record("db_" + operation, elapsed)
+
+
+def instrument_engines() -> None:
+	"""Time every query of every engine."""
+	from sqlalchemy import event
+	from sqlalchemy.engine import Engine
+	if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+		event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+		event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
@@ -1,6 +1,6 @@
 import datetime as dt
 import uuid
-from sqlalchemy import Column, String, Date, DateTime, TypeDecorator
+from sqlalchemy import Column, String, Date, DateTime, Integer, ForeignKey, TypeDecorator
 from sqlalchemy.sql import func
 from .db import Base
 
@@ -31,4 +31,33 @@ class User(Base):
 	last_login_at = Column(DateTime(timezone=True), nullable=True)
 
 	def __repr__(self) -> str:
-		return f"<User id={self.id} email={self.email} role={self.role}>"
\ No newline at end of file
+		return f"<User id={self.id} email={self.email} role={self.role}>"
+
+class UserDirectory(Base):
+	"""Where each user lives when users are sharded (see app/db.py). Kept in the main DB."""
+	__tablename__ = "user_directory"
+
+	email = Column(String(255), primary_key=True)
+	user_id = Column(UUIDString(), nullable=False)
+	shard = Column(Integer, nullable=False)
+
+class Permission(Base):
+	__tablename__ = "permissions"
+
+	name = Column(String(100), primary_key=True)
+	# Position in the permission bitset carried by access tokens. Never reuse a bit.
+	bit = Column(Integer, unique=True, nullable=False)
+
+class RolePermission(Base):
+	__tablename__ = "role_permissions"
+
+	role = Column(String(50), primary_key=True)
+	permission = Column(String(100), ForeignKey("permissions.name"), primary_key=True)
+
+class PolicyVersion(Base):
+	"""Single row, bumped on every role/permission change so workers know to recompile."""
+	__tablename__ = "policy_version"
+
+	id = Column(Integer, primary_key=True, default=1)
+	version = Column(Integer, nullable=False)
+	updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
\ No newline at end of file
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+from typing import Callable, Dict, Iterable, List, Optional
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from .models import Permission, RolePermission, PolicyVersion
+
+logger = logging.getLogger("uvicorn.error")
+
+# Bit positions are part of the token format: add new permissions at new bits, never reuse one.
+PERMISSION_BITS: Dict[str, int] = {
+	"users:read:self": 0,
+	"users:read:any": 1,
+	"admin:profile": 2,
+}
+
+DEFAULT_ROLE_PERMISSIONS: Dict[str, List[str]] = {
+	"user": ["users:read:self"],
+	"admin": ["users:read:self", "users:read:any", "admin:profile"],
+}
+
+
+class Policy:
+	"""Role to permission mapping compiled into one integer bitset per role."""
+	__slots__ = ("version", "bits", "role_masks")
+
+	def __init__(self, version: int, bits: Dict[str, int], role_permissions: Dict[str, Iterable[str]]):
+		self.version = version
+		self.bits = bits
+		self.role_masks = {role: self.mask(*names) for role, names in role_permissions.items()}
+
+	def mask(self, *names: str) -> int:
+		mask = 0
+		for name in names:
+			mask |= 1 << self.bits[name]
+		return mask
+
+	def role_mask(self, role: str) -> int:
+		return self.role_masks.get(role, 0)
+
+
+DEFAULT_POLICY = Policy(0, PERMISSION_BITS, DEFAULT_ROLE_PERMISSIONS)
+
+
+class PolicyStore:
+	"""Holds the compiled policy of this worker. Permission checks never touch the DB."""
+
+	def __init__(self, policy: Policy = DEFAULT_POLICY):
+		self.policy = policy
+
+	def load(self, db: Session) -> Policy:
+		version = db.scalar(select(PolicyVersion.version))
+		if version is None:
+			# Policy tables not seeded: keep the built-in policy.
+			return self.policy
+		# Permissions added in code but not yet in the DB keep their built-in bit.
+		bits = {**PERMISSION_BITS, **{p.name: p.bit for p in db.scalars(select(Permission))}}
+		role_permissions: Dict[str, List[str]] = {}
+		for grant in db.scalars(select(RolePermission)):
+			role_permissions.setdefault(grant.role, []).append(grant.permission)
+		self.policy = Policy(version, bits, role_permissions)
+		return self.policy
+
+	def refresh(self, db: Session) -> bool:
+		"""Recompile when the stored policy version changed. Returns True if it did."""
+		version = db.scalar(select(PolicyVersion.version))
+		if version is None or version == self.policy.version:
+			return False
+		self.load(db)
+		return True
+
+	def token_claim(self, role: str) -> List[int]:
+		"""The compact `prm` claim: [policy version, permission bitset]."""
+		policy = self.policy
+		return [policy.version, policy.role_mask(role)]
+
+	def permissions_from_claim(self, claim: Optional[list], role: str) -> int:
+		policy = self.policy
+		if isinstance(claim, list) and len(claim) == 2 and claim[0] == policy.version and isinstance(claim[1], int):
+			return claim[1]
+		# Issued under another policy version (or before permissions existed):
+		# recompute from the role so policy changes apply to live tokens.
+		return policy.role_mask(role)
+
+
+def _insert_missing(db: Session, model, rows: List[dict]) -> None:
+	"""Inserts the rows whose primary key is not taken yet, without reading first, so
+	processes seeding the same DB concurrently do not collide."""
+	dialect = db.get_bind().dialect.name
+	if dialect == "sqlite":
+		from sqlalchemy.dialects.sqlite import insert
+	elif dialect == "postgresql":
+		from sqlalchemy.dialects.postgresql import insert
+	else:
+		for row in rows:
+			try:
+				with db.begin_nested():
+					db.execute(model.__table__.insert().values(**row))
+			except IntegrityError:
+				pass
+		return
+	db.execute(insert(model.__table__).on_conflict_do_nothing(), rows)
+
+
+def seed_default_policy(db: Session) -> None:
+	"""Stores the built-in policy in an unseeded DB. Safe to run from several workers at once;
+	an already seeded policy (including later grants and revocations) is left untouched."""
+	if db.scalar(select(PolicyVersion.version)) is not None:
+		return
+	db.rollback()
+	_insert_missing(db, Permission, [{"name": name, "bit": bit} for name, bit in PERMISSION_BITS.items()])
+	_insert_missing(db, RolePermission, [
+		{"role": role, "permission": name}
+		for role, names in DEFAULT_ROLE_PERMISSIONS.items() for name in names
+	])
+	_insert_missing(db, PolicyVersion, [{"id": 1, "version": 1}])
+	db.commit()
+
+
+def _bump_version(db: Session) -> int:
+	row = db.get(PolicyVersion, 1)
+	if row is None:
+		row = PolicyVersion(id=1, version=1)
+		db.add(row)
+	else:
+		row.version += 1
+	return row.version
+
+
+def grant_permission(db: Session, role: str, permission: str) -> int:
+	if db.get(Permission, permission) is None:
+		raise ValueError(f"Unknown permission: {permission}")
+	if db.get(RolePermission, (role, permission)) is None:
+		db.add(RolePermission(role=role, permission=permission))
+	version = _bump_version(db)
+	db.commit()
+	return version
+
+
+def revoke_permission(db: Session, role: str, permission: str) -> int:
+	grant = db.get(RolePermission, (role, permission))
+	if grant is not None:
+		db.delete(grant)
+	version = _bump_version(db)
+	db.commit()
+	return version
+
+
+async def refresh_periodically(store: "PolicyStore", session_factory: Callable[[], Session], interval: float) -> None:
+	"""Polls the policy version so role/permission changes apply without a redeploy."""
+	def refresh():
+		with session_factory() as db:
+			if store.refresh(db):
+				logger.info(f"loaded permission policy version {store.policy.version}")
+
+	while True:
+		await asyncio.sleep(interval)
+		try:
+			await asyncio.to_thread(refresh)
+		except Exception:
+			logger.exception("permission policy refresh failed")
+
+
+policy_store = PolicyStore()
@@ -0,0 +1,71 @@
+import os
+import sys
+import threading
+import time
+from typing import Dict, Optional
+from .config import PROFILER_OUTPUT_DIR, PROFILER_SAMPLE_INTERVAL_SECONDS
+
+
+class ProfilerBusy(Exception):
+	pass
+
+
+class SamplingProfiler:
+	"""Time-boxed sampling profiler for a live worker.
+
+	A background thread samples the stacks of all other threads and writes them in
+	the collapsed format understood by flamegraph.pl, speedscope and similar tools.
+	Nothing runs between captures.
+	"""
+
+	def __init__(self, output_dir: str = PROFILER_OUTPUT_DIR, interval: float = PROFILER_SAMPLE_INTERVAL_SECONDS):
+		self.output_dir = output_dir
+		self.interval = interval
+		self._thread: Optional[threading.Thread] = None
+		self._lock = threading.Lock()
+
+	@property
+	def running(self) -> bool:
+		return self._thread is not None and self._thread.is_alive()
+
+	def start(self, seconds: float) -> str:
+		"""Start a capture in the background and return the path it will be written to."""
+		with self._lock:
+			if self.running:
+				raise ProfilerBusy()
+			os.makedirs(self.output_dir, exist_ok=True)
+			path = os.path.join(self.output_dir, f"profile-{os.getpid()}-{int(time.time())}.folded")
+			self._thread = threading.Thread(target=self._run, args=(seconds, path), name="sampling-profiler", daemon=True)
+			self._thread.start()
+			return path
+
+	def _run(self, seconds: float, path: str) -> None:
+		stacks = self.sample(seconds)
+		tmp_path = path + ".tmp"
+		with open(tmp_path, "w") as f:
+			for stack, count in sorted(stacks.items()):
+				f.write(f"{stack} {count}\n")
+		os.replace(tmp_path, path)
+
+	def sample(self, seconds: float) -> Dict[str, int]:
+		own_ident = threading.get_ident()
+		stacks: Dict[str, int] = {}
+		deadline = time.monotonic() + seconds
+		while time.monotonic() < deadline:
+			thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+			for ident, frame in sys._current_frames().items():
+				if ident == own_ident:
+					continue
+				frames = []
+				while frame is not None:
+					code = frame.f_code
+					frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+					frame = frame.f_back
+				frames.append(thread_names.get(ident, str(ident)))
+				stack = ";".join(reversed(frames))
+				stacks[stack] = stacks.get(stack, 0) + 1
+			time.sleep(self.interval)
+		return stacks
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,267 @@
+import heapq
+import json
+import math
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from .config import (
+	RATE_LIMIT_ENABLED, RATE_LIMIT_STORE, RATE_LIMIT_SQLITE_PATH, RATE_LIMIT_ROUTES,
+	RATE_LIMIT_PER_IP, RATE_LIMIT_PER_EMAIL, RATE_LIMIT_MAX_PEEK_BYTES,
+)
+from .metrics import CallbackCounter
+
+# (tokens per second, burst size)
+Limit = Tuple[float, float]
+
+
+class BucketStoreError(Exception):
+	"""The bucket store could not be read or updated (e.g. the SQLite file stayed locked)."""
+
+
+class MemoryBucketStore:
+	"""Token buckets held in this worker's memory."""
+
+	MAX_BUCKETS = 100_000
+	# Checks are a dict lookup, cheap enough to run on the event loop.
+	blocking = False
+
+	def __init__(self):
+		# key -> [tokens, updated, rate, burst]
+		self._buckets: Dict[str, list] = {}
+
+	def take(self, key: str, limit: Limit, now: float) -> float:
+		"""Take one token. Returns 0 if allowed, otherwise seconds until a token is available."""
+		rate, burst = limit
+		bucket = self._buckets.get(key)
+		if bucket is None:
+			if len(self._buckets) >= self.MAX_BUCKETS:
+				self._evict(now)
+			self._buckets[key] = [burst - 1, now, rate, burst]
+			return 0.0
+		tokens = min(burst, bucket[0] + max(0.0, now - bucket[1]) * rate)
+		bucket[1] = now
+		if tokens >= 1:
+			bucket[0] = tokens - 1
+			return 0.0
+		bucket[0] = tokens
+		return (1 - tokens) / rate
+
+	def _evict(self, now: float) -> None:
+		# Buckets that have refilled carry no state and all go. If that frees too little, the
+		# fullest buckets go next: a bucket a client has drained is kept, so spraying new keys
+		# (e.g. random emails) cannot reset the limit of a key under attack.
+		deficits = {
+			key: burst - min(burst, tokens + max(0.0, now - updated) * rate)
+			for key, (tokens, updated, rate, burst) in self._buckets.items()
+		}
+		evicted = [key for key, deficit in deficits.items() if deficit <= 0]
+		if len(evicted) < self.MAX_BUCKETS // 10:
+			evicted += heapq.nsmallest(self.MAX_BUCKETS // 10 - len(evicted), (key for key, deficit in deficits.items() if deficit > 0), key=deficits.__getitem__)
+		for key in evicted:
+			del self._buckets[key]
+
+	def clear(self) -> None:
+		self._buckets.clear()
+
+
+class SQLiteBucketStore:
+	"""Token buckets in a SQLite file shared by all workers on the host.
+
+	Place the file on tmpfs (e.g. /dev/shm) to keep checks in the tens of microseconds.
+	Checks can wait on another worker's lock, so the middleware runs them in the threadpool.
+	Times are wall-clock seconds, since the file can outlive the processes (and the boot)
+	that wrote it.
+	"""
+
+	blocking = True
+	# Seconds between deletions of refilled buckets, which carry no state.
+	PRUNE_INTERVAL = 60.0
+
+	def __init__(self, path: str, timeout: float = 1.0):
+		self.path = path
+		self.timeout = timeout
+		self._local = threading.local()
+		self._last_prune = 0.0
+		with self._connect() as conn:
+			columns = {row[1] for row in conn.execute("PRAGMA table_info(buckets)")}
+			if columns and "full_at" not in columns:
+				# Buckets are transient: a table written by an older release is rebuilt.
+				conn.execute("DROP TABLE buckets")
+			conn.execute(
+				"CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, full_at REAL NOT NULL) WITHOUT ROWID"
+			)
+
+	def _connect(self) -> sqlite3.Connection:
+		conn = getattr(self._local, "conn", None)
+		if conn is None:
+			conn = sqlite3.connect(self.path, isolation_level=None, timeout=self.timeout)
+			conn.execute("PRAGMA journal_mode=WAL")
+			conn.execute("PRAGMA synchronous=OFF")
+			self._local.conn = conn
+		return conn
+
+	def take(self, key: str, limit: Limit, now: float) -> float:
+		rate, burst = limit
+		conn = self._connect()
+		try:
+			conn.execute("BEGIN IMMEDIATE")
+			row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+			# A clock stepped back refills nothing rather than draining the bucket.
+			tokens = burst if row is None else min(burst, row[0] + max(0.0, now - row[1]) * rate)
+			wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+			if not wait:
+				tokens -= 1
+			conn.execute(
+				"INSERT OR REPLACE INTO buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)",
+				(key, tokens, now, now + (burst - tokens) / rate),
+			)
+			conn.execute("COMMIT")
+			if now - self._last_prune >= self.PRUNE_INTERVAL:
+				self.prune(now)
+		except BaseException as exc:
+			if conn.in_transaction:
+				conn.execute("ROLLBACK")
+			if isinstance(exc, sqlite3.OperationalError):
+				# "database is locked" past the busy timeout, or an unusable file.
+				raise BucketStoreError(str(exc)) from exc
+			raise
+		return wait
+
+	def prune(self, now: float) -> None:
+		"""Delete the buckets that have refilled by `now`. Each worker runs this every PRUNE_INTERVAL."""
+		self._last_prune = now
+		self._connect().execute("DELETE FROM buckets WHERE full_at <= ?", (now,))
+
+	def clear(self) -> None:
+		self._connect().execute("DELETE FROM buckets")
+
+
+class RateLimiter:
+	def __init__(self, store, per_ip: Limit = RATE_LIMIT_PER_IP, per_email: Limit = RATE_LIMIT_PER_EMAIL):
+		self.store = store
+		self.per_ip = per_ip
+		self.per_email = per_email
+		self.counters = {"allowed": 0, "limited_ip": 0, "limited_email": 0, "store_error": 0}
+
+	def _take(self, key: str, limit: Limit) -> float:
+		try:
+			return self.store.take(key, limit, time.time())
+		except BucketStoreError:
+			# Fail open: the limiter only sheds load, and the account lockout still bounds
+			# password guessing. Errors are counted so a stuck store is visible.
+			self.counters["store_error"] += 1
+			return 0.0
+
+	def check_ip(self, client_ip: str) -> float:
+		wait = self._take("ip:" + client_ip, self.per_ip)
+		self.counters["limited_ip" if wait else "allowed"] += 1
+		return wait
+
+	def check_email(self, email: str) -> float:
+		wait = self._take("email:" + email, self.per_email)
+		if wait:
+			self.counters["limited_email"] += 1
+		return wait
+
+	def reset(self) -> None:
+		self.store.clear()
+		for name in self.counters:
+			self.counters[name] = 0
+
+
+def _normalized_email(body: bytes) -> Optional[str]:
+	try:
+		email = json.loads(body).get("email")
+	except (ValueError, AttributeError):
+		return None
+	return email.strip().lower() if isinstance(email, str) else None
+
+
+class RateLimitMiddleware:
+	"""Sheds load on credential endpoints before body parsing and password hashing.
+
+	Plain ASGI rather than BaseHTTPMiddleware so rejected requests cost no more than a bucket lookup.
+	"""
+
+	def __init__(self, app: ASGIApp, limiter: "RateLimiter"):
+		self.app = app
+		self.limiter = limiter
+
+	async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+		if scope["type"] != "http" or (scope["method"], scope["path"]) not in RATE_LIMIT_ROUTES:
+			await self.app(scope, receive, send)
+			return
+
+		client_ip = scope["client"][0] if scope.get("client") else "<NA>"
+		wait = await self._check(self.limiter.check_ip, client_ip)
+		if wait:
+			await _reject(send, wait)
+			return
+
+		# Buffer at most RATE_LIMIT_MAX_PEEK_BYTES to find the email. Larger bodies skip the
+		# per-email check; they have already counted against the client's IP bucket.
+		body = b""
+		more_body = True
+		while more_body and len(body) <= RATE_LIMIT_MAX_PEEK_BYTES:
+			message = await receive()
+			if message["type"] != "http.request":
+				return
+			body += message.get("body", b"")
+			more_body = message.get("more_body", False)
+
+		email = None if more_body or len(body) > RATE_LIMIT_MAX_PEEK_BYTES else _normalized_email(body)
+		if email is not None:
+			wait = await self._check(self.limiter.check_email, email)
+			if wait:
+				await _reject(send, wait)
+				return
+
+		replayed = False
+
+		async def replay() -> Message:
+			nonlocal replayed
+			if not replayed:
+				replayed = True
+				return {"type": "http.request", "body": body, "more_body": more_body}
+			return await receive()
+
+		await self.app(scope, replay, send)
+
+	async def _check(self, check, key: str) -> float:
+		if self.limiter.store.blocking:
+			return await run_in_threadpool(check, key)
+		return check(key)
+
+
+async def _reject(send: Send, wait: float) -> None:
+	body = b'{"detail":"Too many requests"}'
+	await send({
+		"type": "http.response.start",
+		"status": 429,
+		"headers": [
+			(b"content-type", b"application/json"),
+			(b"content-length", str(len(body)).encode()),
+			(b"retry-after", str(math.ceil(wait)).encode()),
+		],
+	})
+	await send({"type": "http.response.body", "body": body})
+
+
+def _create_store():
+	if RATE_LIMIT_STORE == "sqlite":
+		return SQLiteBucketStore(RATE_LIMIT_SQLITE_PATH)
+	return MemoryBucketStore()
+
+
+limiter = RateLimiter(_create_store()) if RATE_LIMIT_ENABLED else None
+
+if limiter is not None:
+	CallbackCounter(
+		"iam_rate_limit_decisions_total",
+		"Rate limiter decisions on credential endpoints.",
+		("decision",),
+		lambda: {(name,): value for name, value in limiter.counters.items()},
+	)
@@ -0,0 +1,72 @@
+"""Offline resharding of the users table (run with the service stopped).
+
+Every user row is moved to the location its id hashes to under the new shard count
+(the main DB when the count is 0), then the email directory is rebuilt. Rows are copied
+before they are deleted from their old location, so an interrupted run loses nothing and
+can simply be run again.
+"""
+from typing import Dict, List, Sequence
+from sqlalchemy import delete, insert, select
+from sqlalchemy.engine import Engine
+from .db import Base, create_shard_schema, shard_for
+from .models import User, UserDirectory
+
+
+def _url(engine: Engine) -> str:
+	return engine.url.render_as_string(hide_password=False)
+
+
+def reshard(primary: Engine, sources: Sequence[Engine], targets: Sequence[Engine], batch_size: int = 1000) -> Dict[str, int]:
+	"""Moves users from the `sources` shards (the main DB if empty) to the `targets` shards."""
+	users = User.__table__
+	directory = UserDirectory.__table__
+	if targets:
+		for shard in targets:
+			create_shard_schema(shard)
+		Base.metadata.create_all(bind=primary, tables=[directory])
+	else:
+		Base.metadata.create_all(bind=primary, tables=[users])
+
+	destinations: List[Engine] = list(targets) or [primary]
+	# Also scan the targets, so rows left behind by an interrupted run are picked up.
+	locations: Dict[str, Engine] = {}
+	for location in (*(sources or [primary]), *destinations):
+		locations.setdefault(_url(location), location)
+
+	moved = 0
+	for url, location in locations.items():
+		last_id = None
+		while True:
+			query = select(users).order_by(users.c.id).limit(batch_size)
+			if last_id is not None:
+				query = query.where(users.c.id > last_id)
+			with location.connect() as conn:
+				rows = [row._asdict() for row in conn.execute(query)]
+			if not rows:
+				break
+			last_id = rows[-1]["id"]
+			misplaced: Dict[str, List[dict]] = {}
+			for row in rows:
+				destination = destinations[shard_for(row["id"], len(destinations))] if targets else primary
+				if _url(destination) != url:
+					misplaced.setdefault(_url(destination), []).append(row)
+			for destination_url, batch in misplaced.items():
+				with locations[destination_url].begin() as conn:
+					conn.execute(insert(users).prefix_with("OR REPLACE"), batch)
+				with location.begin() as conn:
+					conn.execute(delete(users).where(users.c.id.in_([row["id"] for row in batch])))
+				moved += len(batch)
+
+	indexed = 0
+	with primary.begin() as conn:
+		conn.execute(delete(directory))
+		for shard, location in enumerate(targets):
+			with location.connect() as source:
+				entries = [
+					{"email": email, "user_id": user_id, "shard": shard}
+					for email, user_id in source.execute(select(users.c.email, users.c.id))
+				]
+			if entries:
+				conn.execute(insert(directory), entries)
+			indexed += len(entries)
+	return {"moved": moved, "indexed": indexed}
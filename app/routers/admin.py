@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from ..config import PROFILER_ENABLED, PROFILER_MAX_SECONDS
+from ..profiler import profiler, ProfilerBusy
+from ..schemas import ProfileResponse
+from ..security import TokenClaims, require_permission
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["Administration"],
+)
+
+@router.post(
+    "/profile",
+    response_model=ProfileResponse,
+    status_code=202,
+    summary="Profile this worker",
+    description="Capture a time-boxed stack profile of the worker serving the request. The profile is written to a file in collapsed (flame graph) format. Admin only.",
+    response_description="Profile capture started",
+    responses={
+        403: {"description": "Forbidden - Admin only"},
+        404: {"description": "Profiler is disabled"},
+        409: {"description": "A capture is already running"},
+    }
+)
+def start_profile(seconds: float = Query(default=10, gt=0, le=PROFILER_MAX_SECONDS), claims: TokenClaims = Depends(require_permission("admin:profile"))):
+	if not PROFILER_ENABLED:
+		raise HTTPException(status_code=404, detail="Not Found")
+	try:
+		path = profiler.start(seconds)
+	except ProfilerBusy:
+		raise HTTPException(status_code=409, detail="A profile capture is already running")
+	return ProfileResponse(profile_file=path, seconds=seconds, sample_interval_ms=profiler.interval * 1000)
@@ -1,10 +1,16 @@
 import datetime as dt
-from fastapi import APIRouter, Depends, HTTPException, status
+import math
+from typing import Callable
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from ..db import get_db
+from ..db import get_db, get_session_factory, close_session_on_return
 from ..models import User
 from ..schemas import UserCreate, LoginRequest, TokenResponse, UserOut
-from ..security import hash_password, verify_password, create_access_token
+from ..security import hash_password, verify_password, password_needs_update, create_access_token
+from ..lockout import lockout
+from ..metrics import LOGINS, PASSWORD_REHASHES, STAGE_SECONDS
 
 router = APIRouter(
     tags=["Authentication"],
@@ -19,8 +25,11 @@ router = APIRouter(
     description="Create a new user account with self-registration. Password must meet security requirements.",
     response_description="User account created successfully"
 )
+@close_session_on_return
 def register_user(payload: UserCreate, db: Session = Depends(get_db)):
-	existing = db.query(User).filter(User.email == payload.email).first()
+	# Emails are stored, indexed and looked up lowercased.
+	email = str(payload.email).lower()
+	existing = db.query(User).filter(User.email == email).first()
 	if existing:
 		# IMPORTANT: This makes the service vulnerable to enumeration attacks.
 		# Ideally, the service should have various security controls like the ones listed below:
@@ -29,17 +38,27 @@ def register_user(payload: UserCreate, db: Session = Depends(get_db)):
 		# - The service can return a generic message instead of "User already exists"
 		# It is implemented this way for simplicity.
 		raise HTTPException(status_code=409, detail="User already exists")
+	# Return the connection to the pool while bcrypt runs.
+	db.close()
 	password_hash = hash_password(payload.password)
 	user = User(
 		name=payload.name.strip(),
-		email=str(payload.email).lower(),
+		email=email,
 		date_of_birth=payload.date_of_birth,
 		job_title=payload.job_title.strip() if payload.job_title else None,
 		password_hash=password_hash,
 		role="user", # default role for new users
 	)
 	db.add(user)
-	db.commit()
+	try:
+		with STAGE_SECONDS.time("db_commit"):
+			db.commit()
+	except IntegrityError:
+		# Registered concurrently since the check above. With shards the user row has
+		# already been undone when its directory entry could not be written, after the
+		# commit: close() rather than rollback() discards the session in either case.
+		db.close()
+		raise HTTPException(status_code=409, detail="User already exists")
 	db.refresh(user)
 	return user
 
@@ -50,12 +69,56 @@ def register_user(payload: UserCreate, db: Session = Depends(get_db)):
     description="Authenticate using email and password to obtain a JWT access token.",
     response_description="Authentication successful, returns access token"
 )
-def login(payload: LoginRequest, db: Session = Depends(get_db)):
-	user = db.query(User).filter(User.email == str(payload.email).lower()).first()
+def login(
+	payload: LoginRequest,
+	background_tasks: BackgroundTasks,
+	db: Session = Depends(get_db),
+	session_factory: Callable[[], Session] = Depends(get_session_factory),
+):
+	email = str(payload.email).lower()
+	# Locked accounts are rejected before the bcrypt call. Unknown emails are tracked
+	# the same way, so the lockout does not reveal whether an account exists.
+	if lockout is not None:
+		locked_for = lockout.locked_for(email)
+		if locked_for:
+			LOGINS.inc("locked")
+			raise HTTPException(
+				status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+				detail="Too many failed login attempts",
+				headers={"Retry-After": str(math.ceil(locked_for))},
+			)
+	user = db.query(User).filter(User.email == email).first()
+	# Return the connection to the pool while bcrypt runs; `user` stays usable detached.
+	db.close()
 	if not user or not verify_password(payload.password, user.password_hash):
+		if lockout is not None:
+			lockout.record_failure(email)
+		LOGINS.inc("failure")
 		raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+	if lockout is not None:
+		lockout.record_success(email)
+	LOGINS.inc("success")
+	subject, role, password_hash = user.id, user.role, user.password_hash
 	user.last_login_at = dt.datetime.utcnow()
 	db.add(user)
-	db.commit()
-	token, expires_in = create_access_token(subject=user.id, role=user.role)
-	return TokenResponse(access_token=token, expires_in=expires_in)
\ No newline at end of file
+	with STAGE_SECONDS.time("db_commit"):
+		db.commit()
+	db.close()
+	if password_needs_update(password_hash):
+		# After the response is sent, so the login does not pay for a second hash.
+		background_tasks.add_task(_rehash_password, session_factory, subject, payload.password, password_hash)
+	token, expires_in = create_access_token(subject=subject, role=role)
+	return TokenResponse(access_token=token, expires_in=expires_in)
+
+def _rehash_password(session_factory, user_id, password: str, old_hash: str) -> None:
+	new_hash = hash_password(password)
+	with session_factory() as db:
+		# Only replace the hash that was verified, so a concurrent password change wins.
+		result = db.execute(
+			update(User)
+			.where(User.id == user_id, User.password_hash == old_hash)
+			.values(password_hash=new_hash)
+		)
+		db.commit()
+	if result.rowcount:
+		PASSWORD_REHASHES.inc()
\ No newline at end of file
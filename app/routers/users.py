@@ -1,10 +1,9 @@
 import uuid
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from ..db import get_db
-from ..models import User
+from ..db import get_db, close_session_on_return
 from ..schemas import UserOut
-from ..security import verify_access_token, require_self_or_admin
+from ..security import TokenClaims, load_user, require_user_permission
 
 router = APIRouter(
     prefix="/users",
@@ -37,9 +36,9 @@ router = APIRouter(
         }
     }
 )
-def get_user(user_id: uuid.UUID, db: Session = Depends(get_db), current_user: User = Depends(verify_access_token)):
-	require_self_or_admin(user_id, current_user)
-	user = db.query(User).filter(User.id == user_id).first()
+@close_session_on_return
+def get_user(user_id: uuid.UUID, db: Session = Depends(get_db), claims: TokenClaims = Depends(require_user_permission("users:read:self", "users:read:any"))):
+	user = load_user(db, user_id)
 	if not user:
 		raise HTTPException(status_code=404, detail="User not found")
 	return user
\ No newline at end of file
@@ -2,6 +2,7 @@ import datetime
 import uuid
 from typing import Optional
 from pydantic import BaseModel, EmailStr, Field, field_validator, ConfigDict
+from .breached import is_breached
 
 class UserCreate(BaseModel):
 	model_config = ConfigDict(extra='forbid')  # Strictly forbid extra fields
@@ -21,6 +22,8 @@ class UserCreate(BaseModel):
 		has_symbol = any(not c.isalnum() for c in v)
 		if not (has_upper and has_lower and has_digit and has_symbol):
 			raise ValueError("Password must include upper, lower, digit, and symbol")
+		if is_breached(v):
+			raise ValueError("Password has appeared in a data breach; choose a different password")
 		return v
 
 class LoginRequest(BaseModel):
@@ -42,4 +45,9 @@ class UserOut(BaseModel):
 class TokenResponse(BaseModel):
 	access_token: str
 	token_type: str = "bearer"
-	expires_in: int
\ No newline at end of file
+	expires_in: int
+
+class ProfileResponse(BaseModel):
+	profile_file: str
+	seconds: float
+	sample_interval_ms: float
\ No newline at end of file
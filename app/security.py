@@ -1,87 +1,228 @@
+import importlib.util
 import time
 import uuid
-from typing import Optional, Dict
+from functools import lru_cache
+from typing import Callable, Dict, NamedTuple, Optional
 from fastapi import Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordBearer
-from jose import jwt, JWTError
-from passlib.context import CryptContext
 from sqlalchemy.orm import Session
-from .db import get_db
 from .models import User
-from .config import JWT_ALGORITHM, JWT_EXPIRY_SECONDS, JWT_SIGNING_KEY, JWT_VERIFICATION_KEYS, JWT_ISSUER, JWT_AUDIENCE
+from .cache import SingleFlight, TTLCache
+from .metrics import STAGE_SECONDS, INVALID_TOKENS, FORBIDDEN, CallbackCounter
+from .permissions import policy_store
+from .tokens import build_claims, decode_id, role_name
+from .config import (
+	JWT_ALGORITHM, JWT_EXPIRY_SECONDS, JWT_ISSUER, JWT_AUDIENCE, JWT_COMPACT_TOKENS,
+	PASSWORD_SCHEME, BCRYPT_ROUNDS, ARGON2_TIME_COST, ARGON2_MEMORY_KIB, ARGON2_PARALLELISM,
+	TOKEN_CACHE_SIZE, TOKEN_CACHE_SECONDS,
+	get_signing_key, get_verification_keys,
+)
 
 # Suppress benign warnings from passlib.
 # See: https://github.com/pyca/bcrypt/issues/684#issuecomment-1858400267
 import logging
 logging.getLogger('passlib').setLevel(logging.ERROR)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
 
+def password_context_options(scheme: str) -> Dict:
+	"""CryptContext options. `scheme` hashes new passwords; hashes of the other scheme or
+	with other costs still verify, and needs_update() flags them for rehashing."""
+	if scheme not in ("bcrypt", "argon2"):
+		raise ValueError(f"Unsupported password scheme: {scheme}")
+	schemes = ["bcrypt"]
+	# Pinning min and max rounds to the configured cost makes needs_update() catch cost changes both ways.
+	options = {"bcrypt__rounds": BCRYPT_ROUNDS, "bcrypt__min_rounds": BCRYPT_ROUNDS, "bcrypt__max_rounds": BCRYPT_ROUNDS}
+	# argon2 hashes stay verifiable after switching back to bcrypt, as long as argon2-cffi is installed.
+	if scheme == "argon2" or importlib.util.find_spec("argon2") is not None:
+		schemes.append("argon2")
+		options.update({
+			"argon2__type": "ID",
+			"argon2__memory_cost": ARGON2_MEMORY_KIB,
+			"argon2__parallelism": ARGON2_PARALLELISM,
+			"argon2__rounds": ARGON2_TIME_COST,
+			"argon2__min_rounds": ARGON2_TIME_COST,
+			"argon2__max_rounds": ARGON2_TIME_COST,
+		})
+	schemes.sort(key=lambda name: name != scheme)
+	return {"schemes": schemes, "deprecated": "auto", **options}
+
+
+# passlib and jose are imported on first use to keep worker start cheap.
+@lru_cache(maxsize=None)
+def get_pwd_context():
+	from passlib.context import CryptContext
+	return CryptContext(**password_context_options(PASSWORD_SCHEME))
+
+
 def hash_password(password: str) -> str:
-	return pwd_context.hash(password)
+	with STAGE_SECONDS.time("hash_password"):
+		return get_pwd_context().hash(password)
 
 
 def verify_password(plain_password: str, password_hash: str) -> bool:
-	return pwd_context.verify(plain_password, password_hash)
+	with STAGE_SECONDS.time("verify_password"):
+		return get_pwd_context().verify(plain_password, password_hash)
+
+
+def password_needs_update(password_hash: str) -> bool:
+	"""True if the hash uses another scheme or cost than the configured one."""
+	return get_pwd_context().needs_update(password_hash)
 
 
 def create_access_token(subject: uuid.UUID, role: str) -> tuple[str, int]:
-	now = int(time.time())
-	claims = {
-		"iss": JWT_ISSUER,
-		"sub": str(subject),  # Convert UUID to string for JWT
-		"role": role,
-		"aud": JWT_AUDIENCE,
-		"jti": str(uuid.uuid4()),
-		"iat": now,
-		"nbf": now,
-		"exp": now + JWT_EXPIRY_SECONDS,
-	}
-	signing_key = JWT_SIGNING_KEY
-	token = jwt.encode(claims, signing_key, algorithm=JWT_ALGORITHM)
+	from jose import jwt
+	claims = build_claims(
+		JWT_ISSUER, JWT_AUDIENCE, subject, role, policy_store.token_claim(role),
+		int(time.time()), JWT_EXPIRY_SECONDS, compact=JWT_COMPACT_TOKENS,
+	)
+	signing_key = get_signing_key()
+	with STAGE_SECONDS.time("create_access_token"):
+		token = jwt.encode(claims, signing_key, algorithm=JWT_ALGORITHM)
 	return token, JWT_EXPIRY_SECONDS
 
 
-def verify_access_token(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)) -> User:
-	credentials_exception = HTTPException(status_code=401, detail="Invalid token")
+class TokenClaims(NamedTuple):
+	subject: uuid.UUID
+	role: str
+	permissions: int
+	claims: Dict
+
+
+# Verified claims by token. Callers share the cached dict and must not modify it.
+token_cache = TTLCache(TOKEN_CACHE_SIZE)
+# Concurrent requests carrying the same uncached token share one signature check.
+token_verifications = SingleFlight()
+# Concurrent lookups of the same user share one query.
+user_lookups = SingleFlight()
 
-	verification_keys = JWT_VERIFICATION_KEYS
+
+def _verify_token(token: str) -> Optional[Dict]:
+	from jose import jwt, JWTError
+	verification_keys = get_verification_keys()
 	jwt_decoded = None
-	
+
 	# Attempt token verification with each key, until one succeeds or we run out of keys.
-	for key_id, verification_key in verification_keys.items():
-		try:
-			jwt_decoded = jwt.decode(token, verification_key, algorithms=[JWT_ALGORITHM], audience=JWT_AUDIENCE)
-			break
-		except JWTError:
-			continue
-	
+	with STAGE_SECONDS.time("verify_access_token"):
+		for key_id, verification_key in verification_keys.items():
+			try:
+				jwt_decoded = jwt.decode(token, verification_key, algorithms=[JWT_ALGORITHM], audience=JWT_AUDIENCE)
+				break
+			except JWTError:
+				continue
+
+	if jwt_decoded is not None and jwt_decoded.get("sub") is not None:
+		expires_at = min(jwt_decoded.get("exp", 0), time.time() + TOKEN_CACHE_SECONDS)
+		token_cache.put(token, jwt_decoded, expires_at)
+	return jwt_decoded
+
+
+def decode_access_token(token: str) -> Dict:
+	"""Verifies the token signature and standard claims. Raises 401 on failure."""
+	jwt_decoded = token_cache.get(token)
 	if jwt_decoded is None:
-		raise credentials_exception
-	
+		return verify_access_token_uncached(token)
+	return jwt_decoded
+
+
+def verify_access_token_uncached(token: str) -> Dict:
+	"""decode_access_token for a caller that has already missed the cache."""
+	jwt_decoded, _ = token_verifications.do(token, _verify_token, token)
+	if jwt_decoded is None or jwt_decoded.get("sub") is None:
+		INVALID_TOKENS.inc()
+		raise HTTPException(status_code=401, detail="Invalid token")
+	return jwt_decoded
+
+
+def _subject(claims: Dict) -> uuid.UUID:
 	try:
-		user_id_str = jwt_decoded.get("sub")
-		if user_id_str is None:
-			raise credentials_exception
-		user_id = uuid.UUID(user_id_str)
-	except (ValueError, TypeError):
-		raise credentials_exception
-
-	user: Optional[User] = db.query(User).filter(User.id == user_id).first()
-	if not user:
-		raise credentials_exception
-	return user
+		return decode_id(claims["sub"])
+	except (ValueError, TypeError, AttributeError):
+		INVALID_TOKENS.inc()
+		raise HTTPException(status_code=401, detail="Invalid token")
+
+
+def get_token_claims(token: str = Depends(oauth2_scheme)) -> TokenClaims:
+	"""Authenticates the request from the token alone, without loading the user."""
+	return token_claims(decode_access_token(token))
 
 
-def require_self_or_admin(target_user_id: uuid.UUID, current_user: User) -> None:
-	if current_user.role not in ('user', 'admin'):
-		raise HTTPException(status_code=403, detail="Forbidden")
+def token_claims(claims: Dict) -> TokenClaims:
+	"""TokenClaims of an already verified token. Raises 401 if its subject is malformed."""
+	role = role_name(claims.get("role"))
+	permissions = policy_store.permissions_from_claim(claims.get("prm"), role)
+	return TokenClaims(subject=_subject(claims), role=role, permissions=permissions, claims=claims)
+
+
+def _query_user(db: Session, user_id: uuid.UUID) -> Optional[User]:
+	return db.query(User).filter(User.id == user_id).first()
+
+
+def load_user(db: Session, user_id: uuid.UUID) -> Optional[User]:
+	"""Loads a user by id. Concurrent lookups of the same id share one query."""
+	user, shared = user_lookups.do(user_id, _query_user, db, user_id)
+	if shared and user is not None:
+		# The instance belongs to the leader's session: attach a copy without another query.
+		user = db.merge(user, load=False)
+	return user
+
 
-    # Non-admins can only access their own data
-	if current_user.role == "user" and current_user.id != target_user_id:
-		raise HTTPException(status_code=403, detail="Forbidden")
+def _forbidden() -> HTTPException:
+	FORBIDDEN.inc()
+	return HTTPException(status_code=403, detail="Forbidden")
+
+
+def _mask_for(*permissions: str) -> Callable[[], int]:
+	# Masks are recomputed only when the compiled policy changes.
+	cached = [None, 0]
+
+	def mask() -> int:
+		policy = policy_store.policy
+		if cached[0] is not policy:
+			cached[0], cached[1] = policy, policy.mask(*permissions)
+		return cached[1]
+	return mask
+
+
+def require_permission(*permissions: str) -> Callable[..., TokenClaims]:
+	"""Route dependency granting access when the token carries all the given permissions."""
+	mask = _mask_for(*permissions)
+
+	def dependency(claims: TokenClaims = Depends(get_token_claims)) -> TokenClaims:
+		required = mask()
+		if claims.permissions & required != required:
+			raise _forbidden()
+		return claims
+	return dependency
+
+
+def require_user_permission(self_permission: str, any_permission: str) -> Callable[..., TokenClaims]:
+	"""Route dependency for /{user_id} routes: `self_permission` covers the caller's own
+	user, `any_permission` covers every user."""
+	self_mask = _mask_for(self_permission)
+	any_mask = _mask_for(any_permission)
+
+	def dependency(user_id: uuid.UUID, claims: TokenClaims = Depends(get_token_claims)) -> TokenClaims:
+		required = self_mask() if claims.subject == user_id else any_mask()
+		if claims.permissions & required != required:
+			raise _forbidden()
+		return claims
+	return dependency
+
+
+CallbackCounter(
+	"iam_token_cache_lookups_total",
+	"Lookups of verified token claims in the worker cache.",
+	("result",),
+	lambda: {("hit",): token_cache.hits, ("miss",): token_cache.misses},
+)
+CallbackCounter(
+	"iam_coalesced_calls_total",
+	"Calls that reused a concurrent identical call instead of running their own.",
+	("operation",),
+	lambda: {("verify_access_token",): token_verifications.shared, ("load_user",): user_lookups.shared},
+)
 
 
 async def add_security_headers(request: Request, call_next):
@@ -0,0 +1,72 @@
+import argparse
+import glob
+import os
+
+LOOP_CHOICES = ["auto", "asyncio", "uvloop"]
+HTTP_CHOICES = ["auto", "h11", "httptools"]
+
+
+def default_workers() -> int:
+	try:
+		return len(os.sched_getaffinity(0))
+	except AttributeError:
+		return os.cpu_count() or 1
+
+
+def add_serve_arguments(parser: argparse.ArgumentParser) -> None:
+	parser.add_argument("--host", default="0.0.0.0")
+	parser.add_argument("--port", type=int, default=8000)
+	parser.add_argument("--workers", type=int, default=default_workers(), help="Worker processes (default: usable CPU cores)")
+	parser.add_argument("--loop", choices=LOOP_CHOICES, default="uvloop", help="Event loop implementation")
+	parser.add_argument("--http", choices=HTTP_CHOICES, default="httptools", help="HTTP protocol implementation")
+	parser.add_argument("--backlog", type=int, default=2048, help="Maximum number of pending connections")
+	parser.add_argument("--keep-alive", type=int, default=5, help="Seconds to keep idle connections open")
+	parser.add_argument("--graceful-timeout", type=int, default=30, help="Seconds to drain in-flight requests after SIGTERM")
+	parser.add_argument("--no-warmup", dest="warmup", action="store_false", help="Skip per-worker warmup")
+	parser.add_argument("--log-level", default="info")
+
+
+def _check_optional_dependency(module: str, option: str) -> None:
+	try:
+		__import__(module)
+	except ImportError:
+		raise SystemExit(f"{option} requires the '{module}' package (install uvicorn[standard])")
+
+
+def serve(args: argparse.Namespace) -> int:
+	import uvicorn
+
+	if args.loop == "uvloop":
+		_check_optional_dependency("uvloop", "--loop uvloop")
+	if args.http == "httptools":
+		_check_optional_dependency("httptools", "--http httptools")
+
+	# Read by each worker's lifespan, whether it runs in this process or in a child.
+	os.environ["IAM_WARMUP"] = "1" if args.warmup else "0"
+
+	# The schema and default policy are set up once, here, rather than by every worker at once.
+	from .db import init_db
+	init_db()
+	os.environ["IAM_DB_INIT_MODE"] = "skip"
+
+	# Metric snapshots of workers from a previous run would be double counted.
+	from .config import METRICS_MULTIPROC_DIR
+	if METRICS_MULTIPROC_DIR:
+		for path in glob.glob(os.path.join(METRICS_MULTIPROC_DIR, "*.json")):
+			os.remove(path)
+
+	# On SIGTERM uvicorn stops accepting connections and waits for in-flight
+	# requests up to the graceful timeout before the worker exits.
+	uvicorn.run(
+		"app.main:app",
+		host=args.host,
+		port=args.port,
+		workers=args.workers,
+		loop=args.loop,
+		http=args.http,
+		backlog=args.backlog,
+		timeout_keep_alive=args.keep_alive,
+		timeout_graceful_shutdown=args.graceful_timeout,
+		log_level=args.log_level,
+	)
+	return 0
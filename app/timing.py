@@ -0,0 +1,47 @@
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Stage name -> accumulated seconds for the current request. None unless the
+# Server-Timing middleware is installed, so recording is a single lookup otherwise.
+_stages: ContextVar[Optional[Dict[str, float]]] = ContextVar("server_timing_stages", default=None)
+
+
+def record(stage: str, seconds: float) -> None:
+	stages = _stages.get()
+	if stages is not None:
+		stages[stage] = stages.get(stage, 0.0) + seconds
+
+
+def format_header(stages: Dict[str, float], total: float) -> str:
+	parts = [f"{stage};dur={seconds * 1000:.3f}" for stage, seconds in stages.items()]
+	parts.append(f"total;dur={total * 1000:.3f}")
+	return ", ".join(parts)
+
+
+class ServerTimingMiddleware:
+	"""Adds a Server-Timing header with the per-stage durations recorded while serving the request."""
+
+	def __init__(self, app: ASGIApp):
+		self.app = app
+
+	async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+		if scope["type"] != "http":
+			await self.app(scope, receive, send)
+			return
+
+		start = time.perf_counter()
+		stages: Dict[str, float] = {}
+		token = _stages.set(stages)
+
+		async def send_wrapper(message: Message) -> None:
+			if message["type"] == "http.response.start":
+				header = format_header(stages, time.perf_counter() - start)
+				message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header.encode())]
+			await send(message)
+
+		try:
+			await self.app(scope, receive, send_wrapper)
+		finally:
+			_stages.reset(token)
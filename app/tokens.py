@@ -0,0 +1,51 @@
+import base64
+import uuid
+from typing import Dict, List
+
+# Access token claim profiles. Both are accepted when verifying; JWT_COMPACT_TOKENS selects the one issued.
+# - full:    `sub`/`jti` as 36-char UUID strings, role names, `nbf` alongside `iat`.
+# - compact: `sub`/`jti` as 22-char base64url UUID bytes, role codes, no `nbf` (it always equalled `iat`).
+ROLE_CODES: Dict[str, str] = {"user": "u", "admin": "a"}
+ROLE_NAMES: Dict[str, str] = {code: name for name, code in ROLE_CODES.items()}
+
+
+def encode_id(value: uuid.UUID) -> str:
+	return base64.urlsafe_b64encode(value.bytes).rstrip(b"=").decode("ascii")
+
+
+def decode_id(value: str) -> uuid.UUID:
+	"""Parses an id claim in either profile. Raises ValueError if it is neither."""
+	if isinstance(value, str) and len(value) == 22:
+		return uuid.UUID(bytes=base64.urlsafe_b64decode(value + "=="))
+	return uuid.UUID(value)
+
+
+def role_name(value) -> str:
+	value = str(value or "")
+	return ROLE_NAMES.get(value, value)
+
+
+def build_claims(issuer: str, audience: str, subject: uuid.UUID, role: str, permissions: List[int],
+		now: int, expiry_seconds: int, compact: bool = False) -> Dict:
+	if compact:
+		return {
+			"iss": issuer,
+			"sub": encode_id(subject),
+			"role": ROLE_CODES.get(role, role),
+			"prm": permissions,
+			"aud": audience,
+			"jti": encode_id(uuid.uuid4()),
+			"iat": now,
+			"exp": now + expiry_seconds,
+		}
+	return {
+		"iss": issuer,
+		"sub": str(subject),  # Convert UUID to string for JWT
+		"role": role,
+		"prm": permissions,
+		"aud": audience,
+		"jti": str(uuid.uuid4()),
+		"iat": now,
+		"nbf": now,
+		"exp": now + expiry_seconds,
+	}
@@ -0,0 +1,186 @@
+"""Token verification for co-located services over a Unix domain socket.
+
+Protocol: the client writes one token per line (optionally prefixed with "Bearer ").
+The server answers each line, in order, with one line of JSON:
+
+    {"valid": true, "sub": "<user id>", "role": "user", "permissions": 1, "claims": {...}}
+    {"valid": false, "error": "Invalid token"}
+
+Requests may be pipelined: a client can write many lines before reading any answers.
+Each token is looked up once in the HTTP path's verified-claims cache (token_cache). A hit
+is answered on the event loop. A miss runs verify_access_token_uncached in a thread, with
+the HTTP path's keys and single-flight coalescing, and fills the cache for both paths.
+"""
+import asyncio
+import json
+import logging
+import fcntl
+import os
+from typing import Dict, Optional, Set, Tuple
+from fastapi import HTTPException
+from .config import VERIFY_SOCKET_MODE
+from .metrics import Counter
+from .security import token_cache, token_claims, verify_access_token_uncached
+
+logger = logging.getLogger("uvicorn.error")
+
+MAX_LINE_BYTES = 8192
+# How often a standby process checks whether the serving process has gone.
+STANDBY_POLL_SECONDS = 1.0
+
+VERIFICATIONS = Counter("iam_socket_verifications_total", "Token verifications served on the Unix socket, by verdict.", ("result",))
+
+
+def _encode(response: dict) -> bytes:
+	return json.dumps(response, separators=(",", ":")).encode() + b"\n"
+
+
+_MALFORMED = _encode({"valid": False, "error": "Malformed request"})
+_INVALID = _encode({"valid": False, "error": "Invalid token"})
+
+
+def parse_line(line: bytes) -> Optional[str]:
+	"""The token of a request line, or None if the line is malformed."""
+	try:
+		token = line.strip().decode("ascii")
+	except UnicodeDecodeError:
+		return None
+	if token[:7].lower() == "bearer ":
+		token = token[7:].lstrip()
+	return token or None
+
+
+def verify_token(token: Optional[str], cached: Optional[Dict] = None) -> bytes:
+	"""The response line for a parsed request. `cached` are the token's claims from the
+	verified-claims cache; without them the signature is checked, so call off the event loop."""
+	if token is None:
+		VERIFICATIONS.inc("malformed")
+		return _MALFORMED
+	try:
+		claims = token_claims(cached if cached is not None else verify_access_token_uncached(token))
+	except HTTPException:
+		VERIFICATIONS.inc("invalid")
+		return _INVALID
+	VERIFICATIONS.inc("valid")
+	return _encode({
+		"valid": True,
+		"sub": str(claims.subject),
+		"role": claims.role,
+		"permissions": claims.permissions,
+		"claims": claims.claims,
+	})
+
+
+class VerifySocketServer:
+	"""Serves the protocol on a Unix socket for as long as it holds the path's lock file.
+
+	The lock (flock on "<path>.lock") decides which process serves a shared path: the
+	holder binds the socket, the others stand by and poll the lock, so one of them takes
+	over when the holder exits or dies. The kernel drops the lock with the process, so a
+	socket file left by a crash is recognised as stale and replaced.
+	"""
+
+	def __init__(self, path: str, standby_interval: float = STANDBY_POLL_SECONDS):
+		# "{pid}" gives each worker its own socket.
+		self.path = path.replace("{pid}", str(os.getpid()))
+		self.standby_interval = standby_interval
+		self._lock_fd: Optional[int] = None
+		self._inode: Optional[Tuple[int, int]] = None
+		self._server: Optional[asyncio.AbstractServer] = None
+		self._standby: Optional[asyncio.Task] = None
+		self._connections: Set[asyncio.Task] = set()
+
+	@property
+	def serving(self) -> bool:
+		return self._server is not None
+
+	async def start(self) -> bool:
+		"""Starts listening. Returns False if another live process serves the path (e.g. a
+		sibling worker when the path has no "{pid}"); this one then takes over when it goes."""
+		if await self._try_listen():
+			return True
+		logger.info(f"verification socket {self.path} is served by another process")
+		self._standby = asyncio.create_task(self._wait_for_lock())
+		return False
+
+	async def _try_listen(self) -> bool:
+		fd = os.open(f"{self.path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+		try:
+			fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+		except BlockingIOError:
+			os.close(fd)
+			return False
+		try:
+			# Holding the lock, any existing socket file is stale.
+			if os.path.exists(self.path):
+				os.unlink(self.path)
+			self._server = await asyncio.start_unix_server(self._handle, path=self.path, limit=MAX_LINE_BYTES)
+			os.chmod(self.path, VERIFY_SOCKET_MODE)
+			stat = os.stat(self.path)
+		except BaseException:
+			if self._server is not None:
+				self._server.close()
+				self._server = None
+			os.close(fd)
+			raise
+		self._lock_fd = fd
+		self._inode = (stat.st_dev, stat.st_ino)
+		logger.info(f"serving token verification on {self.path}")
+		return True
+
+	async def _wait_for_lock(self) -> None:
+		while not await self._try_listen():
+			await asyncio.sleep(self.standby_interval)
+
+	async def stop(self) -> None:
+		if self._standby is not None:
+			self._standby.cancel()
+			await asyncio.gather(self._standby, return_exceptions=True)
+			self._standby = None
+		if self._server is None:
+			return
+		self._server.close()
+		for task in list(self._connections):
+			task.cancel()
+		await asyncio.gather(*self._connections, return_exceptions=True)
+		await self._server.wait_closed()
+		self._server = None
+		# Only remove the socket file this process created.
+		try:
+			stat = os.stat(self.path)
+			if (stat.st_dev, stat.st_ino) == self._inode:
+				os.unlink(self.path)
+		except OSError:
+			pass
+		# Released after the unlink, so the next holder never sees its own socket removed.
+		os.close(self._lock_fd)
+		self._lock_fd = None
+
+	async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+		task = asyncio.current_task()
+		self._connections.add(task)
+		try:
+			while True:
+				try:
+					line = await reader.readline()
+				except ValueError:
+					# Line longer than MAX_LINE_BYTES: the stream can no longer be framed.
+					writer.write(_MALFORMED)
+					break
+				if not line:
+					break
+				token = parse_line(line)
+				# Cache hits are answered inline; signature checks run off the event loop. The
+				# cache is read once, so an entry expiring meanwhile cannot block the loop.
+				cached = token_cache.get(token) if token is not None else None
+				if token is None or cached is not None:
+					writer.write(verify_token(token, cached))
+				else:
+					writer.write(await asyncio.to_thread(verify_token, token))
+				await writer.drain()
+		except (ConnectionError, asyncio.CancelledError):
+			# Client went away, or the server is stopping.
+			pass
+		finally:
+			self._connections.discard(task)
+			writer.close()
@@ -0,0 +1,25 @@
+import logging
+from sqlalchemy import text
+from .config import get_signing_key, get_verification_keys
+from .db import engine, shard_engines
+from .security import get_pwd_context
+
+logger = logging.getLogger("uvicorn.error")
+
+
+def warmup() -> None:
+	"""Pay one-off costs before the worker accepts traffic instead of on the first requests."""
+	# Read key material from disk.
+	get_signing_key()
+	get_verification_keys()
+
+	# Import jose and passlib and load the password hashing backend (bcrypt runs its self-test).
+	import jose.jwt  # noqa: F401
+	get_pwd_context().handler().get_backend()
+
+	# Open the first pooled connection of the DB and of each user shard.
+	for db_engine in (engine, *shard_engines):
+		with db_engine.connect() as conn:
+			conn.execute(text("SELECT 1"))
+
+	logger.info("worker warmup complete")
@@ -0,0 +1,48 @@
+import json
+import math
+import os
+import socket
+import statistics
+import sys
+from typing import Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BUDGETS_FILE = os.path.join(REPO_ROOT, "benchmarks", "budgets.json")
+
+
+def free_port() -> int:
+	with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+		s.bind(("127.0.0.1", 0))
+		return s.getsockname()[1]
+
+
+def percentile(samples: List[float], pct: float) -> float:
+	"""Nearest-rank percentile."""
+	if not samples:
+		return 0.0
+	ordered = sorted(samples)
+	rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+	return ordered[rank - 1]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+	return {
+		"n": len(samples),
+		"min": min(samples) if samples else 0.0,
+		"median": statistics.median(samples) if samples else 0.0,
+		"max": max(samples) if samples else 0.0,
+	}
+
+
+def load_budgets(path: str, section: str) -> Dict:
+	with open(path, "r") as f:
+		return json.load(f).get(section, {})
+
+
+def write_report(report: Dict, output: str) -> None:
+	data = json.dumps(report, indent=2, sort_keys=True)
+	if output == "-":
+		sys.stdout.write(data + "\n")
+	else:
+		with open(output, "w") as f:
+			f.write(data + "\n")
@@ -0,0 +1,235 @@
+"""HTTP load benchmark: drives realistic request mixes against a locally started server.
+
+Starts `python -m app serve` on a free port with a throwaway database, runs each
+scenario with an asyncio/httpx load generator and reports RPS and latency
+percentiles per scenario as JSON. Exits non-zero when a result is outside the
+budgets in budgets.json.
+
+    python -m benchmarks.load --workers 2 --output load.json
+"""
+import argparse
+import asyncio
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from .common import DEFAULT_BUDGETS_FILE, REPO_ROOT, free_port, load_budgets, percentile, write_report
+
+PASSWORD = "B3nchmark!Passw0rd"
+
+
+@dataclass
+class ScenarioResult:
+	name: str
+	endpoint: str
+	latencies: List[float] = field(default_factory=list)
+	statuses: Dict[int, int] = field(default_factory=dict)
+	elapsed: float = 0.0
+
+	def report(self, expected_status: int) -> Dict:
+		errors = sum(count for status, count in self.statuses.items() if status != expected_status)
+		requests = sum(self.statuses.values())
+		return {
+			"endpoint": self.endpoint,
+			"requests": requests,
+			"errors": errors,
+			"error_rate": errors / requests if requests else 0.0,
+			"rps": requests / self.elapsed if self.elapsed else 0.0,
+			"p50_ms": percentile(self.latencies, 50) * 1000,
+			"p95_ms": percentile(self.latencies, 95) * 1000,
+			"p99_ms": percentile(self.latencies, 99) * 1000,
+			"statuses": {str(status): count for status, count in sorted(self.statuses.items())},
+		}
+
+
+async def drive(client: httpx.AsyncClient, name: str, endpoint: str, requests: int, concurrency: int,
+		make_request: Callable[[int], Tuple[str, str, Optional[dict], Optional[dict]]],
+		on_response: Optional[Callable[[int, httpx.Response], None]] = None) -> ScenarioResult:
+	"""Issue `requests` requests from `concurrency` concurrent loops."""
+	result = ScenarioResult(name=name, endpoint=endpoint)
+	next_index = iter(range(requests))
+
+	async def loop():
+		for index in next_index:
+			method, url, body, headers = make_request(index)
+			start = time.perf_counter()
+			response = await client.request(method, url, json=body, headers=headers)
+			result.latencies.append(time.perf_counter() - start)
+			result.statuses[response.status_code] = result.statuses.get(response.status_code, 0) + 1
+			if on_response is not None:
+				on_response(index, response)
+
+	start = time.perf_counter()
+	await asyncio.gather(*(loop() for _ in range(concurrency)))
+	result.elapsed = time.perf_counter() - start
+	return result
+
+
+def _user_payload(index: int, run_id: str) -> dict:
+	return {
+		"name": f"Bench User {index}",
+		"email": f"bench-{run_id}-{index}@example.com",
+		"date_of_birth": "1990-01-01",
+		"job_title": "Benchmark",
+		"password": PASSWORD,
+	}
+
+
+def _previous_key_token(private_key_path: str, user_id: str) -> str:
+	"""Token signed with the rotated-out key, so verification falls back to the second key."""
+	from jose import jwt
+	from app.config import JWT_ALGORITHM, JWT_AUDIENCE, JWT_ISSUER
+	with open(private_key_path) as f:
+		private_key = f.read()
+	now = int(time.time())
+	claims = {"iss": JWT_ISSUER, "sub": user_id, "role": "user", "aud": JWT_AUDIENCE,
+		"jti": str(uuid.uuid4()), "iat": now, "nbf": now, "exp": now + 3600}
+	return jwt.encode(claims, private_key, algorithm=JWT_ALGORITHM)
+
+
+async def run_scenarios(base_url: str, args: argparse.Namespace, previous_private_key: str) -> Dict[str, Dict]:
+	run_id = uuid.uuid4().hex[:8]
+	users: Dict[int, str] = {}
+	tokens: Dict[int, str] = {}
+	limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+	results = {}
+	async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+		registration = await drive(
+			client, "registration_burst", "POST /users", args.users, args.concurrency,
+			lambda i: ("POST", "/users", _user_payload(i, run_id), None),
+			lambda i, r: users.__setitem__(i, r.json()["id"]) if r.status_code == 201 else None,
+		)
+		results["registration_burst"] = registration.report(201)
+		registered = sorted(users)
+		if not registered:
+			raise RuntimeError("registration failed; nothing to log in with")
+
+		login = await drive(
+			client, "login_storm", "POST /login", args.users, args.concurrency,
+			lambda i: ("POST", "/login", {"email": _user_payload(registered[i % len(registered)], run_id)["email"], "password": PASSWORD}, None),
+			lambda i, r: tokens.__setitem__(registered[i % len(registered)], r.json()["access_token"]) if r.status_code == 200 else None,
+		)
+		results["login_storm"] = login.report(200)
+		authenticated = sorted(tokens)
+		if not authenticated:
+			raise RuntimeError("login failed; no tokens for the authenticated scenarios")
+
+		def get_own(i: int, token_for: Callable[[int], str]):
+			index = authenticated[i % len(authenticated)]
+			return ("GET", f"/users/{users[index]}", None, {"Authorization": f"Bearer {token_for(index)}"})
+
+		steady = await drive(
+			client, "steady_get", "GET /users/{user_id}", args.requests, args.concurrency,
+			lambda i: get_own(i, tokens.__getitem__),
+		)
+		results["steady_get"] = steady.report(200)
+
+		# One token per request, minted up front: a repeated token would be answered from the
+		# verified-claims cache and never reach the fallback to the second key.
+		rotated_tokens = [
+			_previous_key_token(previous_private_key, users[authenticated[i % len(authenticated)]])
+			for i in range(args.requests)
+		]
+		rotation = await drive(
+			client, "key_rotation", "GET /users/{user_id}", args.requests, args.concurrency,
+			lambda i: get_own(i, lambda index: rotated_tokens[i]),
+		)
+		results["key_rotation"] = rotation.report(200)
+	return results
+
+
+def _generate_key_pair(directory: str) -> Tuple[str, str]:
+	private_key = os.path.join(directory, "previous_private.pem")
+	public_key = os.path.join(directory, "previous_public.pem")
+	subprocess.run(["openssl", "genrsa", "-out", private_key, "2048"], check=True, capture_output=True)
+	subprocess.run(["openssl", "rsa", "-in", private_key, "-pubout", "-out", public_key], check=True, capture_output=True)
+	return private_key, public_key
+
+
+def _wait_until_ready(proc: subprocess.Popen, url: str, timeout: float = 60.0) -> None:
+	deadline = time.monotonic() + timeout
+	while time.monotonic() < deadline:
+		if proc.poll() is not None:
+			raise RuntimeError("server exited during startup")
+		try:
+			if httpx.get(url, timeout=1).status_code == 200:
+				return
+		except httpx.HTTPError:
+			pass
+		time.sleep(0.1)
+	raise TimeoutError(f"server not ready at {url}")
+
+
+def check_budgets(results: Dict[str, Dict], budgets: Dict[str, Dict]) -> List[str]:
+	failures = []
+	for scenario, limits in budgets.items():
+		measured = results.get(scenario)
+		if measured is None:
+			continue
+		if "min_rps" in limits and measured["rps"] < limits["min_rps"]:
+			failures.append(f"{scenario}: {measured['rps']:.1f} rps below budget {limits['min_rps']}")
+		for metric in ("p50_ms", "p95_ms", "p99_ms", "error_rate"):
+			limit = limits.get("max_" + metric)
+			if limit is not None and measured[metric] > limit:
+				failures.append(f"{scenario}: {metric} {measured[metric]:.3f} exceeds budget {limit}")
+	return failures
+
+
+def main(argv=None) -> int:
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("--workers", type=int, default=1, help="Server worker processes")
+	parser.add_argument("--concurrency", type=int, default=16, help="Concurrent client connections")
+	parser.add_argument("--users", type=int, default=50, help="Users registered and logged in (bcrypt-bound)")
+	parser.add_argument("--requests", type=int, default=2000, help="Requests per authenticated GET scenario")
+	parser.add_argument("--with-rate-limit", action="store_true", help="Keep the built-in rate limiter enabled")
+	parser.add_argument("--budgets", default=DEFAULT_BUDGETS_FILE)
+	parser.add_argument("--output", default="-", help="JSON report path ('-' for stdout)")
+	args = parser.parse_args(argv)
+
+	with tempfile.TemporaryDirectory() as tmp:
+		previous_private_key, previous_public_key = _generate_key_pair(tmp)
+		port = free_port()
+		env = dict(os.environ)
+		env.update({
+			"DATABASE_URL": f"sqlite:///{os.path.join(tmp, 'load.db')}",
+			"IAM_JWT_VERIFICATION_KEY_FILES": f"current=keys/sample/public.pem,previous={previous_public_key}",
+			"IAM_RATE_LIMIT": "1" if args.with_rate_limit else "0",
+		})
+		cmd = [sys.executable, "-m", "app", "serve", "--host", "127.0.0.1", "--port", str(port),
+			"--workers", str(args.workers), "--log-level", "warning"]
+		proc = subprocess.Popen(cmd, cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+		try:
+			base_url = f"http://127.0.0.1:{port}"
+			_wait_until_ready(proc, base_url + "/healthz")
+			results = asyncio.run(run_scenarios(base_url, args, previous_private_key))
+		finally:
+			proc.terminate()
+			proc.wait(timeout=60)
+
+	report = {
+		"environment": {
+			"python": platform.python_version(),
+			"platform": platform.platform(),
+			"cpu_count": os.cpu_count(),
+			"workers": args.workers,
+			"concurrency": args.concurrency,
+			"users": args.users,
+			"requests": args.requests,
+		},
+		"scenarios": results,
+		"failures": check_budgets(results, load_budgets(args.budgets, "load")),
+	}
+	write_report(report, args.output)
+	return 1 if report["failures"] else 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
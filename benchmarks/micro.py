@@ -0,0 +1,221 @@
+"""Microbenchmarks for the security and serialization primitives.
+
+Each case is warmed up, then the iteration count is calibrated so a sample
+takes at least --min-sample-time. Per-call statistics come from --repeat
+samples. Runs offline; nothing is served over the network.
+
+    python -m benchmarks.micro --output before.json
+    python -m benchmarks.micro --compare before.json
+    python -m benchmarks.micro -k token
+"""
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import ExitStack, nullcontext
+from typing import Callable, Dict, List, Optional, Tuple
+from unittest import mock
+
+from .common import write_report
+
+PASSWORD = "xF0r456@~cwT"
+EXTRA_VERIFICATION_KEYS = 2
+BREACH_INDEX_RECORDS = 1_000_000
+
+Case = Callable[[], object]
+
+
+def calibrate(func: Case, min_sample_time: float) -> int:
+	"""Iteration count whose run takes at least min_sample_time."""
+	iterations = 1
+	while True:
+		start = time.perf_counter()
+		for _ in range(iterations):
+			func()
+		elapsed = time.perf_counter() - start
+		if elapsed >= min_sample_time:
+			return iterations
+		# Aim a little past the target so the next attempt usually succeeds.
+		iterations = max(iterations * 2, int(iterations * min_sample_time * 1.2 / max(elapsed, 1e-9)))
+
+
+def measure(func: Case, repeat: int, min_sample_time: float, warmup: float) -> Dict:
+	deadline = time.perf_counter() + warmup
+	func()
+	while time.perf_counter() < deadline:
+		func()
+
+	iterations = calibrate(func, min_sample_time)
+	per_call: List[float] = []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		for _ in range(iterations):
+			func()
+		per_call.append((time.perf_counter() - start) / iterations)
+
+	mean = statistics.fmean(per_call)
+	stdev = statistics.stdev(per_call) if len(per_call) > 1 else 0.0
+	return {
+		"iterations": iterations,
+		"repeat": repeat,
+		"mean_us": mean * 1e6,
+		"median_us": statistics.median(per_call) * 1e6,
+		"min_us": min(per_call) * 1e6,
+		"max_us": max(per_call) * 1e6,
+		"stdev_us": stdev * 1e6,
+		"rel_stdev": stdev / mean if mean else 0.0,
+	}
+
+
+def _generate_public_keys(directory: str, count: int) -> List[str]:
+	keys = []
+	for i in range(count):
+		private_key = os.path.join(directory, f"extra_{i}.pem")
+		public_key = os.path.join(directory, f"extra_{i}.pub.pem")
+		subprocess.run(["openssl", "genrsa", "-out", private_key, "2048"], check=True, capture_output=True)
+		subprocess.run(["openssl", "rsa", "-in", private_key, "-pubout", "-out", public_key], check=True, capture_output=True)
+		with open(public_key) as f:
+			keys.append(f.read())
+	return keys
+
+
+def build_cases(stack: ExitStack, tmp: str) -> Dict[str, object]:
+	"""Case name -> callable, or (callable, context manager active while it is measured)."""
+	from sqlalchemy import create_engine
+	from sqlalchemy.orm import sessionmaker
+	from app.audit import peek_token_claims
+	from app.breached import BreachedPasswordIndex, build_index
+	from app.config import get_verification_keys
+	from app.db import Base
+	from app.models import User
+	from app.schemas import UserCreate, UserOut
+	from app.security import hash_password, verify_password, create_access_token, get_token_claims, load_user, _verify_token
+
+	engine = create_engine(f"sqlite:///{os.path.join(tmp, 'micro.db')}", connect_args={"check_same_thread": False})
+	Base.metadata.create_all(bind=engine)
+	session = sessionmaker(bind=engine)()
+	stack.callback(session.close)
+
+	password_hash = hash_password(PASSWORD)
+	user = User(
+		id=uuid.uuid4(), name="Alice", email="alice@example.com", date_of_birth=dt.date(2002, 1, 1),
+		job_title="Security Engineer", password_hash=password_hash, role="user",
+	)
+	session.add(user)
+	session.commit()
+	session.refresh(user)
+
+	token, _ = create_access_token(subject=user.id, role=user.role)
+	authorization = f"Bearer {token}"
+
+	# Rotation worst case: the signing key is tried last.
+	current_keys = get_verification_keys()
+	rotated_keys = {f"old_{i}": key for i, key in enumerate(_generate_public_keys(tmp, EXTRA_VERIFICATION_KEYS))}
+	rotated_keys.update(current_keys)
+
+	rng = random.Random(0)
+	breach_index_path = os.path.join(tmp, "breached.idx")
+	build_index((f"{rng.getrandbits(160):040X}:1\n" for _ in range(BREACH_INDEX_RECORDS)), breach_index_path)
+	breach_index = BreachedPasswordIndex(breach_index_path)
+	stack.callback(breach_index.close)
+
+	def verify():
+		# The signature check alone, bypassing the verified-claims cache.
+		return _verify_token(token)
+
+	registration = {
+		"name": "Alice", "email": "alice@example.com", "date_of_birth": "2002-01-01",
+		"job_title": "Security Engineer", "password": PASSWORD,
+	}
+
+	return {
+		"hash_password": lambda: hash_password(PASSWORD),
+		"verify_password": lambda: verify_password(PASSWORD, password_hash),
+		"create_access_token": lambda: create_access_token(subject=user.id, role=user.role),
+		"verify_access_token[1 key]": (verify, mock.patch("app.security.get_verification_keys", return_value=current_keys)),
+		f"verify_access_token[{len(rotated_keys)} keys]": (verify, mock.patch("app.security.get_verification_keys", return_value=rotated_keys)),
+		# What a /users/{user_id} request pays once the token is cached: claims, then the user.
+		"verify_access_token[cached]": lambda: load_user(session, get_token_claims(token).subject),
+		"audit_peek_token_claims": lambda: peek_token_claims(authorization),
+		"breached_password_lookup": lambda: PASSWORD in breach_index,
+		"UserCreate.password_policy": lambda: UserCreate.password_policy(PASSWORD),
+		"UserCreate validation": lambda: UserCreate(**registration),
+		"UserOut serialization": lambda: UserOut.model_validate(user).model_dump_json(),
+	}
+
+
+def compare(current: Dict[str, Dict], previous: Dict[str, Dict]) -> List[Tuple[str, Optional[float], float, Optional[float], str]]:
+	"""Rows of (case, previous median, current median, change, verdict)."""
+	rows = []
+	for name, stats in current.items():
+		before = previous.get(name)
+		if before is None:
+			rows.append((name, None, stats["median_us"], None, "new"))
+			continue
+		change = stats["median_us"] / before["median_us"] - 1
+		# Treat differences within the combined run-to-run noise as unchanged.
+		noise = 2 * max(stats["rel_stdev"], before["rel_stdev"], 0.02)
+		verdict = "faster" if change < -noise else "slower" if change > noise else "same"
+		rows.append((name, before["median_us"], stats["median_us"], change, verdict))
+	return rows
+
+
+def format_table(results: Dict[str, Dict], comparison=None) -> str:
+	lines = []
+	if comparison is None:
+		lines.append(f"{'case':<32} {'median':>12} {'mean':>12} {'stdev':>8} {'iters':>8}")
+		for name, stats in results.items():
+			lines.append(f"{name:<32} {stats['median_us']:>10.2f}us {stats['mean_us']:>10.2f}us {stats['rel_stdev']:>7.1%} {stats['iterations']:>8}")
+	else:
+		lines.append(f"{'case':<32} {'before':>12} {'after':>12} {'change':>8}  verdict")
+		for name, before, after, change, verdict in comparison:
+			before_text = f"{before:>10.2f}us" if before is not None else f"{'-':>12}"
+			change_text = f"{change:>+8.1%}" if change is not None else f"{'-':>8}"
+			lines.append(f"{name:<32} {before_text} {after:>10.2f}us {change_text}  {verdict}")
+	return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("-k", dest="pattern", default="", help="Only run cases whose name contains this substring")
+	parser.add_argument("--repeat", type=int, default=7, help="Samples per case")
+	parser.add_argument("--min-sample-time", type=float, default=0.2, help="Minimum seconds per sample")
+	parser.add_argument("--warmup", type=float, default=0.2, help="Warmup seconds per case")
+	parser.add_argument("--compare", help="Previous JSON report to compare against")
+	parser.add_argument("--output", help="Write the JSON report to this path")
+	args = parser.parse_args(argv)
+
+	results: Dict[str, Dict] = {}
+	with tempfile.TemporaryDirectory() as tmp, ExitStack() as stack:
+		for name, case in build_cases(stack, tmp).items():
+			if args.pattern.lower() not in name.lower():
+				continue
+			func, context = case if isinstance(case, tuple) else (case, nullcontext())
+			with context:
+				results[name] = measure(func, args.repeat, args.min_sample_time, args.warmup)
+				print(f"{name}: {results[name]['median_us']:.2f}us", file=sys.stderr)
+
+	comparison = None
+	if args.compare:
+		with open(args.compare) as f:
+			comparison = compare(results, json.load(f)["cases"])
+	print(format_table(results, comparison))
+
+	if args.output:
+		write_report({
+			"environment": {"python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count()},
+			"cases": results,
+		}, args.output)
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,80 @@
+"""Startup-time benchmark: module import time and time to first request.
+
+Every sample runs in a fresh interpreter so nothing is served from a warm
+process. Exits non-zero when the median exceeds the budget in budgets.json.
+
+    python -m benchmarks.startup --runs 5 --output startup.json
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from typing import Dict, List
+
+from .common import DEFAULT_BUDGETS_FILE, REPO_ROOT, free_port, load_budgets, summarize, write_report
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+
+
+def measure_import(env: Dict[str, str]) -> float:
+	out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=REPO_ROOT, env=env, check=True, capture_output=True, text=True)
+	return float(out.stdout.strip().splitlines()[-1])
+
+
+def measure_first_request(env: Dict[str, str], timeout: float = 30.0) -> float:
+	port = free_port()
+	cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+	url = f"http://127.0.0.1:{port}/healthz"
+	start = time.perf_counter()
+	proc = subprocess.Popen(cmd, cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+	try:
+		while time.perf_counter() - start < timeout:
+			if proc.poll() is not None:
+				raise RuntimeError("server exited before serving its first request")
+			try:
+				with urllib.request.urlopen(url, timeout=1) as response:
+					if response.status == 200:
+						return time.perf_counter() - start
+			except OSError:
+				time.sleep(0.005)
+		raise TimeoutError(f"no response from {url} within {timeout}s")
+	finally:
+		proc.terminate()
+		proc.wait()
+
+
+def main(argv=None) -> int:
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("--runs", type=int, default=5)
+	parser.add_argument("--db-init-mode", default="auto", help="IAM_DB_INIT_MODE for the measured processes")
+	parser.add_argument("--budgets", default=DEFAULT_BUDGETS_FILE)
+	parser.add_argument("--output", default="-", help="JSON report path ('-' for stdout)")
+	args = parser.parse_args(argv)
+
+	with tempfile.TemporaryDirectory() as tmp:
+		env = dict(os.environ)
+		env["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'startup.db')}"
+		env["IAM_DB_INIT_MODE"] = args.db_init_mode
+
+		import_samples: List[float] = [measure_import(env) for _ in range(args.runs)]
+		first_request_samples: List[float] = [measure_first_request(env) for _ in range(args.runs)]
+
+	report = {
+		"import_seconds": summarize(import_samples),
+		"first_request_seconds": summarize(first_request_samples),
+		"failures": [],
+	}
+	for metric, budget in load_budgets(args.budgets, "startup").items():
+		measured = report[metric]["median"]
+		if measured > budget:
+			report["failures"].append(f"{metric}: median {measured:.3f}s exceeds budget {budget:.3f}s")
+
+	write_report(report, args.output)
+	return 1 if report["failures"] else 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -5,10 +5,17 @@ from datetime import date
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+
+# Read when app.main is imported; the metrics tests need the endpoint, which is off by default.
+os.environ.setdefault("IAM_METRICS", "1")
+
 from app.main import app
-from app.db import get_db, Base
+from app.db import get_db, Base, LazySession
 from app.models import User
 from app.security import hash_password
+from app.ratelimit import limiter
+from app.lockout import lockout
+from app.security import token_cache
 
 # Create a temporary SQLite database for testing
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -16,8 +23,8 @@ engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def override_get_db():
+    db = LazySession(TestingSessionLocal)
     try:
-        db = TestingSessionLocal()
         yield db
     finally:
         db.close()
@@ -29,6 +36,11 @@ def client():
     """Create a test client with a fresh database for each test."""
     # Create all tables
     Base.metadata.create_all(bind=engine)
+    if limiter is not None:
+        limiter.reset()
+    if lockout is not None:
+        lockout.reset()
+    token_cache.clear()
     
     with TestClient(app) as test_client:
         yield test_client
@@ -28,6 +28,12 @@ class TestUserRegistration:
         response2 = client.post("/users", json=test_user_data)
         assert response2.status_code == 409
         assert "already exists" in response2.json()["detail"]
+
+    def test_user_registration_duplicate_email_other_case(self, client, test_user_data):
+        """Test registration with an email differing only in case is a duplicate."""
+        assert client.post("/users", json=test_user_data).status_code == 201
+        response = client.post("/users", json={**test_user_data, "email": test_user_data["email"].upper()})
+        assert response.status_code == 409
     
     def test_user_registration_short_password(self, client, test_user_data):
         """Test registration with password less than 12 characters fails."""
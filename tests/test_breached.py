@@ -0,0 +1,117 @@
+import hashlib
+import io
+import os
+import random
+import pytest
+from app.__main__ import main
+from app.breached import BreachedPasswordIndex, build_index, get_breached_index, RECORDS_OFFSET
+
+BREACHED = ["P@ssw0rd12345", "Summer2024!abc", "xF0r456@~cwT-breached"]
+
+
+def _sha1(password: str) -> str:
+    return hashlib.sha1(password.encode()).hexdigest().upper()
+
+
+def _dump(passwords, extra=2000, seed=1):
+    rng = random.Random(seed)
+    lines = [f"{_sha1(p)}:{i + 10}" for i, p in enumerate(passwords)]
+    lines += [f"{rng.getrandbits(160):040X}:{rng.randint(1, 5)}" for _ in range(extra)]
+    rng.shuffle(lines)
+    return "\n".join(lines) + "\n"
+
+
+@pytest.fixture
+def breach_index(tmp_path, monkeypatch):
+    """Build an index of BREACHED and enable the registration check."""
+    path = str(tmp_path / "breached.idx")
+    build_index(io.StringIO(_dump(BREACHED)), path)
+    index = BreachedPasswordIndex(path)
+    monkeypatch.setattr("app.breached.get_breached_index", lambda: index)
+    yield index
+    index.close()
+
+
+class TestBreachedPasswordIndex:
+    """Test the memory-mapped breached password index."""
+
+    def test_lookup(self, tmp_path):
+        """Test breached passwords are found and others are not."""
+        path = str(tmp_path / "breached.idx")
+        # Small chunks force several sorted runs to be merged; duplicates are dropped.
+        count = build_index(io.StringIO(_dump(BREACHED + BREACHED[:1])), path, chunk_records=300)
+        assert count == len(BREACHED) + 2000
+
+        index = BreachedPasswordIndex(path)
+        assert index.count == count
+        assert os.path.getsize(path) == RECORDS_OFFSET + count * index.record_size
+        for password in BREACHED:
+            assert password in index
+        assert "xF0r456@~cwT" not in index
+        assert "not-in-the-dump" not in index
+        index.close()
+
+    def test_records_sorted(self, tmp_path):
+        """Test records are written sorted and unique."""
+        path = str(tmp_path / "breached.idx")
+        build_index(io.StringIO(_dump([], extra=500)), path, record_size=4, chunk_records=64)
+        with open(path, "rb") as f:
+            f.seek(RECORDS_OFFSET)
+            data = f.read()
+        records = [data[i:i + 4] for i in range(0, len(data), 4)]
+        assert records == sorted(set(records))
+
+    def test_min_count(self, tmp_path):
+        """Test rarely seen hashes can be left out."""
+        path = str(tmp_path / "breached.idx")
+        source = io.StringIO(f"{_sha1('rare')}:1\n{_sha1('common')}:50\n")
+        assert build_index(source, path, min_count=10) == 1
+        index = BreachedPasswordIndex(path)
+        assert "common" in index
+        assert "rare" not in index
+        index.close()
+
+    def test_empty_dump(self, tmp_path):
+        """Test an empty dump yields a valid index that matches nothing."""
+        path = str(tmp_path / "breached.idx")
+        assert build_index(io.StringIO(""), path) == 0
+        index = BreachedPasswordIndex(path)
+        assert "anything" not in index
+        index.close()
+
+    def test_rejects_other_files(self, tmp_path):
+        """Test a file that is not an index is refused."""
+        path = tmp_path / "not-an-index"
+        path.write_bytes(b"\0" * 64)
+        with pytest.raises(ValueError):
+            BreachedPasswordIndex(str(path))
+
+    def test_build_command(self, tmp_path, capsys):
+        """Test the build-breach-index command."""
+        source = tmp_path / "dump.txt"
+        source.write_text(_dump(BREACHED, extra=10))
+        output = tmp_path / "breached.idx"
+        assert main(["build-breach-index", str(source), str(output)]) == 0
+        assert "Wrote 13 hashes" in capsys.readouterr().out
+        index = BreachedPasswordIndex(str(output))
+        assert BREACHED[0] in index
+        index.close()
+
+    def test_disabled_by_default(self):
+        """Test no index is opened unless one is configured."""
+        assert get_breached_index() is None
+
+
+class TestBreachedPasswordRegistration:
+    """Test registration rejects breached passwords."""
+
+    def test_breached_password_rejected(self, client, breach_index, test_user_data):
+        """Test registering with a breached password fails validation."""
+        response = client.post("/users", json={**test_user_data, "password": BREACHED[0]})
+        assert response.status_code == 422
+        assert "data breach" in response.text
+
+    def test_other_password_accepted(self, client, breach_index, test_user_data):
+        """Test a password absent from the index is accepted."""
+        response = client.post("/users", json=test_user_data)
+        assert response.status_code == 201
@@ -0,0 +1,88 @@
+import pytest
+from sqlalchemy import event
+from app.db import get_db, LazySession
+from app.main import app
+from app.models import User
+from tests.conftest import TestingSessionLocal, engine
+
+
+@pytest.fixture
+def session_log(client):
+    """Record every Session created and every pool checkout/checkin of the test engine."""
+    log = []
+
+    def factory():
+        log.append("session")
+        return TestingSessionLocal()
+
+    def override_get_db():
+        db = LazySession(factory)
+        try:
+            yield db
+        finally:
+            log.append("teardown")
+            db.close()
+
+    def on_checkout(*args):
+        log.append("checkout")
+
+    def on_checkin(*args):
+        log.append("checkin")
+
+    event.listen(engine, "checkout", on_checkout)
+    event.listen(engine, "checkin", on_checkin)
+    previous = app.dependency_overrides[get_db]
+    app.dependency_overrides[get_db] = override_get_db
+    yield log
+    app.dependency_overrides[get_db] = previous
+    event.remove(engine, "checkout", on_checkout)
+    event.remove(engine, "checkin", on_checkin)
+
+
+class TestLazySession:
+    """Test sessions are created on first use and released early."""
+
+    def test_unused_session_not_created(self):
+        """Test the proxy creates no Session until an attribute is used."""
+        created = []
+        db = LazySession(lambda: created.append(1) or TestingSessionLocal())
+        db.close()
+        assert created == []
+        assert not db.started
+
+    def test_reusable_after_close(self, client, create_test_user):
+        """Test the proxy checks out a new connection when used after close()."""
+        db = LazySession(TestingSessionLocal)
+        assert db.query(User).count() == 1
+        db.close()
+        assert db.query(User).count() == 1
+        db.close()
+
+    def test_rejected_request_skips_session(self, client, create_test_user, session_log):
+        """Test a request rejected by the token check never opens a session."""
+        response = client.get(f"/users/{create_test_user['id']}", headers={"Authorization": "Bearer invalid"})
+        assert response.status_code == 401
+        assert "session" not in session_log
+        assert "checkout" not in session_log
+
+    def test_connection_released_before_teardown(self, client, create_test_user, get_auth_token, session_log):
+        """Test get_user returns its connection before dependency teardown."""
+        response = client.get(f"/users/{create_test_user['id']}", headers={"Authorization": f"Bearer {get_auth_token}"})
+        assert response.status_code == 200
+        assert response.json()["id"] == create_test_user["id"]
+        assert session_log == ["session", "checkout", "checkin", "teardown"]
+
+    def test_login_releases_connection_during_password_check(self, client, create_test_user, test_user_data, session_log, monkeypatch):
+        """Test no connection is held while the password is verified."""
+        from app.routers import auth
+        verify = auth.verify_password
+
+        def checked_verify(*args):
+            session_log.append("verify_password")
+            return verify(*args)
+
+        monkeypatch.setattr(auth, "verify_password", checked_verify)
+        response = client.post("/login", json={"email": test_user_data["email"], "password": test_user_data["password"]})
+        assert response.status_code == 200
+        position = session_log.index("verify_password")
+        assert session_log[:position].count("checkout") == session_log[:position].count("checkin")
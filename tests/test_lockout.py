@@ -0,0 +1,104 @@
+import pytest
+from app.lockout import LoginLockout, lockout
+
+
+class TestLoginLockout:
+    """Test failed-login lockout."""
+
+    def test_account_locked_after_threshold(self, client, create_test_user, test_user_data, monkeypatch):
+        """Test login is rejected before password verification once the account is locked."""
+        for _ in range(lockout.threshold):
+            response = client.post("/login", json={"email": test_user_data["email"], "password": "wrongpassword"})
+            assert response.status_code == 401
+
+        calls = []
+        monkeypatch.setattr("app.routers.auth.verify_password", lambda *args: calls.append(args) or True)
+        response = client.post("/login", json={"email": test_user_data["email"], "password": test_user_data["password"]})
+        assert response.status_code == 429
+        assert "Too many failed login attempts" in response.json()["detail"]
+        assert int(response.headers["Retry-After"]) > 0
+        assert calls == []
+
+    def test_successful_login_resets_failures(self, client, create_test_user, test_user_data):
+        """Test a successful login clears the failure count."""
+        for _ in range(lockout.threshold - 1):
+            client.post("/login", json={"email": test_user_data["email"], "password": "wrongpassword"})
+        response = client.post("/login", json={"email": test_user_data["email"], "password": test_user_data["password"]})
+        assert response.status_code == 200
+
+        response = client.post("/login", json={"email": test_user_data["email"], "password": "wrongpassword"})
+        assert response.status_code == 401
+
+    def test_sliding_window(self):
+        """Test failures in the previous window count in proportion to the window overlap."""
+        tracker = LoginLockout(window=100, threshold=3, duration=60, state_file=None)
+        tracker.record_failure("a@example.com", now=10)
+        tracker.record_failure("a@example.com", now=20)
+        # Half of the previous window overlaps: 2 * 0.5 + 1 < 3
+        tracker.record_failure("a@example.com", now=150)
+        assert tracker.locked_for("a@example.com", now=150) == 0
+        # 2 * 0.45 + 2 < 3
+        tracker.record_failure("a@example.com", now=155)
+        assert tracker.locked_for("a@example.com", now=155) == 0
+        # 2 * 0.4 + 3 >= 3
+        tracker.record_failure("a@example.com", now=160)
+        assert tracker.locked_for("a@example.com", now=160) == pytest.approx(60)
+        assert tracker.locked_for("a@example.com", now=220) == 0
+
+    def test_old_failures_expire(self):
+        """Test failures older than the previous window are forgotten."""
+        tracker = LoginLockout(window=100, threshold=2, duration=60, state_file=None)
+        tracker.record_failure("a@example.com", now=10)
+        tracker.record_failure("a@example.com", now=250)
+        assert tracker.locked_for("a@example.com", now=250) == 0
+
+    def test_state_persisted_and_merged(self, tmp_path):
+        """Test state survives restarts and is merged across workers sharing the file."""
+        state_file = str(tmp_path / "lockout.state")
+        worker_a = LoginLockout(window=100, threshold=2, duration=60, state_file=state_file)
+        worker_b = LoginLockout(window=100, threshold=2, duration=60, state_file=state_file)
+        worker_a.record_failure("a@example.com", now=10)
+        worker_a.record_failure("a@example.com", now=11)
+        worker_b.record_failure("b@example.com", now=12)
+        worker_a.persist(now=12)
+        worker_b.persist(now=13)
+
+        assert worker_b.locked_for("a@example.com", now=13) > 0
+        restarted = LoginLockout(window=100, threshold=2, duration=60, state_file=state_file)
+        assert restarted.locked_for("a@example.com", now=13) > 0
+        restarted.record_failure("b@example.com", now=14)
+        assert restarted.locked_for("b@example.com", now=14) > 0
+
+    def test_expired_entries_pruned_without_state_file(self):
+        """Test failures for many emails are dropped once they expire, without persistence."""
+        tracker = LoginLockout(window=100, threshold=2, duration=1000, state_file=None, persist_interval=30)
+        tracker._last_prune = 0
+        for i in range(1000):
+            tracker.record_failure(f"user{i}@example.com", now=40)
+        tracker.record_failure("locked@example.com", now=40)
+        tracker.record_failure("locked@example.com", now=40)
+        assert len(tracker._entries) == 1001
+
+        # Two windows later, the next failure prunes everything but locked accounts.
+        tracker.record_failure("recent@example.com", now=250)
+        assert len(tracker._entries) == 2
+        assert tracker.locked_for("locked@example.com", now=250) > 0
+
+    def test_success_not_undone_by_state_file(self, tmp_path):
+        """Test failures already in the state file do not come back after a successful login."""
+        state_file = str(tmp_path / "lockout.state")
+        worker_a = LoginLockout(window=100, threshold=3, duration=60, state_file=state_file)
+        worker_a.record_failure("a@example.com", now=10)
+        worker_a.record_failure("a@example.com", now=11)
+        worker_a.persist(now=12)
+        worker_b = LoginLockout(window=100, threshold=3, duration=60, state_file=state_file)
+
+        worker_a.record_success("a@example.com", now=13)
+        worker_a.persist(now=14)
+        worker_a.record_failure("a@example.com", now=15)
+        assert worker_a.locked_for("a@example.com", now=15) == 0
+
+        # A worker that saw the old failures adopts the clear on its next merge.
+        worker_b.persist(now=16)
+        worker_b.record_failure("a@example.com", now=17)
+        assert worker_b.locked_for("a@example.com", now=17) == 0
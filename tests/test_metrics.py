@@ -0,0 +1,153 @@
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+import pytest
+from app import metrics
+from app.metrics import Counter, Histogram, REGISTRY
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def sample(client, name, **labels):
+    """Return the value of one sample from /metrics, or 0 if it is absent."""
+    text = client.get("/metrics").text
+    label_text = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    pattern = "^" + re.escape(name + ("{" + label_text + "}" if labels else "")) + r" (\S+)"
+    match = re.search(pattern, text, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
+class TestMetricsEndpoint:
+    """Test the Prometheus /metrics endpoint."""
+
+    def test_metrics_exposition(self, client):
+        """Test /metrics is served in the Prometheus text format."""
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert "# TYPE iam_http_request_duration_seconds histogram" in response.text
+        assert "# TYPE iam_logins_total counter" in response.text
+
+    def test_disabled_by_default(self):
+        """Test the unauthenticated endpoint is only served when IAM_METRICS=1."""
+        code = (
+            "from app.main import app\n"
+            "print(any(route.path == '/metrics' for route in app.routes))\n"
+        )
+        env = {name: value for name, value in os.environ.items() if name != "IAM_METRICS"}
+        result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+        assert result.stdout.strip() == "False"
+
+    def test_login_results_counted(self, client, create_test_user, test_user_data):
+        """Test successful and failed logins are counted."""
+        success = sample(client, "iam_logins_total", result="success")
+        failure = sample(client, "iam_logins_total", result="failure")
+
+        client.post("/login", json={"email": test_user_data["email"], "password": "wrongpassword"})
+        client.post("/login", json={"email": test_user_data["email"], "password": test_user_data["password"]})
+
+        assert sample(client, "iam_logins_total", result="success") == success + 1
+        assert sample(client, "iam_logins_total", result="failure") == failure + 1
+
+    def test_invalid_token_and_forbidden_counted(self, client, create_test_user, create_test_user_2, get_auth_token_2):
+        """Test invalid tokens and 403s from authorization checks are counted."""
+        invalid = sample(client, "iam_invalid_tokens_total")
+        forbidden = sample(client, "iam_forbidden_total")
+
+        client.get(f"/users/{create_test_user['id']}", headers={"Authorization": "Bearer invalid_token"})
+        client.get(f"/users/{create_test_user['id']}", headers={"Authorization": f"Bearer {get_auth_token_2}"})
+
+        assert sample(client, "iam_invalid_tokens_total") == invalid + 1
+        assert sample(client, "iam_forbidden_total") == forbidden + 1
+
+    def test_request_latency_labelled_by_route_template(self, client, create_test_user, get_auth_token):
+        """Test request latency uses the route template rather than the raw path."""
+        client.get(f"/users/{create_test_user['id']}", headers={"Authorization": f"Bearer {get_auth_token}"})
+        text = client.get("/metrics").text
+        assert 'iam_http_request_duration_seconds_count{method="GET",route="/users/{user_id}",status="200"}' in text
+        assert create_test_user["id"] not in text
+
+    def test_stage_and_query_timings(self, client, get_auth_token):
+        """Test security stages and DB queries are timed."""
+        text = client.get("/metrics").text
+        for stage in ["hash_password", "verify_password", "create_access_token"]:
+            assert f'iam_stage_duration_seconds_count{{stage="{stage}"}}' in text
+        assert 'iam_db_query_duration_seconds_count{operation="select"}' in text
+        assert 'iam_db_query_duration_seconds_count{operation="insert"}' in text
+
+
+class TestMetricPrimitives:
+    """Test counters and histograms."""
+
+    @pytest.fixture(autouse=True)
+    def isolated_registry(self, monkeypatch):
+        monkeypatch.setattr(metrics, "REGISTRY", [])
+
+    def test_counter_sharded_per_thread(self):
+        """Test concurrent increments from many threads are never lost."""
+        counter = Counter("test_total", "Test counter.")
+
+        def work():
+            for _ in range(10000):
+                counter.inc()
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert counter.collect() == {(): 80000}
+
+    def test_histogram_rendering(self):
+        """Test histogram buckets are rendered cumulatively."""
+        histogram = Histogram("test_seconds", "Test histogram.", ("stage",), buckets=(0.1, 1.0))
+        histogram.observe(0.05, "a")
+        histogram.observe(0.1, "a")
+        histogram.observe(5.0, "a")
+        text = metrics.render()
+        assert 'test_seconds_bucket{stage="a",le="0.1"} 2' in text
+        assert 'test_seconds_bucket{stage="a",le="1.0"} 2' in text
+        assert 'test_seconds_bucket{stage="a",le="+Inf"} 3' in text
+        assert 'test_seconds_count{stage="a"} 3' in text
+
+    def test_multiprocess_snapshots_merged(self, tmp_path, monkeypatch):
+        """Test values written by other workers are summed into this worker's output."""
+        counter = Counter("test_total", "Test counter.", ("result",))
+        monkeypatch.setattr(metrics, "METRICS_MULTIPROC_DIR", str(tmp_path))
+        (tmp_path / f"{os.getppid()}-a.json").write_text('{"test_total": [[["ok"], 5]]}')
+        counter.inc("ok", amount=2)
+        assert 'test_total{result="ok"} 7' in metrics.render()
+
+    def test_snapshots_of_gone_workers_ignored(self, tmp_path, monkeypatch):
+        """Test snapshots of exited workers, and stale ones whose pid was reused, are not summed."""
+        counter = Counter("test_total", "Test counter.", ("result",))
+        monkeypatch.setattr(metrics, "METRICS_MULTIPROC_DIR", str(tmp_path))
+        exited = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True, text=True, check=True)
+        (tmp_path / f"{exited.stdout.strip()}-a.json").write_text('{"test_total": [[["ok"], 5]]}')
+        stale = tmp_path / f"{os.getppid()}-b.json"
+        stale.write_text('{"test_total": [[["ok"], 11]]}')
+        old = time.time() - 10 * metrics.METRICS_FLUSH_INTERVAL_SECONDS
+        os.utime(stale, (old, old))
+        counter.inc("ok", amount=2)
+        assert 'test_total{result="ok"} 2' in metrics.render()
+
+    def test_snapshot_removed_at_shutdown(self, tmp_path, monkeypatch):
+        """Test a worker's snapshot file is named uniquely and removed when it stops."""
+        monkeypatch.setattr(metrics, "METRICS_MULTIPROC_DIR", str(tmp_path))
+        metrics.start_snapshot_thread()
+        try:
+            assert _wait_for(lambda: list(tmp_path.glob("*.json")))
+            [path] = tmp_path.glob("*.json")
+            pid, unique = path.stem.split("-")
+            assert int(pid) == os.getpid() and unique
+        finally:
+            metrics.stop_snapshot_thread()
+        assert list(tmp_path.iterdir()) == []
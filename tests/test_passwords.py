@@ -0,0 +1,144 @@
+import uuid
+import pytest
+from sqlalchemy import select
+from app.__main__ import main
+from app.calibrate import _largest_within
+from app.db import get_db
+from app.main import app
+from app.metrics import PASSWORD_REHASHES
+from app.models import User
+from app.routers.auth import _rehash_password
+from app.security import get_pwd_context, hash_password, password_needs_update
+from tests.conftest import TestingSessionLocal
+
+
+@pytest.fixture
+def password_settings(monkeypatch):
+    """Change the password hashing settings for the duration of a test."""
+    def configure(**settings):
+        for name, value in settings.items():
+            monkeypatch.setattr(f"app.security.{name}", value)
+        get_pwd_context.cache_clear()
+    yield configure
+    get_pwd_context.cache_clear()
+
+
+def _stored_hash(email):
+    with TestingSessionLocal() as db:
+        return db.scalar(select(User.password_hash).where(User.email == email))
+
+
+def _rehashes():
+    return sum(PASSWORD_REHASHES.collect().values())
+
+
+class TestPasswordHashing:
+    """Test configurable password hashing and rehash on login."""
+
+    def test_cost_change_needs_update(self, password_settings):
+        """Test hashes with another bcrypt cost are flagged for rehashing."""
+        password_settings(BCRYPT_ROUNDS=5)
+        old = hash_password("xF0r456@~cwT")
+        assert old.startswith("$2b$05$")
+        assert not password_needs_update(old)
+        password_settings(BCRYPT_ROUNDS=4)
+        assert password_needs_update(old)
+
+    def test_argon2_scheme(self, password_settings):
+        """Test argon2id hashes new passwords and bcrypt hashes still verify."""
+        pytest.importorskip("argon2")
+        password_settings(BCRYPT_ROUNDS=4)
+        bcrypt_hash = hash_password("xF0r456@~cwT")
+        password_settings(PASSWORD_SCHEME="argon2", ARGON2_TIME_COST=1, ARGON2_MEMORY_KIB=1024, ARGON2_PARALLELISM=1)
+        argon2_hash = hash_password("xF0r456@~cwT")
+        assert argon2_hash.startswith("$argon2id$")
+        assert "m=1024,t=1,p=1" in argon2_hash
+        assert get_pwd_context().verify("xF0r456@~cwT", bcrypt_hash)
+        assert password_needs_update(bcrypt_hash)
+        assert not password_needs_update(argon2_hash)
+
+    def test_unsupported_scheme(self, password_settings):
+        """Test an unknown scheme is refused."""
+        password_settings(PASSWORD_SCHEME="md5_crypt")
+        with pytest.raises(ValueError):
+            get_pwd_context()
+
+    def test_login_rehashes_outdated_hash(self, client, create_test_user, test_user_data, password_settings):
+        """Test a successful login upgrades the stored hash in the background."""
+        before = _stored_hash(test_user_data["email"])
+        rehashes = _rehashes()
+        password_settings(BCRYPT_ROUNDS=4)
+
+        response = client.post("/login", json={"email": test_user_data["email"], "password": test_user_data["password"]})
+        assert response.status_code == 200
+        after = _stored_hash(test_user_data["email"])
+        assert after != before
+        assert after.startswith("$2b$04$")
+        assert _rehashes() == rehashes + 1
+
+        # The upgraded hash verifies and is not rehashed again.
+        response = client.post("/login", json={"email": test_user_data["email"], "password": test_user_data["password"]})
+        assert response.status_code == 200
+        assert _stored_hash(test_user_data["email"]) == after
+
+    def test_rehash_with_plain_session_override(self, client, create_test_user, test_user_data, password_settings):
+        """Test the background rehash also works when get_db is overridden with a plain Session."""
+        def override_get_db():
+            with TestingSessionLocal() as db:
+                yield db
+
+        previous = app.dependency_overrides[get_db]
+        app.dependency_overrides[get_db] = override_get_db
+        try:
+            before = _stored_hash(test_user_data["email"])
+            password_settings(BCRYPT_ROUNDS=4)
+            response = client.post("/login", json={"email": test_user_data["email"], "password": test_user_data["password"]})
+        finally:
+            app.dependency_overrides[get_db] = previous
+        assert response.status_code == 200
+        assert _stored_hash(test_user_data["email"]) not in (before, None)
+
+    def test_failed_login_does_not_rehash(self, client, create_test_user, test_user_data, password_settings):
+        """Test nothing is rehashed when the password is wrong."""
+        before = _stored_hash(test_user_data["email"])
+        password_settings(BCRYPT_ROUNDS=4)
+        response = client.post("/login", json={"email": test_user_data["email"], "password": "wrongpassword"})
+        assert response.status_code == 401
+        assert _stored_hash(test_user_data["email"]) == before
+
+    def test_rehash_keeps_concurrent_password_change(self, client, create_test_user, test_user_data, password_settings):
+        """Test a rehash does not overwrite a hash that changed since it was verified."""
+        password_settings(BCRYPT_ROUNDS=4)
+        current = _stored_hash(test_user_data["email"])
+        _rehash_password(TestingSessionLocal, uuid.UUID(create_test_user["id"]), test_user_data["password"], "$2b$12$stale")
+        assert _stored_hash(test_user_data["email"]) == current
+
+
+class TestHashCalibration:
+    """Test the hash cost calibration tool."""
+
+    def test_picks_largest_cost_within_budget(self):
+        """Test the largest cost within the target is chosen and measuring stops past it."""
+        measured = []
+
+        def measure(cost):
+            measured.append(cost)
+            return 0.001 * 2 ** cost
+
+        cost, measurements = _largest_within(measure, range(4, 20), target_seconds=0.1)
+        assert cost == 6
+        assert measured == [4, 5, 6, 7]
+        assert measurements[-1] == (7, pytest.approx(0.128))
+
+    def test_minimum_cost_when_budget_too_small(self):
+        """Test the minimum cost is kept even if it exceeds the target."""
+        cost, _ = _largest_within(lambda cost: 1.0, range(10, 20), target_seconds=0.1)
+        assert cost == 10
+
+    def test_command_prints_env_settings(self, monkeypatch, capsys):
+        """Test calibrate-hash prints settings on stdout and measurements on stderr."""
+        monkeypatch.setattr("app.calibrate.calibrate_bcrypt", lambda target, samples: (11, [(10, 0.05), (11, 0.1), (12, 0.2)]))
+        assert main(["calibrate-hash", "--target-ms", "150", "--scheme", "bcrypt"]) == 0
+        out, err = capsys.readouterr()
+        assert out.splitlines() == ["IAM_PASSWORD_SCHEME=bcrypt", "IAM_BCRYPT_ROUNDS=11"]
+        assert "cost=12: 200.0ms" in err
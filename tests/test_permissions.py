@@ -0,0 +1,102 @@
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from fastapi import HTTPException
+from jose import jwt
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from app.db import create_db_engine, init_db
+from app.models import Permission, PolicyVersion, RolePermission
+from app.permissions import Policy, DEFAULT_ROLE_PERMISSIONS, PERMISSION_BITS, policy_store, seed_default_policy, grant_permission, revoke_permission
+from app.security import TokenClaims, require_permission
+from tests.conftest import TestingSessionLocal
+
+
+@pytest.fixture
+def policy_db(client, monkeypatch):
+    """Seeded policy tables in the test database; the worker's policy is restored afterwards."""
+    monkeypatch.setattr(policy_store, "policy", policy_store.policy)
+    db = TestingSessionLocal()
+    seed_default_policy(db)
+    policy_store.load(db)
+    yield db
+    db.close()
+
+
+class TestPermissions:
+    """Test the compiled permission policy."""
+
+    def test_token_carries_compiled_permissions(self, client, get_auth_token, get_admin_token):
+        """Test tokens embed the policy version and the role's permission bitset."""
+        policy = policy_store.policy
+        user_claims = jwt.get_unverified_claims(get_auth_token)
+        admin_claims = jwt.get_unverified_claims(get_admin_token)
+        assert user_claims["prm"] == [policy.version, policy.mask("users:read:self")]
+        assert admin_claims["prm"] == [policy.version, policy.mask("users:read:self", "users:read:any", "admin:profile")]
+
+    def test_permission_check_without_db(self):
+        """Test route dependencies decide from the claims alone."""
+        dependency = require_permission("users:read:any")
+        policy = policy_store.policy
+        admin = TokenClaims(uuid.uuid4(), "admin", policy.role_mask("admin"), {})
+        user = TokenClaims(uuid.uuid4(), "user", policy.role_mask("user"), {})
+
+        assert dependency(claims=admin) is admin
+        with pytest.raises(HTTPException) as excinfo:
+            dependency(claims=user)
+        assert excinfo.value.status_code == 403
+
+    def test_stale_claim_recomputed_from_role(self):
+        """Test a claim from another policy version is recomputed from the current policy."""
+        policy = policy_store.policy
+        assert policy_store.permissions_from_claim([policy.version, 0b111], "user") == 0b111
+        assert policy_store.permissions_from_claim([policy.version + 100, 0b111], "user") == policy.role_mask("user")
+        assert policy_store.permissions_from_claim(None, "admin") == policy.role_mask("admin")
+
+    def test_unknown_role_has_no_permissions(self):
+        """Test roles missing from the policy get an empty permission set."""
+        assert Policy(1, PERMISSION_BITS, {"user": ["users:read:self"]}).role_mask("auditor") == 0
+
+    def test_policy_change_applies_to_live_tokens(self, client, policy_db, create_test_user, get_auth_token):
+        """Test revoking and granting through the versioned policy table takes effect without new tokens."""
+        url = f"/users/{create_test_user['id']}"
+        headers = {"Authorization": f"Bearer {get_auth_token}"}
+        assert client.get(url, headers=headers).status_code == 200
+
+        version = revoke_permission(policy_db, "user", "users:read:self")
+        assert policy_store.refresh(policy_db) is True
+        assert policy_store.policy.version == version
+        assert client.get(url, headers=headers).status_code == 403
+
+        grant_permission(policy_db, "user", "users:read:self")
+        assert policy_store.refresh(policy_db) is True
+        assert client.get(url, headers=headers).status_code == 200
+        assert policy_store.refresh(policy_db) is False
+
+    def test_grant_unknown_permission_rejected(self, policy_db):
+        """Test only permissions registered in the policy table can be granted."""
+        with pytest.raises(ValueError):
+            grant_permission(policy_db, "user", "users:delete:any")
+
+
+class TestPolicySeeding:
+    """Test seeding the default policy into a fresh database."""
+
+    def test_concurrent_init(self, tmp_path):
+        """Test several workers initialising the same fresh database at once all succeed."""
+        url = f"sqlite:///{tmp_path}/fresh.db"
+        engines = [create_db_engine(url) for _ in range(8)]
+        barrier = threading.Barrier(len(engines))
+
+        def start(engine):
+            barrier.wait()
+            init_db("create", bind=engine, shards=[])
+
+        with ThreadPoolExecutor(len(engines)) as pool:
+            list(pool.map(start, engines))
+        with Session(engines[0]) as db:
+            assert db.scalar(select(PolicyVersion.version)) == 1
+            assert db.scalar(select(func.count()).select_from(Permission)) == len(PERMISSION_BITS)
+            seed_default_policy(db)
+            assert db.scalar(select(func.count()).select_from(RolePermission)) == sum(map(len, DEFAULT_ROLE_PERMISSIONS.values()))
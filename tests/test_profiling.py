@@ -0,0 +1,121 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.profiler import SamplingProfiler
+from app.timing import ServerTimingMiddleware
+
+
+@pytest.fixture
+def timed_client(client):
+    """Client for the app wrapped in the Server-Timing middleware."""
+    with TestClient(ServerTimingMiddleware(app)) as test_client:
+        yield test_client
+
+
+def parse_server_timing(header):
+    stages = {}
+    for part in header.split(","):
+        name, duration = part.strip().split(";dur=")
+        stages[name] = float(duration)
+    return stages
+
+
+class TestServerTiming:
+    """Test Server-Timing response headers."""
+
+    def test_login_stage_breakdown(self, timed_client, create_test_user, test_user_data):
+        """Test the login response reports bcrypt, signing, DB and audit timings."""
+        response = timed_client.post("/login", json={
+            "email": test_user_data["email"],
+            "password": test_user_data["password"]
+        })
+        assert response.status_code == 200
+
+        stages = parse_server_timing(response.headers["Server-Timing"])
+        for stage in ["verify_password", "create_access_token", "db_select", "db_update", "db_commit", "audit", "total"]:
+            assert stage in stages
+        assert stages["total"] >= stages["verify_password"]
+
+    def test_db_stages_without_metrics(self):
+        """Test queries are still timed for Server-Timing when the metrics endpoint is disabled."""
+        code = (
+            "import app.main\n"
+            "from sqlalchemy import event\n"
+            "from sqlalchemy.engine import Engine\n"
+            "from app.metrics import _before_cursor_execute\n"
+            "print(event.contains(Engine, 'before_cursor_execute', _before_cursor_execute))\n"
+        )
+        env = dict(os.environ, IAM_METRICS="0", IAM_SERVER_TIMING="1")
+        result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+        assert result.stdout.strip() == "True"
+
+    def test_disabled_by_default(self, client):
+        """Test no header is added unless Server-Timing is enabled."""
+        response = client.get("/healthz")
+        assert "Server-Timing" not in response.headers
+
+
+class TestProfiler:
+    """Test the on-demand sampling profiler."""
+
+    def test_profile_requires_admin(self, client, get_auth_token, monkeypatch):
+        """Test non-admins cannot start a capture."""
+        monkeypatch.setattr("app.routers.admin.PROFILER_ENABLED", True)
+        response = client.post("/admin/profile?seconds=1", headers={"Authorization": f"Bearer {get_auth_token}"})
+        assert response.status_code == 403
+
+    def test_profile_disabled(self, client, get_admin_token):
+        """Test the trigger is unavailable unless enabled."""
+        response = client.post("/admin/profile?seconds=1", headers={"Authorization": f"Bearer {get_admin_token}"})
+        assert response.status_code == 404
+
+    def test_profile_time_boxed(self, client, get_admin_token, monkeypatch):
+        """Test capture duration is capped."""
+        monkeypatch.setattr("app.routers.admin.PROFILER_ENABLED", True)
+        response = client.post("/admin/profile?seconds=3600", headers={"Authorization": f"Bearer {get_admin_token}"})
+        assert response.status_code == 422
+
+    def test_admin_capture_written(self, client, get_admin_token, monkeypatch, tmp_path):
+        """Test an admin capture writes a collapsed stack profile."""
+        monkeypatch.setattr("app.routers.admin.PROFILER_ENABLED", True)
+        monkeypatch.setattr("app.routers.admin.profiler", SamplingProfiler(output_dir=str(tmp_path), interval=0.001))
+
+        response = client.post("/admin/profile?seconds=0.2", headers={"Authorization": f"Bearer {get_admin_token}"})
+        assert response.status_code == 202
+        path = response.json()["profile_file"]
+
+        busy = client.post("/admin/profile?seconds=0.2", headers={"Authorization": f"Bearer {get_admin_token}"})
+        assert busy.status_code == 409
+
+        deadline = time.monotonic() + 5
+        while not os.path.exists(path) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        with open(path) as f:
+            lines = f.read().splitlines()
+        assert lines
+        for line in lines:
+            stack, count = line.rsplit(" ", 1)
+            assert stack.split(";")[0]
+            assert int(count) > 0
+
+    def test_sample_collapsed_stacks(self):
+        """Test samples include the stacks of other threads."""
+        stop = threading.Event()
+
+        def busy_worker():
+            while not stop.is_set():
+                sum(range(1000))
+
+        thread = threading.Thread(target=busy_worker, name="busy")
+        thread.start()
+        try:
+            stacks = SamplingProfiler(interval=0.001).sample(0.1)
+        finally:
+            stop.set()
+            thread.join()
+        assert any(stack.startswith("busy;") and "busy_worker" in stack for stack in stacks)
@@ -0,0 +1,140 @@
+import json
+import sqlite3
+import pytest
+from app.ratelimit import MemoryBucketStore, RateLimiter, SQLiteBucketStore, limiter
+
+
+@pytest.fixture
+def tight_limits(monkeypatch):
+    """Shrink the limits so a handful of requests exhausts them."""
+    monkeypatch.setattr(limiter, "per_ip", (0.01, 3))
+    monkeypatch.setattr(limiter, "per_email", (0.01, 2))
+
+
+class TestRateLimiting:
+    """Test in-process rate limiting of credential endpoints."""
+
+    def test_ip_limit_returns_429_with_retry_after(self, client, tight_limits):
+        """Test requests beyond the per-IP burst are rejected with Retry-After."""
+        for i in range(3):
+            response = client.post("/login", json={"email": f"user{i}@example.com", "password": "x"})
+            assert response.status_code == 401
+
+        response = client.post("/login", json={"email": "user9@example.com", "password": "x"})
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+        assert response.json()["detail"] == "Too many requests"
+        assert limiter.counters["limited_ip"] == 1
+
+    def test_email_limit_is_normalized(self, client, tight_limits):
+        """Test the per-email bucket is shared by case and whitespace variants."""
+        for email in ["carol@example.com", "  CAROL@example.com"]:
+            assert client.post("/login", json={"email": email, "password": "x"}).status_code == 401
+
+        response = client.post("/login", json={"email": "Carol@Example.com", "password": "x"})
+        assert response.status_code == 429
+        assert limiter.counters["limited_email"] == 1
+
+    def test_limited_requests_skip_password_hashing(self, client, tight_limits, test_user_data, monkeypatch):
+        """Test rejected registrations never reach bcrypt."""
+        calls = []
+        monkeypatch.setattr("app.routers.auth.hash_password", lambda password: calls.append(password) or "hash")
+        for _ in range(3):
+            client.post("/users", json=test_user_data)
+        assert len(calls) == 1
+
+        response = client.post("/users", json=test_user_data)
+        assert response.status_code == 429
+        assert len(calls) == 1
+
+    def test_large_body_skips_email_check(self, client, tight_limits, monkeypatch):
+        """Test bodies over the peek limit are passed on whole without a per-email check."""
+        monkeypatch.setattr("app.ratelimit.RATE_LIMIT_MAX_PEEK_BYTES", 64)
+        body = json.dumps({"email": "dave@example.com", "password": "x" * 200})
+        for _ in range(3):
+            response = client.post("/login", content=body, headers={"content-type": "application/json"})
+            assert response.status_code == 401
+        assert limiter.counters["limited_email"] == 0
+
+    def test_sqlite_store_through_middleware(self, client, tight_limits, tmp_path, monkeypatch):
+        """Test the shared SQLite store limits requests when checked from the threadpool."""
+        monkeypatch.setattr(limiter, "store", SQLiteBucketStore(str(tmp_path / "buckets.db")))
+        for i in range(3):
+            assert client.post("/login", json={"email": f"user{i}@example.com", "password": "x"}).status_code == 401
+        assert client.post("/login", json={"email": "user9@example.com", "password": "x"}).status_code == 429
+
+    def test_other_routes_not_limited(self, client, tight_limits):
+        """Test routes outside the credential endpoints are not limited."""
+        for _ in range(10):
+            assert client.get("/healthz").status_code == 200
+
+
+class TestBucketStores:
+    """Test token bucket stores."""
+
+    def test_memory_bucket_refills(self):
+        """Test tokens refill at the configured rate."""
+        store = MemoryBucketStore()
+        limit = (1.0, 2)
+        assert store.take("k", limit, now=0.0) == 0
+        assert store.take("k", limit, now=0.0) == 0
+        assert store.take("k", limit, now=0.0) == pytest.approx(1.0)
+        assert store.take("k", limit, now=1.0) == 0
+
+    def test_sqlite_store_shared_between_instances(self, tmp_path):
+        """Test buckets in the SQLite store are shared by separate store instances (workers)."""
+        path = str(tmp_path / "buckets.db")
+        worker_a, worker_b = SQLiteBucketStore(path), SQLiteBucketStore(path)
+        limit = (0.01, 2)
+        assert worker_a.take("k", limit, now=0.0) == 0
+        assert worker_b.take("k", limit, now=0.0) == 0
+        assert worker_a.take("k", limit, now=0.0) > 0
+
+    def test_sqlite_store_prunes_refilled_buckets(self, tmp_path):
+        """Test refilled buckets are deleted periodically and drained ones are kept."""
+        store = SQLiteBucketStore(str(tmp_path / "buckets.db"))
+        store.take("fast", (1.0, 2), now=1000.0)
+        for _ in range(3):
+            store.take("slow", (0.001, 2), now=1000.0)
+        # "fast" is full again a second later; "slow" stays short of tokens for much longer.
+        store.take("new", (1.0, 2), now=1000.0 + store.PRUNE_INTERVAL)
+        keys = {row[0] for row in store._connect().execute("SELECT key FROM buckets")}
+        assert keys == {"slow", "new"}
+        assert store.take("slow", (0.001, 2), now=1000.0 + store.PRUNE_INTERVAL) > 0
+
+    def test_sqlite_store_clock_stepped_back(self, tmp_path):
+        """Test a wall clock that steps backwards refills nothing instead of draining the bucket."""
+        store = SQLiteBucketStore(str(tmp_path / "buckets.db"))
+        limit = (1.0, 2)
+        assert store.take("k", limit, now=1000.0) == 0
+        assert store.take("k", limit, now=500.0) == 0
+        assert store.take("k", limit, now=500.0) == pytest.approx(1.0)
+
+    def test_memory_eviction_keeps_drained_buckets(self):
+        """Test filling the store with new keys does not reset a bucket that is being limited."""
+        store = MemoryBucketStore()
+        store.MAX_BUCKETS = 100
+        limit = (0.01, 3)
+        for _ in range(3):
+            store.take("email:victim", limit, now=0.0)
+        assert store.take("email:victim", limit, now=0.0) > 0
+        for i in range(1000):
+            store.take(f"email:spray{i}", limit, now=1.0)
+        assert len(store._buckets) <= 100
+        assert store.take("email:victim", limit, now=1.0) > 0
+
+    def test_locked_sqlite_store_fails_open(self, tmp_path):
+        """Test a check that cannot get the store's lock is allowed and counted, not an error."""
+        path = str(tmp_path / "buckets.db")
+        tracker = RateLimiter(SQLiteBucketStore(path, timeout=0.01), per_ip=(0.01, 1))
+        holder = sqlite3.connect(path, isolation_level=None)
+        holder.execute("BEGIN IMMEDIATE")
+        try:
+            assert tracker.check_ip("10.0.0.1") == 0
+            assert tracker.check_ip("10.0.0.1") == 0
+        finally:
+            holder.execute("ROLLBACK")
+            holder.close()
+        assert tracker.counters["store_error"] == 2
+        assert tracker.check_ip("10.0.0.1") == 0
+        assert tracker.check_ip("10.0.0.1") > 0
@@ -0,0 +1,97 @@
+import argparse
+import os
+import pytest
+from fastapi.testclient import TestClient
+from app.__main__ import main
+from app.config import db_init_mode
+from app.server import add_serve_arguments, default_workers
+
+
+def parse_serve_args(*argv):
+    parser = argparse.ArgumentParser()
+    add_serve_arguments(parser)
+    return parser.parse_args(list(argv))
+
+
+@pytest.fixture
+def init_db_calls(monkeypatch):
+    """Records init_db calls instead of touching the configured DB, and restores IAM_DB_INIT_MODE."""
+    calls = []
+
+    def record(mode=None):
+        calls.append(mode or db_init_mode())
+
+    monkeypatch.setattr("app.db.init_db", record)
+    monkeypatch.setattr("app.main.init_db", record)
+    monkeypatch.delenv("IAM_DB_INIT_MODE", raising=False)
+    return calls
+
+
+class TestServe:
+    """Test the production server entry point."""
+
+    def test_serve_defaults(self):
+        """Test worker count defaults to the usable core count with uvloop and httptools."""
+        args = parse_serve_args()
+        assert args.workers == default_workers() >= 1
+        assert args.loop == "uvloop"
+        assert args.http == "httptools"
+        assert args.warmup is True
+
+    def test_serve_passes_settings_to_uvicorn(self, monkeypatch, init_db_calls):
+        """Test serve forwards worker, backlog, keep-alive and drain settings to uvicorn."""
+        calls = []
+        monkeypatch.setattr("uvicorn.run", lambda app, **kwargs: calls.append((app, kwargs)))
+        monkeypatch.setenv("IAM_WARMUP", "0")
+
+        assert main(["serve", "--workers", "3", "--loop", "asyncio", "--http", "h11", "--backlog", "512", "--keep-alive", "10", "--graceful-timeout", "15"]) == 0
+        app, kwargs = calls[0]
+        assert app == "app.main:app"
+        assert kwargs["workers"] == 3
+        assert kwargs["loop"] == "asyncio"
+        assert kwargs["http"] == "h11"
+        assert kwargs["backlog"] == 512
+        assert kwargs["timeout_keep_alive"] == 10
+        assert kwargs["timeout_graceful_shutdown"] == 15
+        assert os.environ["IAM_WARMUP"] == "1"
+
+    def test_warmup(self):
+        """Test warmup loads keys, the bcrypt backend and a DB connection."""
+        from app.warmup import warmup
+        from app.config import get_signing_key
+        warmup()
+        assert get_signing_key.cache_info().currsize == 1
+
+    def test_in_process_worker_runs_warmup(self, monkeypatch, init_db_calls):
+        """Test serve --workers 1, which runs the app in this process, warms up unless told not to."""
+        warmups = []
+        monkeypatch.setattr("app.warmup.warmup", lambda: warmups.append(True))
+        monkeypatch.setenv("IAM_WARMUP", "0")
+
+        def run_in_process(app, **kwargs):
+            # Stand-in for uvicorn: start and stop the app's lifespan in this process.
+            from app.main import app as asgi_app
+            with TestClient(asgi_app):
+                pass
+
+        monkeypatch.setattr("uvicorn.run", run_in_process)
+        assert main(["serve", "--workers", "1", "--loop", "asyncio", "--http", "h11"]) == 0
+        assert warmups == [True]
+        assert main(["serve", "--workers", "1", "--loop", "asyncio", "--http", "h11", "--no-warmup"]) == 0
+        assert warmups == [True]
+
+    def test_db_initialised_once_before_workers(self, monkeypatch, init_db_calls):
+        """Test serve initialises the DB in the parent and starts the workers with IAM_DB_INIT_MODE=skip."""
+        worker_modes = []
+
+        def run_in_process(app, **kwargs):
+            worker_modes.append(os.environ["IAM_DB_INIT_MODE"])
+            from app.main import app as asgi_app
+            with TestClient(asgi_app):
+                pass
+
+        monkeypatch.setattr("uvicorn.run", run_in_process)
+        assert main(["serve", "--workers", "1", "--loop", "asyncio", "--http", "h11", "--no-warmup"]) == 0
+        assert worker_modes == ["skip"]
+        # The parent's call in the configured mode, then the worker's lifespan, which skips.
+        assert init_db_calls == ["create", "skip"]
@@ -0,0 +1,265 @@
+import datetime as dt
+import uuid
+import pytest
+from sqlalchemy import event, func, insert, select, update
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import Session
+from app.__main__ import main
+from app.db import LazySession, create_db_engine, get_db, init_db, shard_for, sharded_sessionmaker
+from app.main import app
+from app.models import User, UserDirectory
+from app.reshard import reshard
+from app.routers.auth import _rehash_password
+
+SHARDS = 3
+
+
+def _engines(tmp_path, count, prefix="shard"):
+    return [create_db_engine(f"sqlite:///{tmp_path}/{prefix}-{shard}.db") for shard in range(count)]
+
+
+def _user(index):
+    return User(
+        name=f"User {index}",
+        email=f"user{index}@example.com",
+        date_of_birth=dt.date(2000, 1, 1),
+        password_hash="$2b$04$notarealhash",
+        role="user",
+    )
+
+
+def _count_queries(engines):
+    """Counts statements run on each engine, in a list indexed like `engines`."""
+    counts = [0] * len(engines)
+    for index, engine in enumerate(engines):
+        def count(*args, index=index):
+            counts[index] += 1
+        event.listen(engine, "before_cursor_execute", count)
+    return counts
+
+
+def _emails(bind):
+    with bind.connect() as conn:
+        return set(conn.execute(select(User.email)).scalars())
+
+
+@pytest.fixture
+def sharded(tmp_path):
+    """A main DB and SHARDS user shards with their schema, and a session factory over them."""
+    primary = create_db_engine(f"sqlite:///{tmp_path}/main.db")
+    shards = _engines(tmp_path, SHARDS)
+    init_db("create", bind=primary, shards=shards)
+    return primary, shards, sharded_sessionmaker(primary, shards)
+
+
+@pytest.fixture
+def sharded_client(client, sharded):
+    """The test client with handlers using the sharded session factory."""
+    factory = sharded[2]
+
+    def override_get_db():
+        db = LazySession(factory)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    previous = app.dependency_overrides[get_db]
+    app.dependency_overrides[get_db] = override_get_db
+    yield client
+    app.dependency_overrides[get_db] = previous
+
+
+class TestShardedSessions:
+    """Test routing of user rows to their shard."""
+
+    def test_users_stored_in_their_shard(self, sharded):
+        """Test each user is written to the shard its id hashes to and indexed in the directory."""
+        primary, shards, factory = sharded
+        with factory() as db:
+            db.add_all([_user(i) for i in range(12)])
+            db.commit()
+            users = db.query(User).all()
+        assert len(users) == 12
+        for user in users:
+            assert user.email in _emails(shards[shard_for(user.id, SHARDS)])
+        assert sum(len(_emails(shard)) for shard in shards) == 12
+        with primary.connect() as conn:
+            directory = {row.email: (row.user_id, row.shard) for row in conn.execute(select(UserDirectory))}
+        assert directory == {user.email: (user.id, shard_for(user.id, SHARDS)) for user in users}
+
+    def test_lookups(self, sharded):
+        """Test lookups by id query only the user's shard, and by email the directory and that shard."""
+        primary, shards, factory = sharded
+        with factory() as db:
+            db.add_all([_user(i) for i in range(6)])
+            db.commit()
+        counts = _count_queries(shards)
+        primary_counts = _count_queries([primary])
+        with factory() as db:
+            user = db.query(User).filter(User.email == "user4@example.com").first()
+            assert user is not None
+            user_id = user.id
+        shard = shard_for(user_id, SHARDS)
+        assert counts == [1 if index == shard else 0 for index in range(SHARDS)]
+        assert primary_counts == [1]
+
+        counts[:] = [0] * SHARDS
+        with factory() as db:
+            assert db.query(User).filter(User.id == user_id).one().email == "user4@example.com"
+            db.expunge_all()
+            assert db.get(User, user_id).email == "user4@example.com"
+            db.execute(update(User).where(User.id == user_id).values(job_title="Engineer"))
+            db.commit()
+        assert counts == [3 if index == shard else 0 for index in range(SHARDS)]
+
+        with factory() as db:
+            assert db.query(User).filter(User.email == "nobody@example.com").first() is None
+            assert db.query(User).filter(User.id == uuid.uuid4()).first() is None
+            assert len(db.query(User).filter(User.name.like("User %")).all()) == 6
+
+    def test_delete_removes_directory_entry(self, sharded):
+        """Test deleting a user frees its email."""
+        primary, _, factory = sharded
+        with factory() as db:
+            user = _user(1)
+            db.add(user)
+            db.commit()
+            db.delete(user)
+            db.commit()
+        with primary.connect() as conn:
+            assert conn.execute(select(func.count()).select_from(UserDirectory)).scalar() == 0
+
+    def test_directory_written_after_shard_commit(self, sharded):
+        """Test the directory entry is written in its own transaction, retried while the main DB is locked."""
+        primary, shards, factory = sharded
+        failures = []
+
+        def locked_once(conn, cursor, statement, *args):
+            if statement.startswith("INSERT INTO user_directory") and not failures:
+                # The user row must already be committed when the directory is written.
+                assert sum(len(_emails(shard)) for shard in shards) == 1
+                failures.append(statement)
+                raise OperationalError(statement, None, Exception("database is locked"))
+
+        event.listen(primary, "before_cursor_execute", locked_once)
+        with factory() as db:
+            db.add(_user(1))
+            db.commit()
+        assert len(failures) == 1
+        with primary.connect() as conn:
+            assert conn.execute(select(UserDirectory.email)).scalars().all() == ["user1@example.com"]
+
+    def test_directory_conflict_undoes_user(self, sharded):
+        """Test a user whose email is already in the directory is removed again and commit raises."""
+        primary, shards, factory = sharded
+        taken = uuid.uuid4()
+        with primary.begin() as conn:
+            conn.execute(insert(UserDirectory).values(email="user1@example.com", user_id=taken, shard=0))
+        with factory() as db:
+            db.add(_user(1))
+            with pytest.raises(IntegrityError):
+                db.commit()
+        assert all(not _emails(shard) for shard in shards)
+        with primary.connect() as conn:
+            assert conn.execute(select(UserDirectory.user_id)).scalars().all() == [taken]
+
+    def test_rehash_updates_shard(self, sharded):
+        """Test the conditional hash upgrade after login reaches the user's shard."""
+        _, _, factory = sharded
+        with factory() as db:
+            user = _user(1)
+            db.add(user)
+            db.commit()
+            user_id, old_hash = user.id, user.password_hash
+        _rehash_password(factory, user_id, "xF0r456@~cwT", old_hash)
+        with factory() as db:
+            assert db.get(User, user_id).password_hash != old_hash
+
+    def test_api(self, sharded_client, test_user_data, sharded):
+        """Test registration, duplicate detection, login and user lookup over the API each touch one shard."""
+        shards = sharded[1]
+        response = sharded_client.post("/users", json=test_user_data)
+        assert response.status_code == 201
+        user_id = response.json()["id"]
+        shard = shard_for(uuid.UUID(user_id), SHARDS)
+        assert test_user_data["email"] in _emails(shards[shard])
+
+        counts = _count_queries(shards)
+        assert sharded_client.post("/users", json=test_user_data).status_code == 409
+        response = sharded_client.post("/login", json={"email": test_user_data["email"], "password": test_user_data["password"]})
+        assert response.status_code == 200
+        token = response.json()["access_token"]
+        response = sharded_client.get(f"/users/{user_id}", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200
+        assert response.json()["email"] == test_user_data["email"]
+        assert counts[shard] > 0
+        assert all(count == 0 for index, count in enumerate(counts) if index != shard)
+
+
+    def test_api_duplicates(self, sharded_client, test_user_data, sharded):
+        """Test a mixed-case duplicate and a directory conflict are rejected with 409, leaving no stray user."""
+        primary, shards, _ = sharded
+        assert sharded_client.post("/users", json=test_user_data).status_code == 201
+        response = sharded_client.post("/users", json={**test_user_data, "email": test_user_data["email"].upper()})
+        assert response.status_code == 409
+
+        # An email taken in the directory after the existence check, as by a concurrent registration.
+        with primary.begin() as conn:
+            conn.execute(insert(UserDirectory).values(email="racer@example.com", user_id=uuid.uuid4(), shard=0))
+        response = sharded_client.post("/users", json={**test_user_data, "email": "Racer@example.com"})
+        assert response.status_code == 409
+        assert sum(len(_emails(shard)) for shard in shards) == 1
+
+
+class TestReshard:
+    """Test the offline resharding tool."""
+
+    def test_reshard_preserves_users(self, tmp_path):
+        """Test moving users from the main DB to 3 shards, to 2 shards and back keeps every user."""
+        primary = create_db_engine(f"sqlite:///{tmp_path}/main.db")
+        init_db("create", bind=primary, shards=[])
+        with Session(primary) as db:
+            db.add_all([_user(i) for i in range(25)])
+            db.commit()
+        emails = _emails(primary)
+
+        three = _engines(tmp_path, 3)
+        assert reshard(primary, [], three, batch_size=4) == {"moved": 25, "indexed": 25}
+        assert _emails(primary) == set()
+        assert set().union(*map(_emails, three)) == emails
+
+        two = _engines(tmp_path, 2, prefix="two")
+        stats = reshard(primary, three, two, batch_size=4)
+        assert stats == {"moved": 25, "indexed": 25}
+        factory = sharded_sessionmaker(primary, two)
+        with factory() as db:
+            for email in emails:
+                user = db.query(User).filter(User.email == email).one()
+                assert email in _emails(two[shard_for(user.id, 2)])
+
+        # Running it again finds nothing to move.
+        assert reshard(primary, three, two)["moved"] == 0
+
+        assert reshard(primary, two, [])["moved"] == 25
+        assert _emails(primary) == emails
+        with primary.connect() as conn:
+            assert conn.execute(select(func.count()).select_from(UserDirectory)).scalar() == 0
+
+    def test_command(self, tmp_path, monkeypatch, capsys):
+        """Test the reshard command moves users from the configured shards and prints the new setting."""
+        primary = create_db_engine(f"sqlite:///{tmp_path}/main.db")
+        shards = _engines(tmp_path, 2)
+        init_db("create", bind=primary, shards=shards)
+        with sharded_sessionmaker(primary, shards)() as db:
+            db.add_all([_user(i) for i in range(5)])
+            db.commit()
+        monkeypatch.setattr("app.db.engine", primary)
+        monkeypatch.setattr("app.db.shard_engines", shards)
+
+        url = f"sqlite:///{tmp_path}/new-{{shard}}.db"
+        assert main(["reshard", "--shards", "4", "--shard-url", url]) == 0
+        out = capsys.readouterr().out
+        assert "Moved 5 users" in out
+        assert out.splitlines()[-1] == "IAM_DB_SHARDS=4"
+        assert sum(len(_emails(engine)) for engine in _engines(tmp_path, 4, prefix="new")) == 5
@@ -0,0 +1,177 @@
+import threading
+import time
+import uuid
+import pytest
+from fastapi import HTTPException
+from app import security
+from app.cache import SingleFlight, TTLCache
+from app.metrics import INVALID_TOKENS
+from app.security import create_access_token, decode_access_token, load_user, token_cache
+from tests.conftest import TestingSessionLocal
+
+CALLERS = 8
+
+
+def _run_concurrently(func, callers=CALLERS):
+    """Call func from several threads at once; returns results (or exceptions) in thread order."""
+    barrier = threading.Barrier(callers)
+    results = [None] * callers
+
+    def run(index):
+        barrier.wait()
+        try:
+            results[index] = func(index)
+        except Exception as exc:
+            results[index] = exc
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def _slow(func, calls, delay=0.2):
+    def wrapper(*args):
+        calls.append(args)
+        time.sleep(delay)
+        return func(*args)
+    return wrapper
+
+
+class TestSingleFlight:
+    """Test coalescing of concurrent identical calls."""
+
+    def test_concurrent_calls_share_one_execution(self):
+        """Test concurrent callers with one key run the function once and get its result."""
+        flight = SingleFlight()
+        calls = []
+        results = _run_concurrently(lambda i: flight.do("key", _slow(lambda: object(), calls)))
+        assert len(calls) == 1
+        assert len({id(result) for result, _ in results}) == 1
+        assert sorted(shared for _, shared in results) == [False] + [True] * (CALLERS - 1)
+        assert flight.shared == CALLERS - 1
+
+    def test_different_keys_run_separately(self):
+        """Test calls with different keys do not wait for each other."""
+        flight = SingleFlight()
+        calls = []
+        results = _run_concurrently(lambda i: flight.do(i, _slow(lambda: i, calls, delay=0.01)))
+        assert len(calls) == CALLERS
+        assert [result for result, _ in results] == list(range(CALLERS))
+
+    def test_exception_shared(self):
+        """Test every waiting caller gets the leader's exception, and the next call runs again."""
+        flight = SingleFlight()
+        calls = []
+
+        def fail():
+            raise ValueError("boom")
+
+        results = _run_concurrently(lambda i: flight.do("key", _slow(fail, calls)))
+        assert len(calls) == 1
+        assert all(isinstance(result, ValueError) for result in results)
+        assert flight.do("key", lambda: 42) == (42, False)
+
+
+class TestTTLCache:
+    """Test the bounded expiring cache."""
+
+    def test_expiry(self):
+        """Test entries are returned until they expire."""
+        cache = TTLCache(10)
+        cache.put("a", 1, expires_at=100)
+        assert cache.get("a", now=99) == 1
+        assert cache.get("a", now=100) is None
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_oldest_evicted_when_full(self):
+        """Test the oldest entry makes room for a new one."""
+        cache = TTLCache(2)
+        for key in "abc":
+            cache.put(key, key, expires_at=100)
+        assert len(cache) == 2
+        assert cache.get("a", now=0) is None
+        assert cache.get("c", now=0) == "c"
+
+    def test_disabled(self):
+        """Test a cache of size zero stores nothing."""
+        cache = TTLCache(0)
+        cache.put("a", 1, expires_at=100)
+        assert cache.get("a", now=0) is None
+
+
+class TestCoalescedVerification:
+    """Test token verification and user lookups are coalesced."""
+
+    def test_concurrent_verifications_coalesced(self, monkeypatch):
+        """Test parallel requests with one token check its signature once, then hit the cache."""
+        token_cache.clear()
+        token, _ = create_access_token(subject=uuid.uuid4(), role="user")
+        calls = []
+        monkeypatch.setattr(security, "_verify_token", _slow(security._verify_token, calls))
+
+        results = _run_concurrently(lambda i: decode_access_token(token))
+        assert len(calls) == 1
+        assert all(result is results[0] for result in results)
+
+        decode_access_token(token)
+        assert len(calls) == 1
+
+    def test_invalid_token_not_cached(self, monkeypatch):
+        """Test concurrent invalid tokens are all rejected and counted, and not cached."""
+        calls = []
+        monkeypatch.setattr(security, "_verify_token", _slow(security._verify_token, calls))
+        before = sum(INVALID_TOKENS.collect().values())
+
+        results = _run_concurrently(lambda i: decode_access_token("not.a.token"))
+        assert len(calls) == 1
+        assert all(isinstance(result, HTTPException) and result.status_code == 401 for result in results)
+        assert sum(INVALID_TOKENS.collect().values()) == before + CALLERS
+
+        with pytest.raises(HTTPException):
+            decode_access_token("not.a.token")
+        assert len(calls) == 2
+
+    def test_cache_lifetime(self, monkeypatch):
+        """Test cached claims last TOKEN_CACHE_SECONDS, and never past the token's expiry."""
+        token_cache.clear()
+        token, _ = create_access_token(subject=uuid.uuid4(), role="user")
+        claims = decode_access_token(token)
+        now = time.time()
+        assert token_cache.get(token, now=now + security.TOKEN_CACHE_SECONDS - 1) is claims
+        assert token_cache.get(token, now=now + security.TOKEN_CACHE_SECONDS + 1) is None
+
+        token_cache.clear()
+        monkeypatch.setattr(security, "TOKEN_CACHE_SECONDS", 10 ** 6)
+        claims = decode_access_token(token)
+        assert token_cache.get(token, now=claims["exp"] - 1) is claims
+        assert token_cache.get(token, now=claims["exp"]) is None
+
+    def test_concurrent_user_lookups_coalesced(self, client, create_test_user, monkeypatch):
+        """Test parallel lookups of one user run one query and return instances of each caller's session."""
+        user_id = uuid.UUID(create_test_user["id"])
+        calls = []
+        monkeypatch.setattr(security, "_query_user", _slow(security._query_user, calls))
+        sessions = [TestingSessionLocal() for _ in range(CALLERS)]
+        try:
+            users = _run_concurrently(lambda i: load_user(sessions[i], user_id))
+            assert len(calls) == 1
+            for session, user in zip(sessions, users):
+                assert user in session
+                assert user.email == create_test_user["email"]
+        finally:
+            for session in sessions:
+                session.close()
+
+    def test_concurrent_user_requests_share_lookup(self, client, create_test_user, get_auth_token, monkeypatch):
+        """Test parallel GET /users/{user_id} requests for one user run a single user query."""
+        calls = []
+        monkeypatch.setattr(security, "_query_user", _slow(security._query_user, calls))
+        headers = {"Authorization": f"Bearer {get_auth_token}"}
+
+        responses = _run_concurrently(lambda i: client.get(f"/users/{create_test_user['id']}", headers=headers))
+        assert [response.status_code for response in responses] == [200] * CALLERS
+        assert all(response.json()["email"] == create_test_user["email"] for response in responses)
+        assert len(calls) == 1
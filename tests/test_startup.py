@@ -0,0 +1,57 @@
+import json
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import sessionmaker
+from app import db as app_db
+from app.db import init_db, get_schema_version, SCHEMA_VERSION
+from app.main import app
+
+
+class TestStartup:
+    """Test cold start options."""
+
+    def test_init_db_stamps_schema_version(self, tmp_path):
+        """Test create mode builds the schema and records its version."""
+        engine = create_engine(f"sqlite:///{tmp_path / 'startup.db'}")
+        assert get_schema_version(engine) is None
+
+        init_db(mode="create", bind=engine)
+        assert "users" in inspect(engine).get_table_names()
+        assert get_schema_version(engine) == SCHEMA_VERSION
+
+    def test_init_db_auto_skips_current_schema(self, tmp_path, monkeypatch):
+        """Test auto mode skips create_all when the schema version is current."""
+        engine = create_engine(f"sqlite:///{tmp_path / 'startup.db'}")
+        init_db(mode="auto", bind=engine)
+
+        calls = []
+        monkeypatch.setattr(app_db.Base.metadata, "create_all", lambda **kwargs: calls.append(kwargs))
+        init_db(mode="auto", bind=engine)
+        assert calls == []
+
+    def test_init_db_skip_mode(self, tmp_path):
+        """Test skip mode never touches the schema."""
+        engine = create_engine(f"sqlite:///{tmp_path / 'startup.db'}")
+        init_db(mode="skip", bind=engine)
+        assert inspect(engine).get_table_names() == []
+
+    def test_pregenerated_openapi_schema(self, client, tmp_path, monkeypatch):
+        """Test the OpenAPI schema is served from a pre-generated file when configured."""
+        schema_file = tmp_path / "openapi.json"
+        schema_file.write_text(json.dumps({"openapi": "3.1.0", "info": {"title": "Pre-generated", "version": "0"}, "paths": {}}))
+        monkeypatch.setattr("app.main.OPENAPI_SCHEMA_FILE", str(schema_file))
+        monkeypatch.setattr(app, "openapi_schema", None)
+
+        response = client.get("/openapi.json")
+        assert response.status_code == 200
+        assert response.json()["info"]["title"] == "Pre-generated"
+
+    def test_missing_policy_tables_fail_clearly(self, tmp_path, monkeypatch):
+        """Test startup against a DB without the policy tables names the schema problem."""
+        engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+        monkeypatch.setattr("app.main.init_db", lambda: None)
+        monkeypatch.setattr("app.main.SessionLocal", sessionmaker(bind=engine))
+        with pytest.raises(RuntimeError, match="IAM_DB_INIT_MODE=auto"):
+            with TestClient(app):
+                pass
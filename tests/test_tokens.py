@@ -0,0 +1,91 @@
+import uuid
+import pytest
+from jose import jwt
+from app.audit import peek_token_claims
+from app.config import get_signing_key, JWT_ALGORITHM, JWT_AUDIENCE, JWT_ISSUER
+from app.security import create_access_token
+from app.tokens import decode_id, encode_id
+
+
+@pytest.fixture
+def compact_tokens(monkeypatch):
+    """Issue compact tokens."""
+    monkeypatch.setattr("app.security.JWT_COMPACT_TOKENS", True)
+
+
+class TestCompactTokens:
+    """Test the compact access token profile."""
+
+    def test_id_round_trip(self):
+        """Test ids survive base64url encoding."""
+        value = uuid.uuid4()
+        assert len(encode_id(value)) == 22
+        assert decode_id(encode_id(value)) == value
+        assert decode_id(str(value)) == value
+        with pytest.raises(ValueError):
+            decode_id("not-a-valid-id-at-all!")
+
+    def test_compact_claims(self, compact_tokens):
+        """Test compact tokens carry short ids and role codes, and no nbf."""
+        subject = uuid.uuid4()
+        token, _ = create_access_token(subject=subject, role="admin")
+        claims = jwt.get_unverified_claims(token)
+        assert claims["sub"] == encode_id(subject)
+        assert len(claims["jti"]) == 22
+        assert claims["role"] == "a"
+        assert "nbf" not in claims
+        assert claims["iss"] == JWT_ISSUER and claims["aud"] == JWT_AUDIENCE
+
+    def test_compact_token_is_smaller(self, monkeypatch):
+        """Test the compact profile shortens the token."""
+        subject = uuid.uuid4()
+        full, _ = create_access_token(subject=subject, role="user")
+        monkeypatch.setattr("app.security.JWT_COMPACT_TOKENS", True)
+        compact, _ = create_access_token(subject=subject, role="user")
+        assert len(compact) < len(full) - 40
+
+    def test_compact_token_accepted(self, client, create_test_user, test_user_data, compact_tokens):
+        """Test a compact token from /login authorizes requests."""
+        response = client.post("/login", json={"email": test_user_data["email"], "password": test_user_data["password"]})
+        token = response.json()["access_token"]
+        assert "nbf" not in jwt.get_unverified_claims(token)
+
+        response = client.get(f"/users/{create_test_user['id']}", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200
+        assert response.json()["id"] == create_test_user["id"]
+
+    def test_compact_admin_role(self, client, create_test_user, compact_tokens):
+        """Test role codes map back to role names, also when permissions are recomputed from the role."""
+        token, _ = create_access_token(subject=uuid.uuid4(), role="admin")
+        claims = jwt.get_unverified_claims(token)
+        # Simulate a token issued under another policy version.
+        claims["prm"] = [-1, 0]
+        stale = jwt.encode(claims, get_signing_key(), algorithm=JWT_ALGORITHM)
+        response = client.get(f"/users/{create_test_user['id']}", headers={"Authorization": f"Bearer {stale}"})
+        assert response.status_code == 200
+
+    def test_full_tokens_still_accepted(self, client, create_test_user, get_auth_token, compact_tokens):
+        """Test tokens issued before the switch keep working."""
+        response = client.get(f"/users/{create_test_user['id']}", headers={"Authorization": f"Bearer {get_auth_token}"})
+        assert response.status_code == 200
+
+    def test_malformed_compact_subject_rejected(self, client, create_test_user):
+        """Test a compact subject that is not base64url is rejected."""
+        token, _ = create_access_token(subject=uuid.UUID(create_test_user["id"]), role="user")
+        claims = jwt.get_unverified_claims(token)
+        claims["sub"] = "!" * 22
+        forged = jwt.encode(claims, get_signing_key(), algorithm=JWT_ALGORITHM)
+        response = client.get(f"/users/{create_test_user['id']}", headers={"Authorization": f"Bearer {forged}"})
+        assert response.status_code == 401
+
+    def test_audit_logs_both_profiles_alike(self, monkeypatch):
+        """Test the audit log shows the same ids and role for both profiles."""
+        subject = uuid.uuid4()
+        full, _ = create_access_token(subject=subject, role="admin")
+        monkeypatch.setattr("app.security.JWT_COMPACT_TOKENS", True)
+        compact, _ = create_access_token(subject=subject, role="admin")
+
+        user_id, jti, role = peek_token_claims(f"Bearer {compact}")
+        assert (user_id, role) == (str(subject), "admin")
+        assert uuid.UUID(jti) == decode_id(jwt.get_unverified_claims(compact)["jti"])
+        assert peek_token_claims(f"Bearer {full}")[::2] == (str(subject), "admin")
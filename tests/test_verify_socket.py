@@ -0,0 +1,172 @@
+import asyncio
+import json
+import os
+import socket
+import uuid
+from fastapi.testclient import TestClient
+from app.main import app
+from app import security
+from app.security import create_access_token, token_cache
+from app.verify_socket import VerifySocketServer, MAX_LINE_BYTES
+
+
+async def _exchange(path, payload: bytes, lines: int):
+    reader, writer = await asyncio.open_unix_connection(path)
+    writer.write(payload)
+    await writer.drain()
+    responses = [json.loads(await reader.readline()) for _ in range(lines)]
+    writer.close()
+    return responses
+
+
+def _serve(path, client):
+    """Start a verification server, run client(path) against it, then stop it."""
+    async def run():
+        server = VerifySocketServer(path)
+        assert await server.start()
+        try:
+            return await client(path)
+        finally:
+            await server.stop()
+    return asyncio.run(run())
+
+
+class TestVerifySocket:
+    """Test token verification over the Unix domain socket."""
+
+    def test_pipelined_requests_answered_in_order(self, tmp_path):
+        """Test several requests written at once get one answer each, in order."""
+        subject = uuid.uuid4()
+        token, _ = create_access_token(subject=subject, role="admin")
+        payload = f"{token}\nnot-a-token\nBearer {token}\n\n".encode()
+        responses = _serve(str(tmp_path / "verify.sock"), lambda path: _exchange(path, payload, 4))
+
+        assert [response["valid"] for response in responses] == [True, False, True, False]
+        assert responses[0]["sub"] == str(subject)
+        assert responses[0]["role"] == "admin"
+        assert responses[0]["permissions"] == 0b111
+        assert responses[0]["claims"]["sub"] == str(subject)
+        assert responses[1]["error"] == "Invalid token"
+        assert responses[2] == responses[0]
+        assert responses[3]["error"] == "Malformed request"
+
+    def test_compact_token(self, tmp_path, monkeypatch):
+        """Test compact tokens are answered with the user id and role name."""
+        monkeypatch.setattr("app.security.JWT_COMPACT_TOKENS", True)
+        subject = uuid.uuid4()
+        token, _ = create_access_token(subject=subject, role="user")
+        [response] = _serve(str(tmp_path / "verify.sock"), lambda path: _exchange(path, f"{token}\n".encode(), 1))
+        assert response["valid"] is True
+        assert (response["sub"], response["role"]) == (str(subject), "user")
+
+    def test_cache_read_once(self, tmp_path, monkeypatch):
+        """Test a cache hit is answered from that one read even if the entry expires right after."""
+        token, _ = create_access_token(subject=uuid.uuid4(), role="user")
+        claims = token_cache.get(token) or security.decode_access_token(token)
+
+        class ExpiringCache:
+            """Returns the claims on the first read only, as if they expired just after it."""
+            reads = 0
+
+            def get(self, key):
+                self.reads += 1
+                return claims if self.reads == 1 else None
+
+        signature_checks = []
+        monkeypatch.setattr("app.verify_socket.token_cache", ExpiringCache())
+        monkeypatch.setattr(security, "_verify_token", lambda token: signature_checks.append(token))
+        [response] = _serve(str(tmp_path / "verify.sock"), lambda path: _exchange(path, f"{token}\n".encode(), 1))
+        assert response["valid"] is True
+        assert signature_checks == []
+
+    def test_oversized_line_closes_connection(self, tmp_path):
+        """Test a line over the limit is answered as malformed and the connection is closed."""
+        async def client(path):
+            reader, writer = await asyncio.open_unix_connection(path)
+            writer.write(b"x" * (MAX_LINE_BYTES * 2) + b"\n")
+            await writer.drain()
+            response = json.loads(await reader.readline())
+            closed = await reader.read() == b""
+            writer.close()
+            return response, closed
+
+        response, closed = _serve(str(tmp_path / "verify.sock"), client)
+        assert response["error"] == "Malformed request"
+        assert closed
+
+    def test_socket_file_handling(self, tmp_path):
+        """Test {pid} expansion, not taking over a live socket, replacing a stale one and cleanup."""
+        async def run():
+            path = str(tmp_path / "verify-{pid}.sock")
+            expanded = str(tmp_path / f"verify-{os.getpid()}.sock")
+            server = VerifySocketServer(path)
+            assert await server.start()
+            assert server.path == expanded
+            assert os.stat(expanded).st_mode & 0o777 == 0o660
+            standby = VerifySocketServer(path)
+            assert not await standby.start()
+            # Stopping the standby leaves the serving process's socket alone.
+            await standby.stop()
+            assert os.path.exists(expanded)
+            await server.stop()
+            assert not os.path.exists(expanded)
+
+            # A socket file left behind by a dead process.
+            stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            stale.bind(expanded)
+            stale.close()
+            server = VerifySocketServer(path)
+            assert await server.start()
+            await server.stop()
+
+        asyncio.run(run())
+
+    def test_standby_takes_over(self, tmp_path):
+        """Test a process waiting on a shared path starts serving once the current server goes."""
+        path = str(tmp_path / "verify.sock")
+        token, _ = create_access_token(subject=uuid.uuid4(), role="user")
+
+        async def run():
+            server = VerifySocketServer(path)
+            standby = VerifySocketServer(path, standby_interval=0.01)
+            assert await server.start()
+            assert not await standby.start()
+            await server.stop()
+            for _ in range(100):
+                if standby.serving:
+                    break
+                await asyncio.sleep(0.01)
+            assert standby.serving
+            try:
+                return await _exchange(path, f"{token}\n".encode(), 1)
+            finally:
+                await standby.stop()
+
+        [response] = asyncio.run(run())
+        assert response["valid"] is True
+
+    def test_stop_closes_open_connections(self, tmp_path):
+        """Test stopping the server ends idle client connections."""
+        async def run():
+            server = VerifySocketServer(str(tmp_path / "verify.sock"))
+            await server.start()
+            reader, writer = await asyncio.open_unix_connection(server.path)
+            await asyncio.sleep(0.05)
+            await server.stop()
+            assert await reader.read() == b""
+            writer.close()
+
+        asyncio.run(run())
+
+    def test_started_by_lifespan(self, tmp_path, monkeypatch):
+        """Test the app serves the socket while it runs when IAM_VERIFY_SOCKET is set."""
+        path = str(tmp_path / "verify.sock")
+        monkeypatch.setattr("app.main.VERIFY_SOCKET_PATH", path)
+        token, _ = create_access_token(subject=uuid.uuid4(), role="user")
+        with TestClient(app):
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+                conn.connect(path)
+                conn.sendall(f"{token}\n".encode())
+                response = json.loads(conn.makefile("rb").readline())
+        assert response["valid"] is True
+        assert not os.path.exists(path)